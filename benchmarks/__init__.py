@@ -0,0 +1 @@
+"""Load and latency benchmarks run against local provider stand-ins (see README.md)."""
@@ -0,0 +1,235 @@
+"""
+Run the benchmark suite and print a JSON report.
+
+Usage:
+    uv run python -m benchmarks --documents 2000 --output results.json
+
+Providers default to the fake stand-ins of src.rag.fakes and the answer
+cache to off; anything set in the environment or .env takes precedence.
+See benchmarks/README.md.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+SCENARIOS = ["ingest", "query", "recall", "pagination", "startup"]
+
+BENCHMARK_ENV = {
+    "EMBEDDING_PROVIDER": "fake",
+    "LLM_PROVIDER": "fake",
+    "OPENAI_API_KEY": "unused",
+    "GOOGLE_API_KEY": "unused",
+    "ANSWER_CACHE_ENABLED": "false",
+    "DB_MIGRATE_ON_STARTUP": "true",
+}
+
+# Settings reported with the results, to tell apart runs of different configurations
+REPORTED_SETTINGS = [
+    "embedding_provider",
+    "llm_provider",
+    "fake_embedding_latency_ms",
+    "fake_llm_latency_ms",
+    "fake_llm_tokens_per_second",
+    "fake_llm_output_tokens",
+    "retrieval_mode",
+    "rerank_mode",
+    "hnsw_ef_search",
+    "vector_index_mode",
+    "vector_index_dimensions",
+    "vector_rerank_factor",
+    "memory_index_enabled",
+    "embedding_workers",
+    "embedding_job_batch_size",
+    "embedding_cache_enabled",
+    "answer_cache_enabled",
+    "chunk_max_tokens",
+    "chunk_overlap_tokens",
+    "context_max_tokens",
+]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def _vector_modes(value: str) -> List[Tuple[str, Optional[int]]]:
+    """Parse "full,halfvec,binary:512" into (mode, dimensions) pairs."""
+    modes = []
+    for part in filter(None, value.split(",")):
+        mode, _, dimensions = part.partition(":")
+        if mode not in ("full", "halfvec", "binary"):
+            raise argparse.ArgumentTypeError(f"unknown vector index mode: {mode}")
+        modes.append((mode, int(dimensions) if dimensions else None))
+    return modes
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma-separated scenarios to run "
+                        "(the corpus is ingested first unless only startup runs)")
+    parser.add_argument("--documents", type=int, default=1000, help="Corpus size")
+    parser.add_argument("--questions", type=int, default=200, help="Distinct generated questions")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per POST /documents/batch")
+    parser.add_argument("--ready-timeout", type=float, default=600.0,
+                        help="Seconds to wait for embedding (and for each startup server)")
+    parser.add_argument("--concurrency", type=_ints, default=[1, 4, 16], help="Query concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Queries per concurrency level")
+    parser.add_argument("--retrieval-mode", choices=["vector", "hybrid"], help="Retrieval mode of the queries")
+    parser.add_argument("--k", type=int, default=5, help="Chunks per search for recall@k")
+    parser.add_argument("--ef-search", type=_ints, default=[10, 40, 100, 200], help="ef_search levels for recall")
+    parser.add_argument("--vector-modes", type=_vector_modes,
+                        help="Vector index modes for recall, e.g. full,halfvec,binary,halfvec:512 "
+                        "(default: the configured mode)")
+    parser.add_argument("--page-size", type=int, default=100, help="Documents per page")
+    parser.add_argument("--depths", type=_ints, default=[0, 1, 5, 10, 50], help="Page depths to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="Requests per page depth")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh processes per startup measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=2000.0, help="Budget for the median app import")
+    parser.add_argument("--ready-budget-ms", type=float, default=5000.0,
+                        help="Budget for the median time from server start to ready")
+    parser.add_argument("--embedding-latency-ms", type=float, help="Fake embedding request latency")
+    parser.add_argument("--llm-latency-ms", type=float, help="Fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, help="Fake LLM generation rate")
+    parser.add_argument("--base-url", help="Benchmark a running server instead of an in-process app")
+    parser.add_argument("--keep-corpus", action="store_true", help="Do not delete the corpus afterwards")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Set benchmark defaults before src.config reads the environment."""
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    overrides = {
+        "FAKE_EMBEDDING_LATENCY_MS": args.embedding_latency_ms,
+        "FAKE_LLM_LATENCY_MS": args.llm_latency_ms,
+        "FAKE_LLM_TOKENS_PER_SECOND": args.llm_tokens_per_second,
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+
+def _git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout
+        status = subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout
+        return {"commit": commit.strip(), "dirty": bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Imported here so that configure_environment() runs before settings are loaded
+    import httpx
+
+    from benchmarks import scenarios
+    from benchmarks.corpus import generate_corpus
+    from src.config import settings
+    from src.database import close_db
+    from src.main import app
+    from src.rag.embeddings import get_embeddings
+    from src.rag.vector_index import EMBEDDING_DIMENSIONS, VectorIndex, get_vector_index
+
+    tag = f"run-{uuid.uuid4().hex[:12]}"
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.base_url or "in-process",
+            "tag": tag,
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+            "settings": {name: getattr(settings, name) for name in REPORTED_SETTINGS},
+        },
+        "results": {},
+    }
+    results = report["results"]
+    auth = (settings.basic_auth_username, settings.basic_auth_password)
+
+    async def measure(client: httpx.AsyncClient, embeddings) -> None:
+        ingested = await scenarios.ingest(client, corpus, tag, args.batch_size, args.ready_timeout)
+        if "ingest" in args.scenarios:
+            results["ingest"] = ingested
+        if "query" in args.scenarios:
+            results["query"] = await scenarios.query_latency(
+                client, corpus.questions, args.concurrency, args.requests, args.retrieval_mode
+            )
+        if "recall" in args.scenarios:
+            vector_indexes = [
+                VectorIndex(mode=mode, dimensions=dimensions or EMBEDDING_DIMENSIONS)
+                for mode, dimensions in args.vector_modes
+            ] if args.vector_modes else [get_vector_index()]
+            results["recall"] = await scenarios.recall(
+                embeddings, corpus.questions, args.k, args.ef_search, vector_indexes
+            )
+        if "pagination" in args.scenarios:
+            results["pagination"] = await scenarios.pagination(client, args.page_size, args.depths, args.repeat)
+
+    if "startup" in args.scenarios:
+        # Before anything else, so that the in-process app does not compete for the CPU
+        results["startup"] = await scenarios.startup(
+            args.startup_runs, args.import_budget_ms, args.ready_budget_ms, args.ready_timeout
+        )
+        if set(args.scenarios) == {"startup"}:
+            await close_db()
+            return report
+
+    corpus = generate_corpus(args.documents, args.questions, seed=args.seed, tag=tag)
+    try:
+        if args.base_url:
+            async with httpx.AsyncClient(base_url=args.base_url, auth=auth, timeout=None) as client:
+                await measure(client, get_embeddings())
+        else:
+            async with app.router.lifespan_context(app):
+                started = time.perf_counter()
+                while not app.state.rag.ready and time.perf_counter() - started < settings.rag_warmup_timeout:
+                    await asyncio.sleep(0.1)
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", auth=auth,
+                                             timeout=None) as client:
+                    await measure(client, app.state.rag.embeddings)
+    finally:
+        if not args.keep_corpus:
+            report["meta"]["deleted_documents"] = await scenarios.cleanup(tag)
+        await close_db()
+
+    return report
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    configure_environment(args)
+    report = asyncio.run(run(args))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    startup = report["results"].get("startup")
+    if startup is not None and not startup["within_budget"]:
+        sys.exit("Startup is over budget")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+SYLLABLES = [
+    "ka", "ki", "ku", "ke", "ko", "sa", "shi", "su", "se", "so", "ta", "chi", "tsu", "te", "to",
+    "na", "ni", "nu", "ne", "no", "ha", "hi", "fu", "he", "ho", "ma", "mi", "mu", "me", "mo",
+    "ra", "ri", "ru", "re", "ro", "ya", "yu", "yo", "wa", "n", "lan", "vec", "gra", "dex", "quer",
+]
+TAGS = ["ai", "llm", "database", "search", "python", "infra", "security", "frontend", "ops", "data"]
+
+
+@dataclass
+class Corpus:
+    """
+    Generated benchmark documents and questions.
+
+    Attributes:
+        documents: DocumentCreate payloads ({"content", "metadata"})
+        questions: Questions built from sentences of the documents
+    """
+
+    documents: List[Dict[str, Any]]
+    questions: List[str]
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _sentence(rng: random.Random, topic: List[str], vocabulary: List[str], weights: List[float]) -> str:
+    words = [
+        rng.choice(topic) if rng.random() < 0.6 else rng.choices(vocabulary, weights)[0]
+        for _ in range(rng.randint(8, 20))
+    ]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(
+    documents: int,
+    questions: int,
+    seed: int = 0,
+    sections: int = 4,
+    paragraphs: int = 3,
+    vocabulary_size: int = 5000,
+    tag: str = "benchmark",
+) -> Corpus:
+    """
+    Generate a deterministic markdown corpus and matching questions.
+
+    Args:
+        documents: Number of documents
+        questions: Number of questions
+        seed: Random seed; the same arguments always give the same corpus
+        sections: "##" sections per document
+        paragraphs: Paragraphs per section
+        vocabulary_size: Number of distinct pseudo-words
+        tag: Value of metadata["benchmark"] on every document
+
+    Returns:
+        Corpus of documents and questions
+
+    Note:
+        Each document draws most of its words from its own topic words, and
+        general words follow a Zipf distribution, so that both lexical and
+        (fake) embedding similarity single out a few relevant documents.
+        Questions reuse words of a random sentence of a random document.
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, vocabulary_size)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+    docs: List[Dict[str, Any]] = []
+    sentences: List[str] = []
+    for number in range(documents):
+        topic = rng.sample(vocabulary, 20)
+        title = " ".join(topic[:3]).title()
+        parts = [f"# {title}"]
+        for _ in range(sections):
+            parts.append(f"## {' '.join(rng.sample(topic, 2)).title()}")
+            for _ in range(paragraphs):
+                paragraph = [_sentence(rng, topic, vocabulary, weights) for _ in range(rng.randint(3, 6))]
+                sentences.append(rng.choice(paragraph))
+                parts.append(" ".join(paragraph))
+        docs.append({
+            "content": "\n\n".join(parts),
+            "metadata": {"title": title, "tags": rng.sample(TAGS, 2), "benchmark": tag, "number": number},
+        })
+
+    asked = []
+    for _ in range(questions):
+        words = rng.choice(sentences).rstrip(".").split()
+        start = rng.randrange(max(len(words) - 6, 1))
+        asked.append(f"What is {' '.join(words[start:start + 6]).lower()}?")
+
+    return Corpus(documents=docs, questions=asked)
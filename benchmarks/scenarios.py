@@ -0,0 +1,463 @@
+import asyncio
+import contextlib
+import itertools
+import os
+import re
+import socket
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import delete, func, select, text
+
+from benchmarks.corpus import Corpus
+from benchmarks.stats import summarize
+from src.config import settings
+from src.database import AsyncSessionLocal, async_engine
+from src.models import Document, DocumentChunk
+from src.rag.vector_index import VectorIndex
+from src.rag.vector_store import search_by_vector
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+async def _embedding_progress(tag: str) -> Dict[str, int]:
+    """Count the benchmark documents per embedding status."""
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(Document.embedding_status, func.count())
+            .where(Document.doc_metadata.contains({"benchmark": tag}))
+            .group_by(Document.embedding_status)
+        )
+        return {status: count for status, count in rows}
+
+
+async def _chunk_count(tag: str) -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(func.count())
+            .select_from(DocumentChunk)
+            .join(Document, Document.id == DocumentChunk.document_id)
+            .where(Document.doc_metadata.contains({"benchmark": tag}))
+        )
+
+
+async def ingest(
+    client: httpx.AsyncClient,
+    corpus: Corpus,
+    tag: str,
+    batch_size: int,
+    ready_timeout: float,
+) -> Dict[str, Any]:
+    """
+    Load the corpus through POST /documents/batch and wait until it is embedded.
+
+    Args:
+        client: Authenticated API client
+        corpus: Documents to create (tagged with metadata["benchmark"] = tag)
+        tag: Benchmark run tag
+        batch_size: Documents per request (at most 1000)
+        ready_timeout: Seconds to wait for the embedding workers
+
+    Returns:
+        Insert throughput and per-request latency, then the time until every
+        document left "pending" (embedding throughput) and the chunk count
+
+    Raises:
+        RuntimeError: If a batch request fails
+    """
+    started = time.perf_counter()
+    latencies: List[float] = []
+    failed = 0
+    for start in range(0, len(corpus.documents), batch_size):
+        request_started = time.perf_counter()
+        response = await client.post("/documents/batch", json={"documents": corpus.documents[start:start + batch_size]})
+        latencies.append(_elapsed_ms(request_started))
+        if response.status_code >= 400:
+            raise RuntimeError(f"POST /documents/batch failed with {response.status_code}: {response.text}")
+        failed += response.json()["failed"]
+    inserted = time.perf_counter() - started
+
+    progress = await _embedding_progress(tag)
+    while progress.get("pending", 0) and time.perf_counter() - started < ready_timeout:
+        await asyncio.sleep(0.5)
+        progress = await _embedding_progress(tag)
+    ready = time.perf_counter() - started
+    chunks = await _chunk_count(tag)
+
+    return {
+        "documents": len(corpus.documents),
+        "batch_size": batch_size,
+        "insert": {
+            "seconds": round(inserted, 3),
+            "docs_per_second": round(len(corpus.documents) / inserted, 1),
+            "failed": failed,
+            "request_ms": summarize(latencies),
+        },
+        "embedding": {
+            "seconds": round(ready, 3),
+            "docs_per_second": round(progress.get("ready", 0) / ready, 1),
+            "chunks": chunks,
+            "chunks_per_second": round(chunks / ready, 1),
+            "status": progress,
+            "timed_out": bool(progress.get("pending", 0)),
+        },
+    }
+
+
+async def query_latency(
+    client: httpx.AsyncClient,
+    questions: Sequence[str],
+    concurrency_levels: Sequence[int],
+    requests: int,
+    retrieval_mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Measure POST /query latency percentiles at several concurrency levels.
+
+    Args:
+        client: Authenticated API client
+        questions: Questions, cycled through
+        concurrency_levels: Numbers of concurrent clients
+        requests: Requests per concurrency level
+        retrieval_mode: "vector" or "hybrid" (default: server setting)
+
+    Returns:
+        Per level: throughput, end-to-end latency percentiles, percentiles of
+        each stage reported in QueryResponse.timings, and the error count
+    """
+    levels = []
+    for concurrency in concurrency_levels:
+        pending = iter(itertools.islice(itertools.cycle(questions), requests))
+        latencies: List[float] = []
+        stages: Dict[str, List[float]] = {}
+        errors = 0
+
+        async def worker() -> None:
+            nonlocal errors
+            for question in pending:
+                payload = {"question": question}
+                if retrieval_mode is not None:
+                    payload["retrieval_mode"] = retrieval_mode
+                started = time.perf_counter()
+                response = await client.post("/query", json=payload)
+                latencies.append(_elapsed_ms(started))
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+                for key, value in response.json().get("timings", {}).items():
+                    stages.setdefault(key, []).append(value)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        levels.append({
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "errors": errors,
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "latency_ms": summarize(latencies),
+            "stages_ms": {key: summarize(values) for key, values in stages.items()},
+        })
+
+    return {"retrieval_mode": retrieval_mode, "levels": levels}
+
+
+def _keys(results) -> set:
+    return {(result.id, result.chunk_index) for result in results}
+
+
+@contextlib.contextmanager
+def _using_vector_index(index: VectorIndex):
+    """Point settings at a vector index mode for the duration of the block."""
+    previous = settings.vector_index_mode, settings.vector_index_dimensions
+    settings.vector_index_mode, settings.vector_index_dimensions = index.mode, index.dimensions
+    try:
+        yield
+    finally:
+        settings.vector_index_mode, settings.vector_index_dimensions = previous
+
+
+async def _ensure_index(index: VectorIndex) -> bool:
+    """Build the index of a mode if it is missing; returns whether it was created."""
+    async with async_engine.begin() as conn:
+        exists = await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": index.name})
+        if not exists:
+            await conn.execute(text(index.create_sql(concurrently=False)))
+        return not exists
+
+
+async def _drop_index(index: VectorIndex) -> None:
+    async with async_engine.begin() as conn:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+async def _index_size(index: VectorIndex) -> int:
+    async with async_engine.connect() as conn:
+        return await conn.scalar(text("SELECT pg_relation_size(:name)"), {"name": index.name})
+
+
+async def recall(
+    embeddings: Embeddings,
+    questions: Sequence[str],
+    k: int,
+    ef_search_levels: Sequence[int],
+    vector_indexes: Sequence[VectorIndex],
+) -> Dict[str, Any]:
+    """
+    Compare HNSW search against exact search, per vector index mode.
+
+    Args:
+        embeddings: Embeddings client used to embed the questions
+        questions: Questions to search for
+        k: Number of chunks per search
+        ef_search_levels: hnsw.ef_search values to measure
+        vector_indexes: Vector index modes to measure (see src.rag.vector_index)
+
+    Returns:
+        Exact search latency, then per mode its index size and, per
+        ef_search, mean recall@k (share of the exact top k also returned by
+        the index) and search latency
+
+    Note:
+        Exact results come from the full-vector query with index scans
+        disabled for the transaction, which makes Postgres scan and sort
+        every chunk. Indexes missing for a mode are built before it is
+        measured (without CONCURRENTLY) and dropped afterwards.
+    """
+    vectors = await embeddings.aembed_documents(list(questions))
+    exact: List[set] = []
+    exact_latencies: List[float] = []
+    async with AsyncSessionLocal() as db:
+        with _using_vector_index(VectorIndex()):
+            for vector in vectors:
+                await db.execute(select(func.set_config("enable_indexscan", "off", True)))
+                started = time.perf_counter()
+                exact.append(_keys(await search_by_vector(db, vector, k=k)))
+                exact_latencies.append(_elapsed_ms(started))
+                await db.rollback()
+
+    modes = []
+    for index in vector_indexes:
+        created = await _ensure_index(index)
+        try:
+            levels = []
+            async with AsyncSessionLocal() as db:
+                with _using_vector_index(index):
+                    for ef_search in ef_search_levels:
+                        recalls: List[float] = []
+                        latencies: List[float] = []
+                        for vector, expected in zip(vectors, exact):
+                            started = time.perf_counter()
+                            found = _keys(await search_by_vector(db, vector, k=k, ef_search=ef_search))
+                            latencies.append(_elapsed_ms(started))
+                            await db.rollback()
+                            if expected:
+                                recalls.append(len(found & expected) / len(expected))
+                        levels.append({
+                            "ef_search": ef_search,
+                            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else None,
+                            "min_recall_at_k": round(min(recalls), 4) if recalls else None,
+                            "latency_ms": summarize(latencies),
+                        })
+            modes.append({
+                "mode": index.mode,
+                "dimensions": index.dimensions,
+                "index": index.name,
+                "index_size_bytes": await _index_size(index),
+                "rerank_factor": settings.vector_rerank_factor if index.compact else None,
+                "levels": levels,
+            })
+        finally:
+            if created:
+                await _drop_index(index)
+
+    return {"k": k, "queries": len(vectors), "exact_latency_ms": summarize(exact_latencies), "modes": modes}
+
+
+async def _timed_get(client: httpx.AsyncClient, params: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+    started = time.perf_counter()
+    response = await client.get("/documents", params=params)
+    elapsed = _elapsed_ms(started)
+    response.raise_for_status()
+    return elapsed, response.json()
+
+
+async def pagination(
+    client: httpx.AsyncClient,
+    page_size: int,
+    depths: Sequence[int],
+    repeat: int,
+) -> Dict[str, Any]:
+    """
+    Measure GET /documents page latency by depth, keyset cursor vs offset.
+
+    Args:
+        client: Authenticated API client
+        page_size: Documents per page
+        depths: Page numbers to measure (0 = first page)
+        repeat: Requests per depth and method
+
+    Returns:
+        Per reached depth: keyset (cursor) and offset (skip) latency percentiles
+
+    Note:
+        The list is walked page by page to collect the cursor of each
+        measured depth; depths beyond the last page are skipped.
+    """
+    params = {"limit": page_size, "count": "none"}
+    cursors: Dict[int, Optional[str]] = {}
+    cursor: Optional[str] = None
+    for page in range(max(depths) + 1):
+        if page in depths:
+            cursors[page] = cursor
+        _, body = await _timed_get(client, {**params, **({"cursor": cursor} if cursor else {})})
+        cursor = body.get("next_cursor")
+        if cursor is None:
+            break
+
+    results = []
+    for page in sorted(cursors):
+        keyset_params = {**params, **({"cursor": cursors[page]} if cursors[page] else {})}
+        offset_params = {**params, "skip": page * page_size}
+        keyset = [(await _timed_get(client, keyset_params))[0] for _ in range(repeat)]
+        offset = [(await _timed_get(client, offset_params))[0] for _ in range(repeat)]
+        results.append({
+            "page": page,
+            "offset": page * page_size,
+            "keyset_ms": summarize(keyset),
+            "offset_ms": summarize(offset),
+        })
+
+    return {"page_size": page_size, "depths": results}
+
+
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+async def _python(*args: str, env: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """Run a fresh interpreter in the repository root and return its stdout and stderr."""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, *args, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"python {' '.join(args)} failed:\n{stderr.decode()[-2000:]}")
+    return stdout.decode(), stderr.decode()
+
+
+def _slowest_imports(importtime: str, top: int) -> List[Dict[str, Any]]:
+    """
+    Packages imported directly by src (or the interpreter) ranked by cumulative
+    import time, from `python -X importtime` output.
+    """
+    packages: Dict[str, int] = {}
+    # importtime prints children before their parent; reversed, each import
+    # follows its parent, indented one level deeper
+    parents: List[Tuple[int, str]] = []
+    for line in reversed(importtime.splitlines()):
+        match = _IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        depth, package = len(match.group(3)), match.group(4).split(".")[0]
+        while parents and parents[-1][0] >= depth:
+            parents.pop()
+        if package != "src" and (not parents or parents[-1][1] == "src"):
+            packages[package] = packages.get(package, 0) + int(match.group(2))
+        parents.append((depth, package))
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 2)} for name, us in ranked]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _time_to_ready(timeout: float) -> float:
+    """Start `uvicorn src.main:app` and time until GET /health returns 200."""
+    port = _free_port()
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port),
+        env={**os.environ, "DB_MIGRATE_ON_STARTUP": "false"},
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                if process.returncode is not None:
+                    raise RuntimeError(f"Server exited with status {process.returncode} before it was ready")
+                with contextlib.suppress(httpx.TransportError):
+                    if (await client.get("/health")).status_code == 200:
+                        return _elapsed_ms(started)
+                await asyncio.sleep(0.01)
+        raise TimeoutError(f"Server not ready within {timeout} seconds")
+    finally:
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
+
+
+async def startup(
+    runs: int,
+    import_budget_ms: float,
+    ready_budget_ms: float,
+    ready_timeout: float,
+) -> Dict[str, Any]:
+    """
+    Measure cold start: importing the app and starting a server until it is ready.
+
+    Args:
+        runs: Fresh processes per measurement
+        import_budget_ms: Budget for the median `import src.main`
+        ready_budget_ms: Budget for the median time from process start to GET /health 200
+        ready_timeout: Seconds to wait for each server
+
+    Returns:
+        Import and time-to-ready percentiles, the slowest top-level imports,
+        the budgets and whether both medians are within them
+
+    Note:
+        Each measurement is a new interpreter, so nothing is cached in
+        memory between runs (the OS page cache and .pyc files are). The
+        servers only check the schema version (DB_MIGRATE_ON_STARTUP=false);
+        the schema is migrated once beforehand.
+    """
+    from src.database import init_db
+
+    await init_db()
+
+    code = "import time; started = time.perf_counter(); import src.main; print(time.perf_counter() - started)"
+    imports = [float((await _python("-c", code))[0]) * 1000 for _ in range(runs)]
+    _, importtime = await _python("-X", "importtime", "-c", "import src.main")
+    ready = [await _time_to_ready(ready_timeout) for _ in range(runs)]
+
+    import_ms = summarize(imports)
+    ready_ms = summarize(ready)
+    return {
+        "import_ms": import_ms,
+        "slowest_imports": _slowest_imports(importtime, top=10),
+        "time_to_ready_ms": ready_ms,
+        "budget_ms": {"import": import_budget_ms, "time_to_ready": ready_budget_ms},
+        "within_budget": import_ms["p50"] <= import_budget_ms and ready_ms["p50"] <= ready_budget_ms,
+    }
+
+
+async def cleanup(tag: str) -> int:
+    """
+    Delete the documents of a benchmark run (chunks and jobs cascade).
+
+    Returns:
+        Number of deleted documents
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(Document).where(Document.doc_metadata.contains({"benchmark": tag})))
+        await db.commit()
+        return result.rowcount
@@ -0,0 +1,29 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+def summarize(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize latencies for the JSON report.
+
+    Args:
+        latencies_ms: Measured latencies in milliseconds
+
+    Returns:
+        count, mean, min, p50, p95, p99 and max (milliseconds, rounded to 0.01)
+    """
+    if not latencies_ms:
+        return {"count": 0}
+
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(values.mean()), 2),
+        "min": round(float(values.min()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(values.max()), 2),
+    }
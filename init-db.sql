@@ -1,12 +1,18 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- Enable trigram extension (substring search for CJK text)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create documents table
 CREATE TABLE IF NOT EXISTS documents (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     content TEXT NOT NULL,
+    content_hash TEXT,
     embedding VECTOR(1536),
     metadata JSONB DEFAULT '{}',
+    embedding_status TEXT NOT NULL DEFAULT 'pending',
+    embedding_error TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -18,6 +24,78 @@ USING hnsw (embedding vector_cosine_ops);
 -- Create index for metadata search
 CREATE INDEX IF NOT EXISTS documents_metadata_idx ON documents USING gin(metadata);
 
+-- Create index for created_at range filters
+CREATE INDEX IF NOT EXISTS documents_created_at_idx ON documents (created_at, id);
+
+-- Create index for documents still waiting for (or failed) embedding
+CREATE INDEX IF NOT EXISTS documents_embedding_status_idx ON documents (embedding_status)
+WHERE embedding_status <> 'ready';
+
+-- Create document chunks table (retrieval unit, one embedding per chunk)
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    heading TEXT,
+    content TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    embedding VECTOR(1536),
+    embedding_model TEXT,
+    content_tsv TSVECTOR GENERATED ALWAYS AS (
+        to_tsvector('english', coalesce(heading, '') || ' ' || content)
+    ) STORED,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create index for chunk lookup by document
+CREATE INDEX IF NOT EXISTS document_chunks_document_id_idx ON document_chunks (document_id, chunk_index);
+
+-- Create index for chunk vector similarity search
+CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx ON document_chunks
+USING hnsw (embedding vector_cosine_ops);
+
+-- Compact alternatives (VECTOR_INDEX_MODE / VECTOR_INDEX_DIMENSIONS, see src/rag/vector_index.py)
+-- CREATE INDEX IF NOT EXISTS document_chunks_embedding_halfvec_1536_idx ON document_chunks
+-- USING hnsw (((embedding)::halfvec(1536)) halfvec_cosine_ops);
+-- CREATE INDEX IF NOT EXISTS document_chunks_embedding_binary_1536_idx ON document_chunks
+-- USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops);
+-- CREATE INDEX IF NOT EXISTS document_chunks_embedding_halfvec_512_idx ON document_chunks
+-- USING hnsw (((subvector(embedding, 1, 512))::halfvec(512)) halfvec_cosine_ops);
+
+-- Create index for chunk full-text search (hybrid retrieval)
+CREATE INDEX IF NOT EXISTS document_chunks_content_tsv_idx ON document_chunks USING gin(content_tsv);
+
+-- Create index for chunk substring search (hybrid retrieval of CJK terms)
+CREATE INDEX IF NOT EXISTS document_chunks_content_trgm_idx ON document_chunks
+USING gin (content gin_trgm_ops);
+
+-- Create embedding job queue (consumed with SELECT ... FOR UPDATE SKIP LOCKED)
+CREATE TABLE IF NOT EXISTS embedding_jobs (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    document_id UUID NOT NULL UNIQUE REFERENCES documents(id) ON DELETE CASCADE,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lease_id UUID,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create index for claiming due jobs
+CREATE INDEX IF NOT EXISTS embedding_jobs_run_after_idx ON embedding_jobs (run_after);
+
+-- Create embedding cache table (keyed by model and sha256 of normalized text)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    embedding VECTOR(1536) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, content_hash)
+);
+
+-- Create index for TTL and size-based eviction
+CREATE INDEX IF NOT EXISTS embedding_cache_created_at_idx ON embedding_cache (created_at);
+
 -- Create updated_at trigger function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -27,6 +105,50 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
--- Create trigger for updated_at
-CREATE TRIGGER update_documents_updated_at BEFORE UPDATE ON documents
+-- Create trigger for updated_at (embedding status changes do not count as updates)
+CREATE TRIGGER update_documents_updated_at BEFORE UPDATE OF content, metadata ON documents
 FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Publish the id of each document whose searchable chunks or metadata changed
+-- (consumed by the in-process vector index, see src/rag/memory_index.py)
+CREATE OR REPLACE FUNCTION notify_document_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'documents' THEN
+        PERFORM pg_notify('document_changes', NEW.id::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('document_changes', OLD.document_id::text);
+    ELSE
+        PERFORM pg_notify('document_changes', NEW.document_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER document_chunks_changed
+AFTER INSERT OR UPDATE OR DELETE ON document_chunks
+FOR EACH ROW EXECUTE FUNCTION notify_document_change();
+
+CREATE OR REPLACE TRIGGER documents_changed
+AFTER UPDATE ON documents
+FOR EACH ROW
+WHEN (OLD.metadata IS DISTINCT FROM NEW.metadata OR OLD.updated_at IS DISTINCT FROM NEW.updated_at)
+EXECUTE FUNCTION notify_document_change();
+
+-- Create API keys table (hashed keys with per-key query quotas, see src/auth.py)
+CREATE TABLE IF NOT EXISTS api_keys (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name TEXT NOT NULL,
+    key_prefix TEXT NOT NULL,
+    key_hash TEXT NOT NULL UNIQUE,
+    queries_per_minute INTEGER,
+    revoked_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Record the schema version (src/models.py SCHEMA_VERSION, checked by servers at startup)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_version (version) VALUES (2) ON CONFLICT DO NOTHING;
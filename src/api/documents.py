@@ -1,95 +1,455 @@
+import base64
+import json
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from pydantic import ValidationError
+from sqlalchemy import ColumnElement, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.dependencies import AuthUsername, DBSession
-from src.models import Document
-from src.rag.vector_store import add_document_to_vector_store
-from src.schemas import DocumentCreate, DocumentListResponse, DocumentResponse
+from src.config import settings
+from src.dependencies import AsyncDBSession, AuthUsername, Components
+from src.models import Document, DocumentChunk, EmbeddingJob
+from src.rag.embedding_queue import enqueue_embedding, enqueue_matching
+from src.rag.ingestion import document_hash, ingest_documents
+from src.rag.registry import RAGComponents
+from src.rag.vector_store import filter_conditions
+from src.schemas import (
+    DocumentBatchCreate,
+    DocumentBatchItemResult,
+    DocumentBatchResponse,
+    DocumentCreate,
+    DocumentListItem,
+    DocumentListResponse,
+    DocumentResponse,
+    DocumentUpdate,
+    EmbeddingStatusResponse,
+    MetadataFilter,
+    ReEmbedResponse,
+)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+# Columns selectable with GET /documents?fields=... (id is always returned)
+LIST_COLUMNS = {
+    "content": Document.content,
+    "metadata": Document.doc_metadata,
+    "embedding_status": Document.embedding_status,
+    "created_at": Document.created_at,
+    "updated_at": Document.updated_at,
+}
+
+# Exact document counts per filter: filter JSON -> (expires at, count)
+_count_cache: Dict[str, Tuple[float, int]] = {}
+
+
+def _notify_workers(rag: RAGComponents) -> None:
+    """Wake this process's embedding workers after jobs were committed."""
+    if rag.embedding_queue is not None:
+        rag.embedding_queue.notify()
+
 
 @router.post("", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-def create_document(
+async def create_document(
     document: DocumentCreate,
-    db: DBSession,
+    db: AsyncDBSession,
+    rag: Components,
     username: AuthUsername,
 ) -> DocumentResponse:
     """
     Create a new document with markdown content.
 
     This endpoint:
-    1. Stores the markdown content in the database
-    2. Generates vector embeddings using OpenAI
-    3. Stores embeddings for similarity search
+    1. Stores the markdown content in the database (embedding_status "pending")
+    2. Queues the document for embedding in the same transaction
+    3. Returns without waiting for the embedding workers
 
     Args:
         document: Document creation request with content and metadata
         db: Database session
-        username: Authenticated username (from Basic auth)
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
 
     Returns:
         DocumentResponse with created document details
 
     Raises:
         HTTPException: If document creation fails (500 Internal Server Error)
+
+    Note:
+        The document becomes searchable once its status is "ready"
+        (see GET /documents/{document_id}/embedding).
     """
     try:
         # Create document model instance
         db_document = Document(
             content=document.content,
+            content_hash=document_hash(document.content),
             doc_metadata=document.metadata,
+            embedding_status="pending",
         )
 
         db.add(db_document)
-        db.flush()  # Flush to get the ID before embedding
+        await db.flush()  # Flush to get the ID for the embedding job
 
-        # Generate and store embeddings
-        add_document_to_vector_store(db, db_document)
+        await enqueue_embedding(db, [db_document.id])
+        await db.commit()
+        _notify_workers(rag)
 
-        db.refresh(db_document)
+        await db.refresh(db_document)
         return DocumentResponse.model_validate(db_document)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Document creation failed: {str(e)}"
         )
 
 
-@router.get("", response_model=DocumentListResponse)
-def list_documents(
-    db: DBSession,
+def _batch_response(results: List[DocumentBatchItemResult]) -> DocumentBatchResponse:
+    succeeded = sum(1 for result in results if result.status == "created")
+    return DocumentBatchResponse(
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results,
+    )
+
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (index, line) for each non-empty line of a streamed request body."""
+    index = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, line
+                index += 1
+    if buffer.strip():
+        yield index, buffer
+
+
+@router.post("/batch", response_model=DocumentBatchResponse)
+async def create_documents_batch(
+    batch: DocumentBatchCreate,
+    db: AsyncDBSession,
+    rag: Components,
+    username: AuthUsername,
+) -> DocumentBatchResponse:
+    """
+    Create many documents in one request.
+
+    This endpoint:
+    1. Inserts documents with one multi-row INSERT per chunk of documents
+    2. Queues them for embedding in the same transactions
+    3. Returns without waiting for the embedding workers
+
+    Args:
+        batch: Documents to create
+        db: Database session
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
+
+    Returns:
+        DocumentBatchResponse with a success/failure entry per document
+    """
+    results = await ingest_documents(db, batch.documents)
+    _notify_workers(rag)
+    return _batch_response(results)
+
+
+@router.post(
+    "/batch/ndjson",
+    response_model=DocumentBatchResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": DocumentCreate.model_json_schema()}},
+        }
+    },
+)
+async def create_documents_ndjson(
+    request: Request,
+    db: AsyncDBSession,
+    rag: Components,
     username: AuthUsername,
-    skip: int = 0,
-    limit: int = 10,
+) -> DocumentBatchResponse:
+    """
+    Create documents from a streamed NDJSON upload.
+
+    Each non-empty line is one DocumentCreate object. Lines are ingested in
+    chunks of settings.ingest_stream_chunk_size as they arrive, so the
+    upload is never held in memory as a whole.
+
+    Args:
+        request: Incoming request with an application/x-ndjson body
+        db: Database session
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
+
+    Returns:
+        DocumentBatchResponse with a success/failure entry per line
+    """
+    results: List[DocumentBatchItemResult] = []
+    pending: List[DocumentCreate] = []
+    pending_indices: List[int] = []
+
+    async for index, line in _iter_ndjson_lines(request):
+        try:
+            pending.append(DocumentCreate.model_validate_json(line))
+            pending_indices.append(index)
+        except ValidationError as e:
+            results.append(DocumentBatchItemResult(index=index, status="failed", error=str(e)))
+
+        if len(pending) >= settings.ingest_stream_chunk_size:
+            results.extend(await ingest_documents(db, pending, pending_indices))
+            _notify_workers(rag)
+            pending, pending_indices = [], []
+
+    if pending:
+        results.extend(await ingest_documents(db, pending, pending_indices))
+        _notify_workers(rag)
+
+    results.sort(key=lambda result: result.index)
+    return _batch_response(results)
+
+
+def _list_filter(
+    tags: List[str],
+    metadata: Optional[str],
+    created_after: Optional[datetime],
+    created_before: Optional[datetime],
+) -> Optional[MetadataFilter]:
+    """Build a MetadataFilter from list query parameters (422 on an invalid metadata JSON)."""
+    try:
+        equals = json.loads(metadata) if metadata else None
+        metadata_filter = MetadataFilter(
+            tags=tags or None,
+            equals=equals,
+            created_after=created_after,
+            created_before=created_before,
+        )
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Invalid metadata filter: {str(e)}"
+        )
+    return metadata_filter
+
+
+def _encode_cursor(created_at: datetime, document_id: UUID) -> str:
+    """Encode the sort key of the last returned row as an opaque cursor."""
+    payload = json.dumps([created_at.isoformat(), str(document_id)])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Decode a cursor produced by _encode_cursor (400 if malformed)."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), UUID(document_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor: {str(e)}"
+        )
+
+
+def _list_fields(fields: Optional[str]) -> List[str]:
+    """Parse the comma-separated fields projection (422 on unknown fields)."""
+    if fields is None:
+        return list(LIST_COLUMNS)
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(LIST_COLUMNS) - {"id"}
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return [field for field in LIST_COLUMNS if field in requested]
+
+
+async def _count_documents(
+    db: AsyncSession,
+    conditions: List[ColumnElement[bool]],
+    metadata_filter: Optional[MetadataFilter],
+    count: Literal["exact", "estimate", "none"],
+) -> Tuple[Optional[int], bool]:
+    """
+    Count matching documents.
+
+    Args:
+        db: Database session
+        conditions: Filter conditions on documents
+        metadata_filter: Filter the conditions were built from (cache key)
+        count: "exact" runs COUNT(*); "estimate" uses pg_class.reltuples when
+            unfiltered, else an exact count cached for
+            settings.document_count_cache_seconds; "none" skips counting
+
+    Returns:
+        (total, estimated)
+    """
+    if count == "none":
+        return None, False
+
+    key = metadata_filter.model_dump_json() if metadata_filter is not None else ""
+    if count == "estimate":
+        if not conditions:
+            estimate = await db.scalar(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'documents'::regclass")
+            )
+            # reltuples is -1 until the table has been vacuumed or analyzed
+            if estimate is not None and estimate >= 0:
+                return int(estimate), True
+
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], True
+
+    total = await db.scalar(select(func.count()).select_from(Document).where(*conditions))
+
+    now = time.monotonic()
+    for stale in [k for k, (expires_at, _) in _count_cache.items() if expires_at <= now]:
+        del _count_cache[stale]
+    _count_cache[key] = (now + settings.document_count_cache_seconds, total)
+    return total, False
+
+
+@router.get("", response_model=DocumentListResponse, response_model_exclude_unset=True)
+async def list_documents(
+    db: AsyncDBSession,
+    username: AuthUsername,
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    limit: int = Query(default=10, ge=1, le=1000, description="Maximum number of documents to return"),
+    skip: int = Query(
+        default=0,
+        ge=0,
+        deprecated=True,
+        description="Offset pagination, slow for large offsets (ignored when cursor is given)",
+    ),
+    fields: Optional[str] = Query(
+        default=None,
+        description="Comma-separated fields to return: content, metadata, embedding_status, created_at, updated_at "
+        "(default: all; id is always returned)",
+    ),
+    count: Literal["exact", "estimate", "none"] = Query(
+        default="estimate",
+        description="How to compute total: exact COUNT(*), a cheap estimate, or not at all",
+    ),
+    tag: List[str] = Query(default=[], description="Only documents having all of these tags"),
+    metadata: Optional[str] = Query(
+        default=None,
+        description='JSON object of metadata keys that must have exactly these values, e.g. {"lang": "ja"}',
+    ),
+    created_after: Optional[datetime] = Query(default=None, description="Inclusive lower bound on created_at"),
+    created_before: Optional[datetime] = Query(default=None, description="Exclusive upper bound on created_at"),
 ) -> DocumentListResponse:
     """
-    List all documents with pagination.
+    List documents, newest first, with keyset pagination and optional filters.
 
     Args:
         db: Database session
-        username: Authenticated username (from Basic auth)
-        skip: Number of documents to skip (default: 0)
+        username: Authenticated username (Basic auth user or API key name)
+        cursor: Opaque cursor returned as next_cursor by the previous page
         limit: Maximum number of documents to return (default: 10)
+        skip: Deprecated offset (default: 0)
+        fields: Projection of returned fields
+        count: Total computation mode (default: estimate)
+        tag: Required tags (repeatable)
+        metadata: JSON object for metadata key equality
+        created_after: Inclusive lower bound on created_at
+        created_before: Exclusive upper bound on created_at
 
     Returns:
-        DocumentListResponse with total count and list of documents
+        DocumentListResponse with total, next_cursor and the requested
+        fields of each document
+
+    Raises:
+        HTTPException: If the cursor is malformed (400) or the metadata
+            filter or fields projection is invalid (422)
+
+    Note:
+        Pages are read with `(created_at, id) < cursor` ordered by
+        documents_created_at_idx, so every page costs the same regardless
+        of its depth. Only the projected columns are selected.
     """
-    total = db.query(Document).count()
-    documents = db.query(Document).offset(skip).limit(limit).all()
+    selected = _list_fields(fields)
+    metadata_filter = _list_filter(tag, metadata, created_after, created_before)
+    conditions = filter_conditions(metadata_filter)
+
+    stmt = (
+        select(
+            Document.id,
+            Document.created_at.label("sort_created_at"),
+            *(LIST_COLUMNS[field].label(field) for field in selected),
+        )
+        .where(*conditions)
+        .order_by(Document.created_at.desc(), Document.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Document.created_at, Document.id) < tuple_(*_decode_cursor(cursor)))
+    elif skip:
+        stmt = stmt.offset(skip)
+
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].sort_created_at, rows[-1].id)
+
+    total, estimated = await _count_documents(db, conditions, metadata_filter, count)
 
     return DocumentListResponse(
         total=total,
-        documents=[DocumentResponse.model_validate(doc) for doc in documents],
+        total_estimated=estimated,
+        next_cursor=next_cursor,
+        documents=[
+            DocumentListItem(id=row.id, **{field: row._mapping[field] for field in selected})
+            for row in rows
+        ],
     )
 
 
+@router.post("/re-embed", response_model=ReEmbedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def re_embed_documents(
+    db: AsyncDBSession,
+    rag: Components,
+    username: AuthUsername,
+    metadata_filter: Optional[MetadataFilter] = None,
+) -> ReEmbedResponse:
+    """
+    Queue documents for re-embedding, e.g. after changing EMBEDDING_MODEL.
+
+    Args:
+        db: Database session
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
+        metadata_filter: Only re-embed matching documents (default: whole corpus)
+
+    Returns:
+        ReEmbedResponse with the number of queued documents
+
+    Note:
+        Existing chunks stay searchable until each document's new chunks
+        replace them; progress is visible via GET /health/embedding-queue.
+    """
+    queued = await enqueue_matching(db, filter_conditions(metadata_filter))
+    await db.commit()
+    _notify_workers(rag)
+    return ReEmbedResponse(queued=queued)
+
+
 @router.get("/{document_id}", response_model=DocumentResponse)
-def get_document(
+async def get_document(
     document_id: UUID,
-    db: DBSession,
+    db: AsyncDBSession,
     username: AuthUsername,
 ) -> DocumentResponse:
     """
@@ -98,7 +458,7 @@ def get_document(
     Args:
         document_id: Document UUID
         db: Database session
-        username: Authenticated username (from Basic auth)
+        username: Authenticated username (Basic auth user or API key name)
 
     Returns:
         DocumentResponse with document details
@@ -106,7 +466,7 @@ def get_document(
     Raises:
         HTTPException: If document not found (404 Not Found)
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
 
     if not document:
         raise HTTPException(
@@ -117,10 +477,131 @@ def get_document(
     return DocumentResponse.model_validate(document)
 
 
+@router.patch("/{document_id}", response_model=DocumentResponse)
+async def update_document(
+    document_id: UUID,
+    document_update: DocumentUpdate,
+    db: AsyncDBSession,
+    rag: Components,
+    username: AuthUsername,
+) -> DocumentResponse:
+    """
+    Update a document's content and/or metadata, keeping its id.
+
+    This endpoint:
+    1. Replaces metadata without touching embeddings
+    2. Compares the new content's hash with the stored one and, only if it
+       changed, stores it and queues the document for embedding
+    3. Drops cached answers that used the document
+
+    Args:
+        document_id: Document UUID
+        document_update: Fields to change
+        db: Database session
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
+
+    Returns:
+        DocumentResponse with updated document details
+
+    Raises:
+        HTTPException: If document not found (404 Not Found)
+
+    Note:
+        Metadata-only edits and unchanged content cost no embedding calls.
+        When content changes, the embedding workers reuse the vectors of
+        chunks whose text is unchanged, so only edited sections are embedded.
+    """
+    document = await db.get(Document, document_id, with_for_update=True)
+
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with id {document_id} not found"
+        )
+
+    if document_update.metadata is not None:
+        document.doc_metadata = document_update.metadata
+
+    content_changed = (
+        document_update.content is not None
+        and document_hash(document_update.content) != document.content_hash
+    )
+    if content_changed:
+        document.content = document_update.content
+        document.content_hash = document_hash(document_update.content)
+        document.embedding_status = "pending"
+        document.embedding_error = None
+        await enqueue_embedding(db, [document_id])
+
+    await db.commit()
+    if content_changed:
+        _notify_workers(rag)
+    if rag.answer_cache is not None:
+        rag.answer_cache.invalidate_documents([document_id])
+
+    await db.refresh(document)
+    return DocumentResponse.model_validate(document)
+
+
+@router.get("/{document_id}/embedding", response_model=EmbeddingStatusResponse)
+async def get_embedding_status(
+    document_id: UUID,
+    db: AsyncDBSession,
+    username: AuthUsername,
+) -> EmbeddingStatusResponse:
+    """
+    Get the embedding status of a document.
+
+    Args:
+        document_id: Document UUID
+        db: Database session
+        username: Authenticated username (Basic auth user or API key name)
+
+    Returns:
+        EmbeddingStatusResponse with queue state and searchable chunk count
+
+    Raises:
+        HTTPException: If document not found (404 Not Found)
+    """
+    chunks = select(func.count()).where(DocumentChunk.document_id == Document.id).scalar_subquery()
+    row = (
+        await db.execute(
+            select(
+                Document.embedding_status,
+                Document.embedding_error,
+                EmbeddingJob.attempts,
+                EmbeddingJob.run_after,
+                EmbeddingJob.last_error,
+                (EmbeddingJob.locked_until > func.now()).label("leased"),
+                chunks.label("chunks"),
+            )
+            .outerjoin(EmbeddingJob, EmbeddingJob.document_id == Document.id)
+            .where(Document.id == document_id)
+        )
+    ).first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with id {document_id} not found"
+        )
+
+    return EmbeddingStatusResponse(
+        document_id=document_id,
+        status="processing" if row.leased else row.embedding_status,
+        attempts=row.attempts or 0,
+        next_attempt_at=row.run_after if row.attempts is not None and not row.leased else None,
+        error=row.last_error or row.embedding_error,
+        chunks=row.chunks,
+    )
+
+
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_document(
+async def delete_document(
     document_id: UUID,
-    db: DBSession,
+    db: AsyncDBSession,
+    rag: Components,
     username: AuthUsername,
 ) -> None:
     """
@@ -129,12 +610,13 @@ def delete_document(
     Args:
         document_id: Document UUID
         db: Database session
-        username: Authenticated username (from Basic auth)
+        rag: Process-wide RAG components
+        username: Authenticated username (Basic auth user or API key name)
 
     Raises:
         HTTPException: If document not found (404 Not Found)
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
 
     if not document:
         raise HTTPException(
@@ -142,5 +624,8 @@ def delete_document(
             detail=f"Document with id {document_id} not found"
         )
 
-    db.delete(document)
-    db.commit()
+    await db.delete(document)
+    await db.commit()
+
+    if rag.answer_cache is not None:
+        rag.answer_cache.invalidate_documents([document_id])
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, HTTPException, status
-from sqlalchemy import text
+from fastapi import APIRouter, HTTPException, Response, status
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy import func, select, text
 
-from src.dependencies import DBSession
-from src.schemas import HealthResponse
+from src.config import settings
+from src.dependencies import AsyncDBSession, AuthUsername, Components
+from src.metrics import render_metrics
+from src.models import Document, EmbeddingJob
+from src.schemas import EmbeddingCacheStatsResponse, EmbeddingQueueStatsResponse, HealthResponse
 
 router = APIRouter(tags=["health"])
 
 
 @router.get("/health", response_model=HealthResponse)
-def health_check(db: DBSession) -> HealthResponse:
+async def health_check(db: AsyncDBSession, rag: Components) -> HealthResponse:
     """
     Health check endpoint.
 
@@ -16,14 +20,98 @@ def health_check(db: DBSession) -> HealthResponse:
         HealthResponse with API and database status
 
     Raises:
-        HTTPException: If database connection fails (503 Service Unavailable)
+        HTTPException: If provider clients are still warming up or the
+            database connection fails (503 Service Unavailable)
     """
+    if not rag.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="RAG clients are warming up"
+        )
+
     try:
         # Try to execute a simple query to check database connection
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return HealthResponse(status="ok", database="connected")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Database connection failed: {str(e)}"
         )
+
+
+@router.get("/health/embedding-cache", response_model=EmbeddingCacheStatsResponse)
+async def embedding_cache_stats(rag: Components, username: AuthUsername) -> EmbeddingCacheStatsResponse:
+    """
+    Embedding cache hit/miss counters for this worker process.
+
+    Returns:
+        EmbeddingCacheStatsResponse with per-tier hit counts
+
+    Raises:
+        HTTPException: If the embedding cache is disabled (404 Not Found)
+    """
+    if rag.embedding_cache is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Embedding cache is disabled"
+        )
+
+    return EmbeddingCacheStatsResponse(**rag.embedding_cache.stats())
+
+
+@router.get("/health/embedding-queue", response_model=EmbeddingQueueStatsResponse)
+async def embedding_queue_stats(db: AsyncDBSession, username: AuthUsername) -> EmbeddingQueueStatsResponse:
+    """
+    Embedding job queue depth, shared by all worker processes.
+
+    Returns:
+        EmbeddingQueueStatsResponse with queued, processing and failed counts
+    """
+    leased = EmbeddingJob.locked_until > func.now()
+    row = (
+        await db.execute(
+            select(
+                func.count().filter(~leased | EmbeddingJob.locked_until.is_(None)).label("queued"),
+                func.count().filter(leased).label("processing"),
+                func.count().filter(EmbeddingJob.attempts > 0, EmbeddingJob.lease_id.is_(None)).label("retrying"),
+            )
+        )
+    ).one()
+    failed = await db.scalar(
+        select(func.count()).select_from(Document).where(Document.embedding_status == "failed")
+    )
+
+    return EmbeddingQueueStatsResponse(
+        queued=row.queued,
+        processing=row.processing,
+        retrying=row.retrying,
+        failed_documents=failed,
+    )
+
+
+@router.get("/metrics", response_class=Response, responses={200: {"content": {CONTENT_TYPE_LATEST: {}}}})
+async def metrics(username: AuthUsername) -> Response:
+    """
+    Prometheus metrics of the server.
+
+    With several worker processes (python -m src.server) the samples of
+    all workers on this host are merged, so any worker can serve a scrape.
+
+    Exposes stage latency histograms, HTTP latency and in-flight requests,
+    LLM and context token counts, answer/embedding cache lookups, database
+    pool checkout wait and embedding job outcomes.
+
+    Returns:
+        Response in the Prometheus text exposition format
+
+    Raises:
+        HTTPException: If metrics are disabled (404 Not Found)
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics are disabled"
+        )
+
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
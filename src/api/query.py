@@ -1,40 +1,232 @@
-from fastapi import APIRouter, HTTPException, status
+import json
+import logging
+import math
+from typing import Any, AsyncIterator, Dict, Union
 
-from src.dependencies import AuthUsername
-from src.rag.chain import query_rag
-from src.schemas import QueryRequest, QueryResponse
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+
+from src.auth import query_quota
+from src.config import settings
+from src.dependencies import AsyncDBSession, AuthPrincipal, Components
+from src.metrics import server_timing
+from src.rag.chain import query_rag, query_rag_batch, stream_rag
+from src.rag.limits import ProviderOverloaded
+from src.schemas import BatchQueryItemResult, BatchQueryRequest, QueryRequest, QueryResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/query", tags=["query"])
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _overloaded(e: ProviderOverloaded) -> HTTPException:
+    """Turn a shed provider call into a 429/503 response with Retry-After."""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=f"Query processing failed: {str(e)}",
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+def _ndjson_result(index: int, outcome: Union[QueryResponse, Exception]) -> str:
+    """Format one batch query outcome as an NDJSON line."""
+    if isinstance(outcome, Exception):
+        result = BatchQueryItemResult(index=index, status="failed", error=f"Query processing failed: {str(outcome)}")
+    else:
+        result = BatchQueryItemResult(index=index, status="answered", response=outcome)
+    return result.model_dump_json() + "\n"
+
+
 @router.post("", response_model=QueryResponse)
-def query_documents(
+async def query_documents(
     request: QueryRequest,
-    username: AuthUsername,
+    response: Response,
+    db: AsyncDBSession,
+    rag: Components,
+    principal: AuthPrincipal,
 ) -> QueryResponse:
     """
     Query documents using RAG (Retrieval-Augmented Generation).
 
     This endpoint:
-    1. Searches for similar documents using vector similarity
+    1. Searches for relevant chunks (vector or hybrid full-text + vector search)
     2. Uses retrieved documents as context
     3. Generates an answer using Gemini 2.5 Pro
 
     Args:
         request: Query request with user's question
-        username: Authenticated username (from Basic auth)
+        response: Outgoing response (receives the Server-Timing header if enabled)
+        db: Database session
+        rag: Process-wide RAG components
+        principal: Authenticated client (its query quota is enforced)
 
     Returns:
-        QueryResponse with generated answer and source documents
+        QueryResponse with generated answer, source documents and stage timings
 
     Raises:
-        HTTPException: If query processing fails (500 Internal Server Error)
+        HTTPException: If the API key's query quota is used up (429 Too Many
+            Requests), a provider is overloaded (429 Too Many Requests or
+            503 Service Unavailable, with Retry-After) or query processing
+            fails (500 Internal Server Error)
     """
+    query_quota.check(principal)
     try:
-        response = query_rag(request.question)
-        return response
+        result = await query_rag(
+            db,
+            rag,
+            request.question,
+            ef_search=request.ef_search,
+            mode=request.retrieval_mode,
+            metadata_filter=request.filter,
+        )
+    except ProviderOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Query processing failed: {str(e)}"
         )
+
+    if settings.server_timing_enabled:
+        response.headers["Server-Timing"] = server_timing(result.timings)
+    return result
+
+
+@router.post(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def query_documents_stream(
+    request: QueryRequest,
+    db: AsyncDBSession,
+    rag: Components,
+    principal: AuthPrincipal,
+) -> StreamingResponse:
+    """
+    Query documents using RAG and stream the answer via Server-Sent Events.
+
+    Events:
+    1. `sources`: retrieved source documents, sent as soon as retrieval is done
+    2. `token`: answer text, one event per generated piece
+    3. `done`: timings and token usage
+    4. `error`: sent instead of `done` if generation fails mid-stream
+       (with `retry_after` seconds if a provider is overloaded)
+
+    Args:
+        request: Query request with user's question
+        db: Database session
+        rag: Process-wide RAG components
+        principal: Authenticated client (its query quota is enforced)
+
+    Returns:
+        StreamingResponse with media type text/event-stream
+
+    Raises:
+        HTTPException: If the API key's query quota is used up (429 Too Many
+            Requests, with Retry-After)
+    """
+    query_quota.check(principal)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in stream_rag(
+                db,
+                rag,
+                request.question,
+                ef_search=request.ef_search,
+                mode=request.retrieval_mode,
+                metadata_filter=request.filter,
+            ):
+                yield _sse(event, data)
+        except ProviderOverloaded as e:
+            logger.warning(f"Streaming query shed: {e}")
+            yield _sse("error", {"detail": f"Query processing failed: {str(e)}", "retry_after": math.ceil(e.retry_after)})
+        except Exception as e:
+            logger.error(f"Streaming query failed: {e}")
+            yield _sse("error", {"detail": f"Query processing failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post(
+    "/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {"schema": BatchQueryItemResult.model_json_schema()}}}},
+)
+async def query_documents_batch(
+    request: BatchQueryRequest,
+    db: AsyncDBSession,
+    rag: Components,
+    principal: AuthPrincipal,
+) -> StreamingResponse:
+    """
+    Answer many questions and stream the results as NDJSON.
+
+    This endpoint:
+    1. Embeds all questions in one embeddings API call
+    2. Retrieves chunks for all questions in one SQL statement (vector mode)
+    3. Generates answers with at most `concurrency` concurrent LLM calls
+    4. Writes one BatchQueryItemResult line per question as soon as it completes
+
+    Args:
+        request: Questions and retrieval options shared by all of them
+        db: Database session
+        rag: Process-wide RAG components
+        principal: Authenticated client (its query quota is enforced)
+
+    Returns:
+        StreamingResponse with media type application/x-ndjson; lines are in
+        completion order, use `index` to match them to questions
+
+    Raises:
+        HTTPException: If the API key's query quota does not cover the
+            questions (429 Too Many Requests), the embeddings provider is
+            overloaded (429/503 with Retry-After) or embedding or retrieval
+            fails (500 Internal Server Error)
+    """
+    query_quota.check(principal, cost=len(request.questions))
+    results = query_rag_batch(
+        db,
+        rag,
+        request.questions,
+        ef_search=request.ef_search,
+        mode=request.retrieval_mode,
+        metadata_filter=request.filter,
+        concurrency=request.concurrency,
+    )
+    try:
+        # Embedding and retrieval run before the first result is produced
+        first = await anext(results)
+    except ProviderOverloaded as e:
+        await results.aclose()
+        raise _overloaded(e)
+    except Exception as e:
+        await results.aclose()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Query processing failed: {str(e)}"
+        )
+
+    async def lines() -> AsyncIterator[str]:
+        try:
+            yield _ndjson_result(*first)
+            async for index, outcome in results:
+                yield _ndjson_result(index, outcome)
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,44 +1,374 @@
+"""
+Authentication backends and per-key query quotas.
+
+settings.auth_backend selects how requests authenticate:
+- basic: the single settings.basic_auth_* user (HTTP Basic)
+- api_key: per-client API keys sent as "Authorization: Bearer <key>",
+  stored hashed in the api_keys table
+- any: either of them
+
+Verified API keys are held in a per-worker TTL cache, so a key costs one
+database lookup per settings.api_key_cache_ttl_seconds rather than one
+per request.
+
+Key management:
+    uv run python -m src.auth create --name client-a --queries-per-minute 60
+    uv run python -m src.auth list
+    uv run python -m src.auth revoke <key prefix>
+"""
+import argparse
+import asyncio
+import hashlib
+import math
 import secrets
-from typing import Annotated
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Annotated, Dict, Optional, Protocol, Sequence, Tuple
+from uuid import UUID
 
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from sqlalchemy import func, select, update
 
 from src.config import settings
+from src.database import AsyncSessionLocal, close_db
+from src.metrics import API_KEY_CACHE_LOOKUPS, QUOTA_REJECTED
+from src.models import ApiKey
+from src.rag.limits import TokenBucket
+from src.rag.singleflight import SingleFlight
+
+API_KEY_PREFIX = "rag_"
+# Characters of a key stored in clear (API_KEY_PREFIX + 8), to recognize it in listings
+KEY_PREFIX_LENGTH = 12
+
+basic_security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Authenticated client.
+
+    Attributes:
+        name: Username, or the name of the API key
+        key_id: API key id (None for the Basic auth user)
+        queries_per_minute: Query quota (None = unlimited)
+    """
+
+    name: str
+    key_id: Optional[UUID] = None
+    queries_per_minute: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Credentials:
+    """Credentials presented by a request (either may be missing)."""
+
+    basic: Optional[HTTPBasicCredentials]
+    api_key: Optional[str]
+
+
+class AuthBackend(Protocol):
+    # Schemes accepted, announced in WWW-Authenticate when authentication fails
+    challenges: Tuple[str, ...]
+
+    async def authenticate(self, credentials: Credentials) -> Optional[Principal]:
+        """Return the authenticated client, or None if the credentials are missing or invalid."""
+        ...
+
+
+def hash_api_key(key: str) -> str:
+    """
+    Hash an API key for storage and lookup.
+
+    Note:
+        Keys are 256-bit random tokens, so a single sha256 is enough (no
+        slow password hash) and lets the hash be looked up by index.
+    """
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+class BasicAuthBackend:
+    """The single settings.basic_auth_* user, compared in constant time."""
+
+    challenges = ("Basic",)
+
+    def __init__(self, username: str, password: str):
+        self._username = username.encode("utf8")
+        self._password = password.encode("utf8")
+        self._principal = Principal(name=username)
+
+    async def authenticate(self, credentials: Credentials) -> Optional[Principal]:
+        if credentials.basic is None:
+            return None
+        # Use secrets.compare_digest to prevent timing attacks
+        is_username_correct = secrets.compare_digest(credentials.basic.username.encode("utf8"), self._username)
+        is_password_correct = secrets.compare_digest(credentials.basic.password.encode("utf8"), self._password)
+        return self._principal if is_username_correct and is_password_correct else None
+
+
+class ApiKeyBackend:
+    """
+    API keys from the api_keys table, verified through an in-process TTL cache.
+
+    Valid keys are cached for `ttl_seconds` and unknown or revoked ones for
+    `negative_ttl_seconds`; the least recently used entries are evicted
+    beyond `max_entries`. Concurrent misses for the same key share one
+    database lookup.
+    """
+
+    challenges = ("Bearer",)
+
+    def __init__(self, ttl_seconds: float, negative_ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+
+        self._cache: OrderedDict[str, Tuple[Optional[Principal], float]] = OrderedDict()
+        self._lookups: SingleFlight[Optional[Principal]] = SingleFlight("api_key")
+
+    async def authenticate(self, credentials: Credentials) -> Optional[Principal]:
+        if credentials.api_key is None:
+            return None
+        key_hash = hash_api_key(credentials.api_key)
+
+        cached = self._cache.get(key_hash)
+        if cached is not None and cached[1] > time.monotonic():
+            self._cache.move_to_end(key_hash)
+            API_KEY_CACHE_LOOKUPS.labels("hit").inc()
+            return cached[0]
+
+        API_KEY_CACHE_LOOKUPS.labels("miss").inc()
+        principal = await self._lookups.do(key_hash, lambda: self._load(key_hash))
+        ttl = self.ttl_seconds if principal is not None else self.negative_ttl_seconds
+        self._cache[key_hash] = (principal, time.monotonic() + ttl)
+        self._cache.move_to_end(key_hash)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return principal
+
+    @staticmethod
+    async def _load(key_hash: str) -> Optional[Principal]:
+        async with AsyncSessionLocal() as db:
+            row = (
+                await db.execute(
+                    select(ApiKey.id, ApiKey.name, ApiKey.queries_per_minute).where(
+                        ApiKey.key_hash == key_hash, ApiKey.revoked_at.is_(None)
+                    )
+                )
+            ).first()
+        if row is None:
+            return None
+        return Principal(name=row.name, key_id=row.id, queries_per_minute=row.queries_per_minute)
+
+
+class AnyAuthBackend:
+    """Accepts the credentials of any of `backends`, tried in order."""
+
+    def __init__(self, backends: Sequence[AuthBackend]):
+        self.backends = list(backends)
+        self.challenges = tuple(challenge for backend in self.backends for challenge in backend.challenges)
+
+    async def authenticate(self, credentials: Credentials) -> Optional[Principal]:
+        for backend in self.backends:
+            principal = await backend.authenticate(credentials)
+            if principal is not None:
+                return principal
+        return None
+
+
+class QueryQuota:
+    """
+    Per-key queries-per-minute limits.
+
+    Each key gets a token bucket refilling at its quota, with a minute's
+    worth of burst. Buckets live in each worker process, so the quota is
+    split evenly across the `processes` serving the API (requests are
+    spread across them), and no request needs a database round-trip.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = max(processes, 1)
+        self._buckets: Dict[UUID, Tuple[int, TokenBucket]] = {}
+
+    def check(self, principal: Principal, cost: int = 1) -> None:
+        """
+        Count `cost` queries against the principal's quota.
+
+        Raises:
+            HTTPException: 429 Too Many Requests, with Retry-After if the
+                quota is used up, without it if `cost` exceeds what the
+                quota can ever admit at once (e.g. a batch that is too large)
+        """
+        limit = principal.queries_per_minute
+        if limit is None or principal.key_id is None:
+            return
 
-security = HTTPBasic()
+        entry = self._buckets.get(principal.key_id)
+        if entry is None or entry[0] != limit:
+            share = limit / self.processes
+            entry = (limit, TokenBucket(rate=share / 60, burst=max(share, 1.0)))
+            self._buckets[principal.key_id] = entry
+
+        bucket = entry[1]
+        if cost > bucket.burst:
+            QUOTA_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Query quota of {limit} per minute admits at most {math.floor(bucket.burst)} "
+                f"questions at once, got {cost}",
+            )
+
+        wait = bucket.take(cost)
+        if wait > 0:
+            QUOTA_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Query quota of {limit} per minute exceeded",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+
+def get_auth_backend() -> AuthBackend:
+    """Build the authentication backend configured in settings."""
+    basic = BasicAuthBackend(settings.basic_auth_username, settings.basic_auth_password)
+    if settings.auth_backend == "basic":
+        return basic
+
+    api_key = ApiKeyBackend(
+        ttl_seconds=settings.api_key_cache_ttl_seconds,
+        negative_ttl_seconds=settings.api_key_cache_negative_ttl_seconds,
+        max_entries=settings.api_key_cache_max_entries,
+    )
+    if settings.auth_backend == "api_key":
+        return api_key
+    return AnyAuthBackend([basic, api_key])
 
 
-def verify_credentials(
-    credentials: Annotated[HTTPBasicCredentials, Depends(security)]
-) -> str:
+auth_backend = get_auth_backend()
+query_quota = QueryQuota(processes=settings.app_instances * settings.app_workers)
+
+
+def rejection(backend: AuthBackend, credentials: Credentials) -> Tuple[str, str]:
+    """
+    Describe why credentials were rejected, in terms of the scheme the client used.
+
+    Returns:
+        WWW-Authenticate challenge and error detail: the presented scheme
+        if the backend accepts it, otherwise every scheme it accepts
     """
-    Verify HTTP Basic authentication credentials.
+    if credentials.api_key is not None and "Bearer" in backend.challenges:
+        return "Bearer", "Invalid API key"
+    if credentials.basic is not None and "Basic" in backend.challenges:
+        return "Basic", "Incorrect username or password"
+    return ", ".join(backend.challenges), "Not authenticated"
+
+
+async def authenticate(
+    basic: Annotated[Optional[HTTPBasicCredentials], Depends(basic_security)],
+    bearer: Annotated[Optional[HTTPAuthorizationCredentials], Depends(bearer_security)],
+) -> Principal:
+    """
+    Authenticate a request with the configured backend.
 
     Args:
-        credentials: HTTP Basic credentials from request
+        basic: HTTP Basic credentials from request, if any
+        bearer: Bearer token (API key) from request, if any
 
     Returns:
-        Username if authentication is successful
+        Authenticated client
 
     Raises:
-        HTTPException: If credentials are invalid (401 Unauthorized)
+        HTTPException: If credentials are missing or invalid (401 Unauthorized)
     """
-    # Use secrets.compare_digest to prevent timing attacks
-    is_username_correct = secrets.compare_digest(
-        credentials.username.encode("utf8"),
-        settings.basic_auth_username.encode("utf8")
-    )
-    is_password_correct = secrets.compare_digest(
-        credentials.password.encode("utf8"),
-        settings.basic_auth_password.encode("utf8")
-    )
-
-    if not (is_username_correct and is_password_correct):
+    credentials = Credentials(basic=basic, api_key=bearer.credentials if bearer is not None else None)
+    principal = await auth_backend.authenticate(credentials)
+    if principal is None:
+        challenge, detail = rejection(auth_backend, credentials)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Basic"},
+            detail=detail,
+            headers={"WWW-Authenticate": challenge},
         )
+    return principal
+
+
+def verify_credentials(principal: Annotated[Principal, Depends(authenticate)]) -> str:
+    """
+    Verify the request's credentials.
+
+    Args:
+        principal: Authenticated client
+
+    Returns:
+        Username (or API key name) if authentication is successful
+    """
+    return principal.name
+
+
+async def _create(name: str, queries_per_minute: Optional[int]) -> None:
+    key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+    async with AsyncSessionLocal() as db:
+        db.add(
+            ApiKey(
+                name=name,
+                key_prefix=key[:KEY_PREFIX_LENGTH],
+                key_hash=hash_api_key(key),
+                queries_per_minute=queries_per_minute,
+            )
+        )
+        await db.commit()
+    print(f"Created API key for {name} (shown only once):\n{key}")
+
+
+async def _list() -> None:
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(select(ApiKey).order_by(ApiKey.created_at))
+        for key in rows.scalars():
+            quota = key.queries_per_minute if key.queries_per_minute is not None else "unlimited"
+            state = f"revoked {key.revoked_at.isoformat()}" if key.revoked_at else "active"
+            print(f"{key.key_prefix}...  {key.name}  {quota}/min  {state}")
+
+
+async def _revoke(key_prefix: str) -> None:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(ApiKey)
+            .where(ApiKey.key_prefix == key_prefix, ApiKey.revoked_at.is_(None))
+            .values(revoked_at=func.now())
+        )
+        await db.commit()
+    print(
+        f"Revoked {result.rowcount} key(s); servers stop accepting them within "
+        f"{settings.api_key_cache_ttl_seconds:g}s (API_KEY_CACHE_TTL_SECONDS)"
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    try:
+        if args.command == "create":
+            await _create(args.name, args.queries_per_minute)
+        elif args.command == "list":
+            await _list()
+        else:
+            await _revoke(args.key_prefix)
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.auth", description="Manage API keys.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Create a key and print it")
+    create.add_argument("--name", required=True, help="Client name")
+    create.add_argument("--queries-per-minute", type=int, help="Query quota (default: unlimited)")
+    commands.add_parser("list", help="List keys")
+    revoke = commands.add_parser("revoke", help="Revoke a key")
+    revoke.add_argument("key_prefix", help=f"First {KEY_PREFIX_LENGTH} characters of the key, as listed")
+    asyncio.run(_run(parser.parse_args()))
+
 
-    return credentials.username
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,113 @@
-from sqlalchemy import create_engine
+import logging
+import time
+import uuid
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.config import settings
+from src.metrics import DB_POOL_CHECKED_OUT, DB_POOL_WAIT_SECONDS
+from src.rag.vector_index import get_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+# Connections a process holds outside the async pool: the sync engine's
+# pool, plus the in-process vector index's LISTEN connection if enabled
+SYNC_POOL_SIZE = 1
 
-# Create SQLAlchemy engine
+
+def pool_limits() -> Tuple[int, int]:
+    """
+    Size the async connection pool of one server process.
+
+    Returns:
+        (pool_size, max_overflow): settings.db_pool_size and
+        settings.db_max_overflow, reduced so that every process of every
+        instance fits in the Postgres connection budget
+
+    Raises:
+        ValueError: If the budget leaves no connection for a process
+
+    Note:
+        The budget is db_max_connections (Postgres max_connections) minus
+        db_reserved_connections (superuser, migrations and other clients),
+        shared by app_instances x app_workers processes.
+    """
+    processes = max(settings.app_instances, 1) * max(settings.app_workers, 1)
+    per_process = (settings.db_max_connections - settings.db_reserved_connections) // processes
+    available = per_process - SYNC_POOL_SIZE - (1 if settings.memory_index_enabled else 0)
+    if available < 1:
+        raise ValueError(
+            f"Postgres connection budget too small: {per_process} connections for each of {processes} "
+            "processes (raise DB_MAX_CONNECTIONS or lower APP_WORKERS / APP_INSTANCES)"
+        )
+    pool_size = min(settings.db_pool_size, available)
+    return pool_size, min(settings.db_max_overflow, available - pool_size)
+
+
+def _asyncpg_connect_args() -> Dict[str, Any]:
+    """asyncpg options; PgBouncer (transaction pooling) cannot use named server-side prepared statements."""
+    if not settings.db_pgbouncer:
+        return {}
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
+POOL_SIZE, MAX_OVERFLOW = pool_limits()
+
+# Create SQLAlchemy engine (only used by the sync get_db dependency)
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=SYNC_POOL_SIZE,
+    max_overflow=0,
+)
+
+# Create async SQLAlchemy engine (asyncpg) used by the request path
+async_engine = create_async_engine(
+    settings.async_database_url,
+    poolclass=InstrumentedAsyncPool,
+    pool_pre_ping=True,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=settings.db_pool_timeout,
+    connect_args=_asyncpg_connect_args(),
 )
+DB_POOL_CHECKED_OUT.set_function(lambda: async_engine.pool.checkedout())
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Create AsyncSessionLocal class
+# expire_on_commit=False keeps attributes loaded after commit, since
+# implicit lazy loads are not possible on an AsyncSession
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -35,12 +128,112 @@ def get_db():
         db.close()
 
 
-def init_db():
+async def get_async_db():
+    """
+    Dependency function that yields async database sessions.
+
+    Usage:
+        @app.get("/items/")
+        async def read_items(db: AsyncSession = Depends(get_async_db)):
+            ...
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _create_missing_indexes(conn) -> None:
+    """Create the model indexes of tables that create_all() found already existing."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def init_db():
+    """
+    Create or update the database schema (the migration command, see src.migrate).
+
+    Creates the extensions, every table defined in models that is missing,
+    adds the columns and indexes that later versions added to existing
+    tables (queueing documents from before the embedding queue for
+    chunking and embedding) and the configured compact vector index, if
+    any, installs the updated_at trigger and the
+    triggers that publish document changes, then
+    records SCHEMA_VERSION. Safe to run repeatedly.
+
+    Note:
+        Everything runs in one transaction, so SCHEMA_VERSION is recorded
+        only if every step succeeded. Indexes are built without
+        CONCURRENTLY; on a populated database build a compact vector index
+        first with python -m src.rag.vector_index, which this then skips.
+    """
+    from src.models import (  # Import to register models
+        DOCUMENT_CHANGE_TRIGGERS,
+        DOCUMENT_COLUMN_UPGRADES,
+        DOCUMENT_EMBEDDING_BACKFILL,
+        DOCUMENT_UPDATED_AT_TRIGGER,
+        SCHEMA_VERSION,
+        SchemaVersion,
+    )
+
+    async with async_engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        # An existing documents table without embedding_status predates the embedding queue
+        needs_embedding = await conn.scalar(
+            text(
+                "SELECT to_regclass('documents') IS NOT NULL AND NOT EXISTS ("
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = 'documents' "
+                "AND column_name = 'embedding_status')"
+            )
+        )
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in DOCUMENT_COLUMN_UPGRADES:
+            await conn.execute(text(statement))
+        if needs_embedding:
+            result = await conn.execute(text(DOCUMENT_EMBEDDING_BACKFILL))
+            logger.info(f"Queued {result.rowcount} existing documents for chunking and embedding")
+        await conn.run_sync(_create_missing_indexes)
+        vector_index = get_vector_index()
+        if vector_index.compact:
+            await conn.execute(text(vector_index.create_sql(concurrently=False)))
+        for statement in DOCUMENT_UPDATED_AT_TRIGGER + DOCUMENT_CHANGE_TRIGGERS:
+            await conn.execute(text(statement))
+        await conn.execute(pg_insert(SchemaVersion).values(version=SCHEMA_VERSION).on_conflict_do_nothing())
+
+
+async def check_schema():
+    """
+    Verify that the database has been migrated for this version of the code.
+
+    One indexed lookup, run at startup instead of DDL.
+
+    Raises:
+        RuntimeError: If the schema is missing or older than SCHEMA_VERSION
+    """
+    from src.models import SCHEMA_VERSION, SchemaVersion
+
+    try:
+        async with AsyncSessionLocal() as db:
+            version = await db.scalar(select(func.max(SchemaVersion.version)))
+    except ProgrammingError:
+        # schema_version does not exist yet
+        version = None
+
+    if version is None or version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version is {version}, this server needs {SCHEMA_VERSION}: "
+            "run `python -m src.migrate`"
+        )
+    if version > SCHEMA_VERSION:
+        logger.warning(f"Database schema version {version} is newer than this server's ({SCHEMA_VERSION})")
+
+
+async def close_db():
     """
-    Initialize database tables.
+    Dispose of database connection pools.
 
-    This function creates all tables defined in models.
-    Call this during application startup.
+    Call this during application shutdown.
     """
-    from src.models import Document  # Import to register models
-    Base.metadata.create_all(bind=engine)
+    await async_engine.dispose()
+    engine.dispose()
@@ -1,11 +1,16 @@
 from typing import Annotated
 
 from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.auth import verify_credentials
-from src.database import get_db
+from src.auth import Principal, authenticate, verify_credentials
+from src.database import get_async_db, get_db
+from src.rag.registry import RAGComponents, get_rag_components
 
 # Type aliases for dependency injection
 DBSession = Annotated[Session, Depends(get_db)]
+AsyncDBSession = Annotated[AsyncSession, Depends(get_async_db)]
 AuthUsername = Annotated[str, Depends(verify_credentials)]
+AuthPrincipal = Annotated[Principal, Depends(authenticate)]
+Components = Annotated[RAGComponents, Depends(get_rag_components)]
@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -6,7 +8,9 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from src.api import documents, health, query
 from src.config import settings
-from src.database import init_db
+from src.database import check_schema, close_db, init_db
+from src.metrics import MetricsMiddleware, mark_process_dead
+from src.rag.registry import build_components, close_components, warm_up
 
 # Configure logging
 logging.basicConfig(
@@ -22,22 +26,43 @@ async def lifespan(app: FastAPI):
     Application lifespan manager.
 
     Handles startup and shutdown events:
-    - Startup: Initialize database tables
-    - Shutdown: Cleanup resources (if needed)
+    - Startup: Check the database schema version (DDL runs in
+      `python -m src.migrate`, or here with DB_MIGRATE_ON_STARTUP), build
+      the RAG clients once,
+      warm up provider connections in the background and start the
+      embedding workers and the in-process vector index
+    - Shutdown: Stop the embedding workers and the in-process vector
+      index, close provider HTTP pools and database connection pools, and
+      drop this worker's live gauges from the shared metrics
     """
     # Startup
     logger.info("Starting RAG API application...")
     try:
-        init_db()
-        logger.info("Database initialized successfully")
+        if settings.db_migrate_on_startup:
+            await init_db()
+        await check_schema()
+        logger.info("Database schema verified")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
 
+    # /health reports 503 until warm-up has finished
+    app.state.rag = build_components()
+    warmup_task = asyncio.create_task(warm_up(app.state.rag))
+    if app.state.rag.embedding_queue is not None:
+        app.state.rag.embedding_queue.start()
+    if app.state.rag.memory_index is not None:
+        # Vector retrieval uses Postgres until the index has loaded
+        app.state.rag.memory_index.start()
+
     yield
 
     # Shutdown
     logger.info("Shutting down RAG API application...")
+    warmup_task.cancel()
+    await close_components(app.state.rag)
+    await close_db()
+    mark_process_dead(os.getpid())
 
 
 # Create FastAPI application
@@ -57,6 +82,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(health.router)
 app.include_router(query.router)
@@ -76,6 +104,7 @@ def root():
 
 
 if __name__ == "__main__":
+    # Development server with auto-reload; run `python -m src.server` in production
     import uvicorn
 
     uvicorn.run(
@@ -0,0 +1,211 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Set by python -m src.server when several workers share the metrics (see render_metrics)
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Latency buckets from a cache hit (~1ms) to a long generation (~1min)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of RAG pipeline stages",
+    ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_seconds",
+    "HTTP request latency until the response is complete",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "rag_http_requests_in_flight", "HTTP requests currently being handled", multiprocess_mode="livesum"
+)
+
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens reported by the provider", ["kind"])
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Tokens of retrieved context sent to the LLM per question",
+    buckets=(100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+
+ANSWER_CACHE_LOOKUPS = Counter("rag_answer_cache_lookups_total", "Semantic answer cache lookups", ["result"])
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "rag_embedding_cache_lookups_total",
+    "Embedding cache lookups per text (result: memory_hit, db_hit or miss)",
+    ["result"],
+)
+
+DB_POOL_WAIT_SECONDS = Histogram(
+    "rag_db_pool_wait_seconds",
+    "Time spent waiting to check out a connection from the async pool",
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "rag_db_pool_checked_out", "Connections of the async pools currently checked out", multiprocess_mode="livesum"
+)
+
+EMBEDDING_JOBS = Counter(
+    "rag_embedding_jobs_total",
+    "Embedding jobs finished by the workers (result: ready, retry or failed)",
+    ["result"],
+)
+
+PROVIDER_SHED = Counter(
+    "rag_provider_shed_total",
+    "Provider calls shed by the limiter (reason: circuit_open, rate_limited, queue_full, deadline, retries_exhausted)",
+    ["provider", "reason"],
+)
+PROVIDER_RETRIES = Counter("rag_provider_retries_total", "Provider calls retried after a 429, 5xx or timeout", ["provider"])
+PROVIDER_CONCURRENCY_LIMIT = Gauge(
+    "rag_provider_concurrency_limit",
+    "Current adaptive concurrency limit of provider calls (summed over workers)",
+    ["provider"],
+    multiprocess_mode="livesum",
+)
+PROVIDER_CIRCUIT_OPEN = Gauge(
+    "rag_provider_circuit_open",
+    "1 while the provider's circuit breaker is open (in any worker)",
+    ["provider"],
+    multiprocess_mode="livemax",
+)
+
+COALESCED_CALLS = Counter(
+    "rag_coalesced_calls_total",
+    "Calls that joined an identical in-flight computation instead of starting their own",
+    ["kind"],
+)
+
+API_KEY_CACHE_LOOKUPS = Counter(
+    "rag_api_key_cache_lookups_total", "API key verifications (result: hit or miss of the in-process cache)", ["result"]
+)
+QUOTA_REJECTED = Counter("rag_quota_rejected_total", "Queries rejected because the API key's quota was used up")
+
+MEMORY_INDEX_ROWS = Gauge(
+    "rag_memory_index_rows",
+    "Chunks held by the in-process vector index (largest of the workers)",
+    multiprocess_mode="livemax",
+)
+MEMORY_INDEX_READY = Gauge(
+    "rag_memory_index_ready",
+    "1 while the in-process vector index is in sync and serving (in every worker)",
+    multiprocess_mode="livemin",
+)
+MEMORY_INDEX_REFRESHED = Counter(
+    "rag_memory_index_documents_refreshed_total", "Documents reloaded into the in-process vector index"
+)
+
+
+def render_metrics() -> bytes:
+    """
+    Render the metrics in the Prometheus text exposition format.
+
+    Returns:
+        Metrics of this process or, when MULTIPROC_DIR_ENV is set, merged
+        from the files written by every worker process of the server
+
+    Note:
+        prometheus_client keeps metric values per process, so without the
+        multiprocess directory a scrape would only see the worker that
+        happened to serve it.
+    """
+    if MULTIPROC_DIR_ENV not in os.environ:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drop the live gauge samples of an exited worker process.
+
+    Args:
+        pid: Process ID of the worker
+
+    Note:
+        Does nothing unless the multiprocess directory is in use.
+    """
+    if MULTIPROC_DIR_ENV in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None, pipeline: str = "query") -> Iterator[None]:
+    """
+    Time one pipeline stage.
+
+    Args:
+        name: Stage name (Prometheus label; "<name>_ms" key in timings)
+        timings: Per-request timings to add the duration to, in milliseconds (optional)
+        pipeline: "query" for the request path, "ingest" for embedding workers
+
+    Usage:
+        with stage("retrieval", timings):
+            docs = await retrieve(...)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(pipeline, name).observe(elapsed)
+        if timings is not None:
+            timings[f"{name}_ms"] = round(timings.get(f"{name}_ms", 0.0) + elapsed * 1000, 1)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """
+    Format stage timings as a Server-Timing header value.
+
+    Args:
+        timings: Mapping of "<stage>_ms" to milliseconds
+
+    Returns:
+        Header value such as "embedding;dur=12.3, retrieval;dur=4.1"
+    """
+    return ", ".join(f"{key.removesuffix('_ms')};dur={value}" for key, value in timings.items())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and in-flight requests.
+
+    Latency is labelled with the matched route template (not the raw
+    path) to keep label cardinality bounded, and covers the whole body,
+    so streamed responses are measured until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - started)
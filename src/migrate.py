@@ -0,0 +1,31 @@
+"""
+Database schema migration.
+
+Creates the extensions, tables, indexes and change-notification triggers
+and records SCHEMA_VERSION in the schema_version table. Servers no longer
+run this DDL on every boot; they only check the recorded version
+(src.database.check_schema) and refuse to start on an older schema.
+
+Run after creating a database and after every upgrade:
+    uv run python -m src.migrate
+"""
+import asyncio
+
+from src.database import close_db, init_db
+from src.models import SCHEMA_VERSION
+
+
+async def _migrate() -> None:
+    try:
+        await init_db()
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    asyncio.run(_migrate())
+    print(f"Database schema is at version {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
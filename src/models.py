@@ -1,10 +1,90 @@
 import uuid
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Column, DateTime, Text, func
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import BigInteger, Column, Computed, DateTime, ForeignKey, Identity, Index, Integer, Text, func, text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
+from sqlalchemy.orm import deferred
 
 from src.database import Base
+from src.rag.vector_index import FULL_INDEX_NAME, get_vector_index
+
+# Version of the schema created by `python -m src.migrate` (and init-db.sql);
+# bump it with every schema change so that servers refuse to start on an
+# unmigrated database
+SCHEMA_VERSION = 2
+
+# Columns added to documents after its first release. create_all() never alters
+# an existing table, so init_db() (python -m src.migrate) applies these; idempotent
+DOCUMENT_COLUMN_UPGRADES = [
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_status TEXT NOT NULL DEFAULT 'pending'",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_error TEXT",
+    # Same value as src.rag.ingestion.document_hash(), so unchanged updates skip re-embedding
+    """
+    UPDATE documents SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+    WHERE content_hash IS NULL
+    """,
+]
+
+# Applied once, by the migration that adds documents.embedding_status (which
+# backfills every existing document as 'pending'): documents written before the
+# embedding queue have no chunks, so queue each of them for chunking and embedding
+DOCUMENT_EMBEDDING_BACKFILL = """
+    INSERT INTO embedding_jobs (document_id) SELECT id FROM documents
+    ON CONFLICT (document_id) DO NOTHING
+"""
+
+# Keeps documents.updated_at current on content or metadata edits (embedding
+# status changes do not count); idempotent, applied by init_db() (python -m src.migrate)
+DOCUMENT_UPDATED_AT_TRIGGER = [
+    """
+    CREATE OR REPLACE FUNCTION update_updated_at_column() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at = CURRENT_TIMESTAMP;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER update_documents_updated_at
+    BEFORE UPDATE OF content, metadata ON documents
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()
+    """,
+]
+
+# Postgres NOTIFY channel carrying the id of each document whose searchable
+# chunks or metadata changed (see src.rag.memory_index)
+DOCUMENT_CHANGES_CHANNEL = "document_changes"
+
+# Triggers publishing on DOCUMENT_CHANGES_CHANNEL; idempotent, applied by init_db() (python -m src.migrate)
+DOCUMENT_CHANGE_TRIGGERS = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_document_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'documents' THEN
+            PERFORM pg_notify('{DOCUMENT_CHANGES_CHANNEL}', NEW.id::text);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{DOCUMENT_CHANGES_CHANNEL}', OLD.document_id::text);
+        ELSE
+            PERFORM pg_notify('{DOCUMENT_CHANGES_CHANNEL}', NEW.document_id::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER document_chunks_changed
+    AFTER INSERT OR UPDATE OR DELETE ON document_chunks
+    FOR EACH ROW EXECUTE FUNCTION notify_document_change()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER documents_changed
+    AFTER UPDATE ON documents
+    FOR EACH ROW
+    WHEN (OLD.metadata IS DISTINCT FROM NEW.metadata OR OLD.updated_at IS DISTINCT FROM NEW.updated_at)
+    EXECUTE FUNCTION notify_document_change()
+    """,
+]
 
 
 class Document(Base):
@@ -14,20 +94,204 @@ class Document(Base):
     Attributes:
         id: Unique identifier (UUID)
         content: Markdown content of the document
-        embedding: Vector embedding (1536 dimensions for OpenAI embeddings)
+        content_hash: sha256 of content, used to skip re-embedding unchanged content
+        embedding: Legacy whole-document embedding, no longer written or
+            loaded (deferred); retrieval uses per-chunk vectors in document_chunks
         doc_metadata: JSON metadata (title, tags, etc.) - mapped to 'metadata' column in DB
+        embedding_status: "pending" until its chunks are embedded, then "ready" or "failed"
+        embedding_error: Last embedding error when embedding_status is "failed"
         created_at: Timestamp when document was created
-        updated_at: Timestamp when document was last updated
+        updated_at: Timestamp when content or metadata was last updated
     """
 
     __tablename__ = "documents"
+    __table_args__ = (
+        Index("documents_metadata_idx", "metadata", postgresql_using="gin"),
+        Index("documents_created_at_idx", "created_at", "id"),
+        Index(
+            "documents_embedding_status_idx",
+            "embedding_status",
+            postgresql_where=text("embedding_status <> 'ready'"),
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(1536), nullable=True)
+    content_hash = Column(Text, nullable=True)
+    embedding = deferred(Column(Vector(1536), nullable=True))
     doc_metadata = Column("metadata", JSONB, nullable=False, default=dict, server_default="{}")
+    embedding_status = Column(Text, nullable=False, default="pending", server_default="pending")
+    embedding_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
 
     def __repr__(self) -> str:
         return f"<Document(id={self.id}, doc_metadata={self.doc_metadata})>"
+
+
+class DocumentChunk(Base):
+    """
+    Chunk of a document with its own embedding, used for retrieval.
+
+    Attributes:
+        id: Unique identifier (UUID)
+        document_id: Parent document (chunks are deleted with it)
+        chunk_index: Position of the chunk within the document
+        heading: Heading trail of the chunk's section, e.g. "Setup > Docker"
+        content: Markdown content of the chunk
+        token_count: Token count of content
+        embedding: Vector embedding of heading + content (1536 dimensions)
+        embedding_model: Model that produced the embedding
+        content_tsv: Full-text vector of heading + content, generated by Postgres
+        created_at: Timestamp when the chunk was created
+    """
+
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("document_chunks_document_id_idx", "document_id", "chunk_index"),
+        # Only while it is the configured index: with a compact VECTOR_INDEX_MODE the
+        # full index may have been dropped (python -m src.rag.vector_index --drop-others)
+        # and the migration must not rebuild it; init_db() creates the compact one
+        *(
+            []
+            if get_vector_index().compact
+            else [
+                Index(
+                    FULL_INDEX_NAME,
+                    "embedding",
+                    postgresql_using="hnsw",
+                    postgresql_ops={"embedding": "vector_cosine_ops"},
+                )
+            ]
+        ),
+        Index("document_chunks_content_tsv_idx", "content_tsv", postgresql_using="gin"),
+        Index(
+            "document_chunks_content_trgm_idx",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"},
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    heading = Column(Text, nullable=True)
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    embedding = Column(Vector(1536), nullable=True)
+    embedding_model = Column(Text, nullable=True)
+    content_tsv = Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', coalesce(heading, '') || ' ' || content)", persisted=True),
+    )
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<DocumentChunk(document_id={self.document_id}, chunk_index={self.chunk_index})>"
+
+
+class EmbeddingJob(Base):
+    """
+    Queued request to (re-)embed a document, consumed by the embedding workers.
+
+    Attributes:
+        id: Job identifier
+        document_id: Document to embed (one job per document; the job is
+            deleted with it)
+        attempts: Number of times the job has been claimed
+        run_after: Earliest time the job may be claimed (retry backoff)
+        lease_id: Identifies the worker batch holding the job (None if unclaimed)
+        locked_until: Lease expiry; an expired lease can be claimed again
+        last_error: Error of the last failed attempt
+        created_at: Timestamp when the job was queued
+    """
+
+    __tablename__ = "embedding_jobs"
+    __table_args__ = (Index("embedding_jobs_run_after_idx", "run_after"),)
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    document_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("documents.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    lease_id = Column(UUID(as_uuid=True), nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<EmbeddingJob(document_id={self.document_id}, attempts={self.attempts})>"
+
+
+class EmbeddingCacheEntry(Base):
+    """
+    Cached embedding vector for a piece of text.
+
+    Attributes:
+        model: Embedding model that produced the vector
+        content_hash: sha256 of the normalized text
+        embedding: Vector embedding
+        created_at: Timestamp when the entry was cached (used for TTL and size eviction)
+    """
+
+    __tablename__ = "embedding_cache"
+    __table_args__ = (Index("embedding_cache_created_at_idx", "created_at"),)
+
+    model = Column(Text, primary_key=True)
+    content_hash = Column(Text, primary_key=True)
+    embedding = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<EmbeddingCacheEntry(model={self.model}, content_hash={self.content_hash})>"
+
+
+class ApiKey(Base):
+    """
+    API key of one client, stored as a hash (the key itself is shown once, on creation).
+
+    Attributes:
+        id: Unique identifier (UUID)
+        name: Client name, reported as the authenticated username
+        key_prefix: First characters of the key, to recognize it in listings
+        key_hash: sha256 of the key (keys are random, so a fast hash is enough)
+        queries_per_minute: Query quota of the key (None = unlimited)
+        revoked_at: Timestamp when the key was revoked (None = active)
+        created_at: Timestamp when the key was created
+    """
+
+    __tablename__ = "api_keys"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(Text, nullable=False)
+    key_prefix = Column(Text, nullable=False)
+    key_hash = Column(Text, nullable=False, unique=True)
+    queries_per_minute = Column(Integer, nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<ApiKey(name={self.name}, key_prefix={self.key_prefix})>"
+
+
+class SchemaVersion(Base):
+    """
+    Schema versions applied to the database by the migration command.
+
+    Attributes:
+        version: Applied SCHEMA_VERSION
+        applied_at: Timestamp when it was applied
+    """
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    applied_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<SchemaVersion(version={self.version})>"
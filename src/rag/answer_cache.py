@@ -0,0 +1,183 @@
+import itertools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from src.config import settings
+from src.metrics import ANSWER_CACHE_LOOKUPS
+from src.rag.vector_store import SearchResult
+from src.schemas import QueryResponse
+
+Scope = Tuple[Hashable, ...]
+
+
+def source_scope(docs: List[SearchResult]) -> Scope:
+    """
+    Identify the exact context an answer was generated from.
+
+    Args:
+        docs: Retrieved chunks
+
+    Returns:
+        Sorted (document id, chunk index, document updated_at, chunk content
+        hash) tuples, so that an edit to any contributing document changes
+        the scope, and so does the embedding worker replacing its chunks
+
+    Note:
+        The chunk hash keeps an answer generated from the previous chunks
+        of a document still being re-embedded (whose updated_at is already
+        the new one) from matching once the new chunks are stored. Scopes
+        identify their content, so entries never need invalidating across
+        worker processes; invalidate_documents only frees memory early.
+    """
+    return tuple(sorted(
+        (str(doc.id), doc.chunk_index, doc.updated_at.isoformat(), doc.content_hash) for doc in docs
+    ))
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    scope: Scope
+    document_ids: Set[UUID]
+    response: QueryResponse
+    expires_at: float
+
+
+class AnswerCache:
+    """
+    In-process semantic cache of generated answers.
+
+    An entry is reused when a new question retrieves exactly the same
+    source scope and its embedding has cosine similarity of at least
+    `threshold` with the cached question. Entries expire after
+    `ttl_seconds` and the least recently used ones are evicted beyond
+    `max_entries`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._ids = itertools.count()
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._by_scope: Dict[Scope, Set[int]] = {}
+        self._by_document: Dict[UUID, Set[int]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def lookup(self, query_vector: List[float], docs: List[SearchResult]) -> Optional[QueryResponse]:
+        """
+        Find a cached answer for a similar question over the same sources.
+
+        Args:
+            query_vector: Embedding of the new question
+            docs: Chunks retrieved for the new question
+
+        Returns:
+            Cached QueryResponse flagged with cached=True, or None on a miss
+        """
+        now = time.monotonic()
+        candidates = []
+        for entry_id in list(self._by_scope.get(source_scope(docs), ())):
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+            else:
+                candidates.append(entry_id)
+
+        if candidates:
+            matrix = np.stack([self._entries[entry_id].vector for entry_id in candidates])
+            similarities = matrix @ self._normalize(query_vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry_id = candidates[best]
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                ANSWER_CACHE_LOOKUPS.labels("hit").inc()
+                return self._entries[entry_id].response.model_copy(update={"cached": True})
+
+        self.misses += 1
+        ANSWER_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def store(self, query_vector: List[float], docs: List[SearchResult], response: QueryResponse) -> None:
+        """
+        Cache a freshly generated answer.
+
+        Args:
+            query_vector: Embedding of the question
+            docs: Chunks the answer was generated from
+            response: Generated response
+        """
+        entry_id = next(self._ids)
+        entry = _Entry(
+            vector=self._normalize(query_vector),
+            scope=source_scope(docs),
+            document_ids={doc.id for doc in docs},
+            response=response,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        self._entries[entry_id] = entry
+        self._by_scope.setdefault(entry.scope, set()).add(entry_id)
+        for document_id in entry.document_ids:
+            self._by_document.setdefault(document_id, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_documents(self, document_ids: Iterable[UUID]) -> None:
+        """
+        Drop every cached answer that used any of the given documents.
+
+        Args:
+            document_ids: Created, updated or deleted document IDs
+        """
+        for document_id in document_ids:
+            for entry_id in list(self._by_document.get(document_id, ())):
+                self._remove(entry_id)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._discard(self._by_scope, entry.scope, entry_id)
+        for document_id in entry.document_ids:
+            self._discard(self._by_document, document_id, entry_id)
+
+    @staticmethod
+    def _discard(index: Dict, key: Hashable, entry_id: int) -> None:
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del index[key]
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """
+    Build the answer cache configured in settings.
+
+    Returns:
+        AnswerCache, or None if answer caching is disabled
+    """
+    if not settings.answer_cache_enabled:
+        return None
+
+    return AnswerCache(
+        max_entries=settings.answer_cache_max_entries,
+        ttl_seconds=settings.answer_cache_ttl_seconds,
+        threshold=settings.answer_cache_similarity_threshold,
+    )
@@ -1,38 +1,42 @@
-from typing import List
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.rag.llm import get_llm
-from src.rag.vector_store import search_similar_documents
-from src.schemas import QueryResponse, SourceDocument
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.metrics import CONTEXT_TOKENS, LLM_TOKENS, stage
+from src.rag.context import build_context, format_docs
+from src.rag.singleflight import normalize_question
+from src.rag.vector_store import RetrievalMode, SearchResult, retrieve, retrieve_many
+from src.schemas import MetadataFilter, QueryResponse, SourceDocument, TokenUsage
 
+if TYPE_CHECKING:
+    from src.rag.registry import RAGComponents
 
-def format_docs(docs_with_scores: List[tuple]) -> str:
-    """
-    Format retrieved documents into a single context string.
-
-    Args:
-        docs_with_scores: List of tuples (Document, score) from vector search
 
-    Returns:
-        Formatted string with all document contents
-    """
-    return "\n\n".join(doc.page_content for doc, _ in docs_with_scores)
-
-
-def create_rag_chain():
+def create_rag_chain(llm: BaseChatModel):
     """
     Create a simple RAG chain using LangChain.
 
+    Args:
+        llm: Chat model used for answer generation
+
     Returns:
-        Runnable chain that processes questions and generates answers
+        Runnable chain that takes {"docs", "question"} (docs already fitted
+        to the context budget by build_context) and returns the
+        model's AIMessage (or AIMessageChunks when streamed), so that
+        usage_metadata stays available to callers
 
     Note:
+        Build this once per process (see src.rag.registry) and reuse it.
         This is a simple RAG implementation:
-        1. Retrieve relevant documents based on query
-        2. Format documents as context
+        1. Retrieve relevant documents based on query (reranking a larger
+           candidate pool if a reranker is configured)
+        2. Select passages within the token budget and format them as context
         3. Generate answer using LLM with context
     """
     # Define the prompt template
@@ -47,50 +51,363 @@ def create_rag_chain():
 回答:"""
 
     prompt = ChatPromptTemplate.from_template(template)
-    llm = get_llm()
 
     # Create the chain
     chain = (
         {"context": lambda x: format_docs(x["docs"]), "question": lambda x: x["question"]}
         | prompt
         | llm
-        | StrOutputParser()
     )
 
     return chain
 
 
-def query_rag(question: str, k: int = 5) -> QueryResponse:
+def _to_sources(docs: List[SearchResult]) -> List[SourceDocument]:
+    """Convert search results into response source documents."""
+    return [
+        SourceDocument(
+            id=doc.id,
+            chunk_index=doc.chunk_index,
+            content=doc.content[:500],  # Truncate for response
+            score=doc.score,
+            metadata=doc.metadata,
+        )
+        for doc in docs
+    ]
+
+
+def _usage(message: Any) -> TokenUsage:
+    """Read token usage reported by the provider on an AIMessage."""
+    usage = dict(message.usage_metadata or {}) if message is not None else {}
+    return TokenUsage(
+        input_tokens=usage.get("input_tokens"),
+        output_tokens=usage.get("output_tokens"),
+        total_tokens=usage.get("total_tokens"),
+    )
+
+
+def _record_usage(context_tokens: int, usage: TokenUsage) -> None:
+    """Export the token counts of one generation as metrics."""
+    CONTEXT_TOKENS.observe(context_tokens)
+    if usage.input_tokens:
+        LLM_TOKENS.labels("input").inc(usage.input_tokens)
+    if usage.output_tokens:
+        LLM_TOKENS.labels("output").inc(usage.output_tokens)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def _retrieve(
+    db: AsyncSession,
+    rag: "RAGComponents",
+    question: str,
+    k: int,
+    ef_search: Optional[int],
+    mode: Optional[RetrievalMode],
+    metadata_filter: Optional[MetadataFilter],
+    timings: Dict[str, float],
+) -> Tuple[List[float], List[SearchResult]]:
+    """
+    Embed the question and retrieve the top k chunks.
+
+    Returns:
+        (query_vector, docs), with embedding, retrieval and rerank stage
+        durations added to timings
+
+    Note:
+        With a reranker configured, settings.rerank_candidates chunks are
+        retrieved and the reranker keeps the best k. The pooled connection
+        is released before reranking and generation.
+    """
+    with stage("embedding", timings):
+        query_vector = await rag.embeddings.aembed_query(question)
+    reranker = rag.reranker
+    with stage("retrieval", timings):
+        docs = await retrieve(
+            db,
+            query_vector,
+            question,
+            k=max(k, settings.rerank_candidates) if reranker is not None else k,
+            ef_search=ef_search,
+            mode=mode,
+            metadata_filter=metadata_filter,
+            with_embeddings=reranker is not None and reranker.needs_embeddings,
+            memory_index=rag.memory_index,
+        )
+        # Return the pooled connection before the (slow) reranking and generation
+        await db.rollback()
+
+    if reranker is not None:
+        with stage("rerank", timings):
+            docs = await reranker.rerank(question, query_vector, docs, k)
+    return query_vector, docs
+
+
+async def query_rag(
+    db: AsyncSession,
+    rag: "RAGComponents",
+    question: str,
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    mode: Optional[RetrievalMode] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+) -> QueryResponse:
     """
     Execute RAG query to answer a question.
 
     Args:
+        db: Database session
+        rag: Process-wide RAG components (embeddings client and chain)
         question: User's question
-        k: Number of documents to retrieve (default: 5)
+        k: Number of chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for retrieval (optional)
+        mode: Retrieval mode, "vector" or "hybrid" (default: settings.retrieval_mode)
+        metadata_filter: Only retrieve chunks of matching documents (optional)
 
     Returns:
-        QueryResponse with answer and source documents
+        QueryResponse with answer, the passages sent to the LLM, context
+        token count, LLM usage and per-stage timings (cached=True when
+        served from the semantic answer cache)
+
+    Note:
+        With query coalescing enabled, concurrent calls for the same
+        normalized question and options share one run (see
+        src.rag.singleflight). That run uses its own database session,
+        since it must outlive the first caller if that caller is cancelled.
     """
+    if rag.query_flight is None:
+        return await _query(db, rag, question, k, ef_search, mode, metadata_filter)
+
+    key = (
+        normalize_question(question),
+        k,
+        ef_search,
+        mode or settings.retrieval_mode,
+        metadata_filter.model_dump_json() if metadata_filter is not None else None,
+    )
+
+    async def run() -> QueryResponse:
+        async with AsyncSessionLocal() as session:
+            return await _query(session, rag, question, k, ef_search, mode, metadata_filter)
+
+    response = await rag.query_flight.do(key, run)
+    # Each caller gets its own copy of the shared response
+    return response.model_copy(deep=True)
+
+
+async def _query(
+    db: AsyncSession,
+    rag: "RAGComponents",
+    question: str,
+    k: int,
+    ef_search: Optional[int],
+    mode: Optional[RetrievalMode],
+    metadata_filter: Optional[MetadataFilter],
+) -> QueryResponse:
+    """Retrieve and answer one question (query_rag without coalescing)."""
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
     # Search for similar documents
-    docs_with_scores = search_similar_documents(question, k=k)
-
-    # Create and run the RAG chain
-    chain = create_rag_chain()
-    answer = chain.invoke({"docs": docs_with_scores, "question": question})
-
-    # Format source documents
-    sources = []
-    for doc, score in docs_with_scores:
-        # Extract ID from metadata if available
-        doc_id = doc.metadata.get("id")
-        if doc_id:
-            sources.append(
-                SourceDocument(
-                    id=doc_id,
-                    content=doc.page_content[:500],  # Truncate for response
-                    score=float(score),
-                    metadata=doc.metadata,
-                )
-            )
-
-    return QueryResponse(answer=answer, sources=sources)
+    query_vector, docs = await _retrieve(db, rag, question, k, ef_search, mode, metadata_filter, timings)
+    response = await _answer(rag, question, query_vector, docs, timings)
+    response.timings["total_ms"] = _elapsed_ms(started)
+    return response
+
+
+async def query_rag_batch(
+    db: AsyncSession,
+    rag: "RAGComponents",
+    questions: List[str],
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    mode: Optional[RetrievalMode] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[Tuple[int, Union[QueryResponse, Exception]]]:
+    """
+    Answer many questions, sharing embedding and retrieval work.
+
+    Args:
+        db: Database session
+        rag: Process-wide RAG components (embeddings client and chain)
+        questions: User's questions
+        k: Number of chunks to retrieve per question (default: 5)
+        ef_search: HNSW candidate list size for retrieval (optional)
+        mode: Retrieval mode, "vector" or "hybrid" (default: settings.retrieval_mode)
+        metadata_filter: Only retrieve chunks of matching documents (optional)
+        concurrency: Maximum concurrent LLM generations
+            (default: settings.query_batch_concurrency)
+
+    Yields:
+        (index, QueryResponse) for each answered question, or
+        (index, exception) if its generation failed, in completion order
+
+    Raises:
+        Exception: If embedding or retrieval fails (nothing is yielded then)
+
+    Note:
+        All questions are embedded with one embed_documents call and
+        retrieved with one statement (see retrieve_many), then the pooled
+        connection is released. Pending generations are cancelled if the
+        consumer stops iterating (e.g. the client disconnects).
+    """
+    started = time.perf_counter()
+    # Embedding and retrieval durations are shared by every question of the batch
+    shared: Dict[str, float] = {}
+    with stage("embedding", shared):
+        query_vectors = await rag.embeddings.aembed_documents(questions)
+    reranker = rag.reranker
+    with stage("retrieval", shared):
+        retrieved = await retrieve_many(
+            db,
+            query_vectors,
+            questions,
+            k=max(k, settings.rerank_candidates) if reranker is not None else k,
+            ef_search=ef_search,
+            mode=mode,
+            metadata_filter=metadata_filter,
+            with_embeddings=reranker is not None and reranker.needs_embeddings,
+            memory_index=rag.memory_index,
+        )
+        # Return the pooled connection before the (slow) reranking and generation
+        await db.rollback()
+
+    semaphore = asyncio.Semaphore(concurrency or settings.query_batch_concurrency)
+
+    async def answer(index: int) -> Tuple[int, Union[QueryResponse, Exception]]:
+        async with semaphore:
+            try:
+                timings = dict(shared)
+                docs = retrieved[index]
+                if reranker is not None:
+                    with stage("rerank", timings):
+                        docs = await reranker.rerank(questions[index], query_vectors[index], docs, k)
+                response = await _answer(rag, questions[index], query_vectors[index], docs, timings)
+                response.timings["total_ms"] = _elapsed_ms(started)
+                return index, response
+            except Exception as e:
+                return index, e
+
+    tasks = [asyncio.create_task(answer(index)) for index in range(len(questions))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _answer(
+    rag: "RAGComponents",
+    question: str,
+    query_vector: List[float],
+    docs: List[SearchResult],
+    timings: Dict[str, float],
+) -> QueryResponse:
+    """Answer from retrieved chunks, going through the semantic answer cache."""
+    if rag.answer_cache is not None:
+        cached = rag.answer_cache.lookup(query_vector, docs)
+        if cached is not None:
+            return cached.model_copy(update={"timings": timings})
+
+    # Fit the retrieved passages to the context budget and run the prebuilt RAG chain
+    with stage("context", timings):
+        context = build_context(docs, question)
+    with stage("generation", timings):
+        message = await rag.chain.ainvoke({"docs": context.passages, "question": question})
+    usage = _usage(message)
+    _record_usage(context.tokens, usage)
+    response = QueryResponse(
+        answer=message.text,
+        sources=_to_sources(context.passages),
+        context_tokens=context.tokens,
+        usage=usage,
+        timings=timings,
+    )
+
+    if rag.answer_cache is not None:
+        rag.answer_cache.store(query_vector, docs, response)
+    return response
+
+
+async def stream_rag(
+    db: AsyncSession,
+    rag: "RAGComponents",
+    question: str,
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    mode: Optional[RetrievalMode] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Execute RAG query and stream the answer as it is generated.
+
+    Args:
+        db: Database session
+        rag: Process-wide RAG components (embeddings client and chain)
+        question: User's question
+        k: Number of chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for retrieval (optional)
+        mode: Retrieval mode, "vector" or "hybrid" (default: settings.retrieval_mode)
+        metadata_filter: Only retrieve chunks of matching documents (optional)
+
+    Yields:
+        (event, data) pairs:
+        - ("sources", {"sources": [...]}) once the context is assembled
+        - ("token", {"text": "..."}) for each generated piece of text
+        - ("done", {"timings": {...}, "context_tokens": int, "usage": {...}, "cached": bool}) at the end,
+          where timings holds per-stage, first-token and total milliseconds
+
+    Note:
+        On a semantic answer cache hit the whole cached answer is sent as
+        a single token event.
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    query_vector, docs = await _retrieve(db, rag, question, k, ef_search, mode, metadata_filter, timings)
+    with stage("context", timings):
+        context = build_context(docs, question)
+    sources = _to_sources(context.passages)
+    yield "sources", {"sources": [source.model_dump(mode="json") for source in sources]}
+
+    cached = rag.answer_cache.lookup(query_vector, docs) if rag.answer_cache is not None else None
+    if cached is not None:
+        yield "token", {"text": cached.answer}
+        timings["total_ms"] = _elapsed_ms(started)
+        yield "done", {
+            "timings": timings,
+            "context_tokens": cached.context_tokens,
+            "usage": TokenUsage(input_tokens=0, output_tokens=0, total_tokens=0).model_dump(),
+            "cached": True,
+        }
+        return
+
+    message = None
+    with stage("generation", timings):
+        async for chunk in rag.chain.astream({"docs": context.passages, "question": question}):
+            message = chunk if message is None else message + chunk
+            if chunk.text:
+                if "first_token_ms" not in timings:
+                    timings["first_token_ms"] = _elapsed_ms(started)
+                yield "token", {"text": chunk.text}
+    timings["total_ms"] = _elapsed_ms(started)
+
+    usage = _usage(message)
+    _record_usage(context.tokens, usage)
+    if rag.answer_cache is not None and message is not None:
+        rag.answer_cache.store(
+            query_vector,
+            docs,
+            QueryResponse(answer=message.text, sources=sources, context_tokens=context.tokens, usage=usage),
+        )
+
+    yield "done", {
+        "timings": timings,
+        "context_tokens": context.tokens,
+        "usage": usage.model_dump(),
+        "cached": False,
+    }
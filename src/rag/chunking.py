@@ -0,0 +1,210 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.rag.tokens import count_tokens
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+@dataclass
+class Chunk:
+    """
+    A contiguous slice of a markdown document.
+
+    Attributes:
+        index: Position of the chunk within the document
+        heading: Heading trail of the section, e.g. "Setup > Docker"
+        content: Markdown text of the chunk
+        token_count: Token count of content
+    """
+
+    index: int
+    heading: Optional[str]
+    content: str
+    token_count: int
+
+    @property
+    def embedding_text(self) -> str:
+        """Text sent to the embedding model (content prefixed with its heading trail)."""
+        return chunk_text(self.heading, self.content)
+
+
+def chunk_text(heading: Optional[str], content: str) -> str:
+    """
+    Prefix chunk content with its heading trail.
+
+    Args:
+        heading: Heading trail (optional)
+        content: Chunk content
+
+    Returns:
+        Text used for embedding and prompt context
+    """
+    return f"{heading}\n\n{content}" if heading else content
+
+
+def _split_blocks(text: str) -> List[Tuple[Optional[str], str]]:
+    """
+    Split markdown into (heading trail, block) pairs.
+
+    Blocks are paragraphs separated by blank lines, heading lines, or whole
+    fenced code blocks. Headings inside code fences are not treated as
+    headings.
+    """
+    blocks: List[Tuple[Optional[str], str]] = []
+    trail: List[Tuple[int, str]] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+
+    def heading() -> Optional[str]:
+        return " > ".join(title for _, title in trail) or None
+
+    def flush() -> None:
+        if current:
+            blocks.append((heading(), "\n".join(current)))
+            current.clear()
+
+    for line in text.splitlines():
+        fence_match = FENCE_RE.match(line)
+        if fence is not None:
+            current.append(line)
+            if fence_match and fence_match.group(1) == fence:
+                fence = None
+                flush()
+            continue
+
+        if fence_match:
+            flush()
+            fence = fence_match.group(1)
+            current.append(line)
+            continue
+
+        heading_match = HEADING_RE.match(line)
+        if heading_match:
+            flush()
+            level = len(heading_match.group(1))
+            trail = [(lvl, title) for lvl, title in trail if lvl < level]
+            trail.append((level, heading_match.group(2)))
+            blocks.append((heading(), line))
+            continue
+
+        if not line.strip():
+            flush()
+            continue
+
+        current.append(line)
+
+    flush()
+    return blocks
+
+
+def _split_oversized(block: str, max_tokens: int) -> List[str]:
+    """Split a block larger than max_tokens by lines, then by characters."""
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    lines = block.split("\n")
+    for line, tokens in zip(lines, count_tokens(lines)):
+        if tokens > max_tokens:
+            if current:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            pieces.extend(_split_line(line, tokens, max_tokens))
+            continue
+
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _split_line(line: str, tokens: int, max_tokens: int) -> List[str]:
+    """Split a line of `tokens` tokens into character windows of at most max_tokens."""
+    # Windows sized from the line's average token density; denser ones are split again
+    width = max(1, len(line) * max_tokens // tokens)
+    windows = [line[start:start + width] for start in range(0, len(line), width)]
+    pieces: List[str] = []
+    for window, window_tokens in zip(windows, count_tokens(windows)):
+        if window_tokens > max_tokens and len(window) > 1:
+            pieces.extend(_split_line(window, window_tokens, max_tokens))
+        else:
+            pieces.append(window)
+    return pieces
+
+
+def split_markdown(text: str, max_tokens: int, overlap_tokens: int) -> List[Chunk]:
+    """
+    Split markdown into chunks along headings and code fences.
+
+    Args:
+        text: Markdown document
+        max_tokens: Maximum tokens per chunk, not counting the bare heading
+            lines that lead its first block
+        overlap_tokens: Trailing blocks of up to this many tokens are repeated
+            at the start of the next chunk within the same section
+
+    Returns:
+        List of chunks in document order (at least one for non-empty text)
+
+    Note:
+        A chunk never spans two sections, so its heading trail is exact.
+        Blocks larger than max_tokens (huge code blocks, tables) are split
+        by lines and, as a last resort, by characters.
+    """
+    blocks = _split_blocks(text)
+    block_tokens = count_tokens([block for _, block in blocks])
+    units: List[Tuple[Optional[str], str, int]] = []
+    for (heading, block), tokens in zip(blocks, block_tokens):
+        if tokens <= max_tokens:
+            units.append((heading, block, tokens))
+            continue
+        pieces = _split_oversized(block, max_tokens)
+        units.extend((heading, piece, t) for piece, t in zip(pieces, count_tokens(pieces)))
+
+    chunks: List[Chunk] = []
+    current: List[Tuple[str, int]] = []
+    current_heading: Optional[str] = None
+
+    def emit() -> None:
+        chunks.append(Chunk(
+            index=len(chunks),
+            heading=current_heading,
+            content="\n\n".join(block for block, _ in current),
+            token_count=sum(tokens for _, tokens in current),
+        ))
+
+    for heading, block, tokens in units:
+        current_tokens = sum(t for _, t in current)
+        new_section = heading != current_heading
+        # Bare headings are never emitted alone; they lead the next block
+        only_headings = all(HEADING_RE.match(b) for b, _ in current)
+
+        if current and not only_headings and (new_section or current_tokens + tokens > max_tokens):
+            emit()
+            current = [] if new_section else _overlap(current, overlap_tokens, max_tokens - tokens)
+        current_heading = heading
+        current.append((block, tokens))
+
+    if current:
+        emit()
+    return chunks
+
+
+def _overlap(blocks: List[Tuple[str, int]], overlap_tokens: int, room: int) -> List[Tuple[str, int]]:
+    """Return the trailing blocks that fit in both the overlap and the remaining room."""
+    kept: List[Tuple[str, int]] = []
+    total = 0
+    for block, tokens in reversed(blocks):
+        if total + tokens > min(overlap_tokens, room):
+            break
+        kept.insert(0, (block, tokens))
+        total += tokens
+    return kept
@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Set
+
+from src.config import settings
+from src.rag.chunking import chunk_text
+from src.rag.tokens import count_tokens
+from src.rag.vector_store import SearchResult, lexical_terms
+
+ELLIPSIS = "…"
+
+
+@dataclass
+class PromptContext:
+    """
+    Passages selected for the prompt.
+
+    Attributes:
+        passages: Passages in prompt order (content may be trimmed)
+        tokens: Token count of the formatted context
+        dropped: Retrieved passages left out as duplicates or over budget
+    """
+
+    passages: List[SearchResult]
+    tokens: int
+    dropped: int
+
+
+def format_docs(docs: Sequence[SearchResult]) -> str:
+    """
+    Format passages into a single context string.
+
+    Args:
+        docs: Passages to include
+
+    Returns:
+        Formatted string with each passage's heading trail and content
+    """
+    return "\n\n".join(chunk_text(doc.heading, doc.content) for doc in docs)
+
+
+def _shingles(text: str, size: int = 5) -> Set[str]:
+    """Character n-grams of whitespace-normalized text (works without word boundaries)."""
+    normalized = " ".join(text.lower().split())
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def _is_duplicate(shingles: Set[str], kept: List[Set[str]], threshold: float) -> bool:
+    """Check Jaccard similarity against already selected passages."""
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= threshold:
+            return True
+    return False
+
+
+def _trim(doc: SearchResult, terms: List[str], budget: int) -> Optional[SearchResult]:
+    """
+    Cut a passage down to the lines around its densest query-term hits.
+
+    Args:
+        doc: Passage that does not fit in the remaining budget
+        terms: Lower-cased query terms
+        budget: Tokens available for the formatted passage
+
+    Returns:
+        Trimmed passage, or None if not even its heading and one line fit
+    """
+    lines = doc.content.split("\n")
+    heading_tokens = count_tokens([chunk_text(doc.heading, ELLIPSIS)])[0]
+    line_tokens = count_tokens([f"{line}\n" for line in lines])
+    hits = [sum(term in line.lower() for term in terms) for line in lines]
+
+    # Start from the best-matching line (the first line if nothing matches)
+    center = max(range(len(lines)), key=lambda i: (hits[i], -i))
+    room = budget - heading_tokens - 2  # leading and trailing ellipsis
+    if line_tokens[center] > room:
+        return None
+
+    low, high = center, center
+    used = line_tokens[center]
+    while True:
+        candidates = [i for i in (low - 1, high + 1) if 0 <= i < len(lines) and used + line_tokens[i] <= room]
+        if not candidates:
+            break
+        # Prefer the neighbour with more hits, then the following line
+        best = max(candidates, key=lambda i: (hits[i], i))
+        used += line_tokens[best]
+        low, high = min(low, best), max(high, best)
+
+    content = "\n".join(lines[low:high + 1])
+    if low > 0:
+        content = f"{ELLIPSIS}\n{content}"
+    if high < len(lines) - 1:
+        content = f"{content}\n{ELLIPSIS}"
+    return doc._replace(content=content)
+
+
+def build_context(
+    docs: Sequence[SearchResult],
+    question: str,
+    max_tokens: Optional[int] = None,
+    dedup_threshold: Optional[float] = None,
+) -> PromptContext:
+    """
+    Select, de-duplicate and trim retrieved passages to fit a token budget.
+
+    Args:
+        docs: Retrieved passages
+        question: User's question (its terms guide trimming)
+        max_tokens: Context token budget (default: settings.context_max_tokens)
+        dedup_threshold: Jaccard similarity of character 5-grams at which a
+            passage counts as a near-duplicate of a better-scored one
+            (default: settings.context_dedup_threshold)
+
+    Returns:
+        PromptContext with passages ordered by descending score
+
+    Note:
+        Passages are taken in score order while they fit. A passage that
+        does not fit is trimmed to the lines around its query-term hits if
+        at least settings.context_min_passage_tokens remain; passages after
+        it are still considered, since a smaller one may fit.
+    """
+    max_tokens = max_tokens or settings.context_max_tokens
+    dedup_threshold = dedup_threshold or settings.context_dedup_threshold
+    words, cjk_terms = lexical_terms(question)
+    terms = words + [term.lower() for term in cjk_terms]
+
+    ordered = sorted(docs, key=lambda doc: doc.score, reverse=True)
+    passage_tokens = count_tokens([chunk_text(doc.heading, doc.content) for doc in ordered])
+
+    passages: List[SearchResult] = []
+    kept_shingles: List[Set[str]] = []
+    used = 0
+    for doc, tokens in zip(ordered, passage_tokens):
+        shingles = _shingles(doc.content)
+        if _is_duplicate(shingles, kept_shingles, dedup_threshold):
+            continue
+
+        # Passages are separated by a blank line (about one token)
+        remaining = max_tokens - used - (1 if passages else 0)
+        if tokens > remaining:
+            if remaining < settings.context_min_passage_tokens:
+                continue
+            doc = _trim(doc, terms, remaining)
+            if doc is None:
+                continue
+            tokens = count_tokens([chunk_text(doc.heading, doc.content)])[0]
+
+        passages.append(doc)
+        kept_shingles.append(shingles)
+        used = max_tokens - remaining + tokens
+
+    return PromptContext(
+        passages=passages,
+        tokens=count_tokens([format_docs(passages)])[0] if passages else 0,
+        dropped=len(docs) - len(passages),
+    )
@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.metrics import EMBEDDING_CACHE_LOOKUPS
+from src.models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash text for cache lookups.
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Hex sha256 of the NFKC-normalized, whitespace-collapsed text
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, content hash).
+
+    Tier 1 is a bounded in-process LRU of float32 arrays. Tier 2 is the
+    embedding_cache table, shared by all workers and restarts, with
+    TTL- and size-based eviction run in a background task at most every
+    `prune_interval_seconds`, so no lookup waits for it.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_memory_entries: int,
+        ttl_seconds: int,
+        max_db_entries: int,
+        prune_interval_seconds: int,
+    ):
+        self.model = model
+        self.max_memory_entries = max_memory_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_db_entries = max_db_entries
+        self.prune_interval_seconds = prune_interval_seconds
+
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self._prune_task: Optional[asyncio.Task] = None
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get_memory(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up keys in the in-process tier, refreshing their LRU position."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+        EMBEDDING_CACHE_LOOKUPS.labels("memory_hit").inc(len(found))
+        return found
+
+    def put_memory(self, items: Dict[str, np.ndarray]) -> None:
+        """Insert vectors into the in-process tier, evicting least recently used."""
+        with self._lock:
+            for key, vector in items.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    async def aget(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up keys in both tiers.
+
+        Args:
+            keys: Content hashes
+
+        Returns:
+            Mapping of found content hash to vector
+        """
+        found = self.get_memory(keys)
+        missing = [key for key in keys if key not in found]
+
+        if missing:
+            cutoff = datetime.now(timezone.utc) - self.ttl
+            try:
+                async with AsyncSessionLocal() as db:
+                    rows = await db.execute(
+                        select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.embedding)
+                        .where(EmbeddingCacheEntry.model == self.model)
+                        .where(EmbeddingCacheEntry.content_hash.in_(missing))
+                        .where(EmbeddingCacheEntry.created_at > cutoff)
+                    )
+                    from_db = {row.content_hash: np.asarray(row.embedding, dtype=np.float32) for row in rows}
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {e}")
+                from_db = {}
+
+            self.db_hits += len(from_db)
+            EMBEDDING_CACHE_LOOKUPS.labels("db_hit").inc(len(from_db))
+            self.put_memory(from_db)
+            found.update(from_db)
+
+        self.misses += len(keys) - len(found)
+        EMBEDDING_CACHE_LOOKUPS.labels("miss").inc(len(keys) - len(found))
+        return found
+
+    async def aput(self, items: Dict[str, np.ndarray]) -> None:
+        """
+        Store freshly computed vectors in both tiers.
+
+        Args:
+            items: Mapping of content hash to vector
+        """
+        if not items:
+            return
+
+        self.put_memory(items)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    insert(EmbeddingCacheEntry)
+                    .values([
+                        {"model": self.model, "content_hash": key, "embedding": vector}
+                        for key, vector in items.items()
+                    ])
+                    .on_conflict_do_nothing()
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+        if time.monotonic() - self._last_prune > self.prune_interval_seconds and self._prune_task is None:
+            self._last_prune = time.monotonic()
+            self._prune_task = asyncio.create_task(self._prune_in_background())
+
+    async def _prune_in_background(self) -> None:
+        try:
+            await self.aprune()
+        finally:
+            self._prune_task = None
+
+    async def aclose(self) -> None:
+        """Cancel a running background prune."""
+        task = self._prune_task
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def aprune(self) -> None:
+        """Delete this model's expired rows and trim them to max_db_entries (oldest first)."""
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        overflow = (
+            select(EmbeddingCacheEntry.content_hash)
+            .where(EmbeddingCacheEntry.model == self.model)
+            .order_by(EmbeddingCacheEntry.created_at.desc())
+            .offset(self.max_db_entries)
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    delete(EmbeddingCacheEntry)
+                    .where(EmbeddingCacheEntry.model == self.model)
+                    .where(EmbeddingCacheEntry.created_at <= cutoff)
+                )
+                await db.execute(
+                    delete(EmbeddingCacheEntry)
+                    .where(EmbeddingCacheEntry.model == self.model)
+                    .where(EmbeddingCacheEntry.content_hash.in_(overflow))
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Embedding cache prune failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the in-process tier size."""
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before the provider.
+
+    Note:
+        The async methods use both cache tiers. The sync methods, which the
+        async request path never calls, only use the in-process tier.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_hash(text) for text in texts]
+        found = self.cache.get_memory(keys)
+        missing = self._missing(texts, keys, found)
+        self.cache.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = self._as_arrays(missing, vectors)
+            self.cache.put_memory(computed)
+            found.update(computed)
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_hash(text) for text in texts]
+        found = await self.cache.aget(list(dict.fromkeys(keys)))
+        missing = self._missing(texts, keys, found)
+
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = self._as_arrays(missing, vectors)
+            await self.cache.aput(computed)
+            found.update(computed)
+
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    @staticmethod
+    def _missing(texts: List[str], keys: List[str], found: Dict[str, np.ndarray]) -> Dict[str, str]:
+        """Map each uncached key to one text to embed (duplicates embedded once)."""
+        return {key: text for key, text in zip(keys, texts) if key not in found}
+
+    @staticmethod
+    def _as_arrays(missing: Dict[str, str], vectors: List[List[float]]) -> Dict[str, np.ndarray]:
+        return {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)}
+
+
+def get_embedding_cache(model: str) -> Optional[EmbeddingCache]:
+    """
+    Build the embedding cache configured in settings.
+
+    Args:
+        model: Embedding model name the cached vectors belong to
+
+    Returns:
+        EmbeddingCache, or None if caching is disabled
+    """
+    if not settings.embedding_cache_enabled:
+        return None
+
+    return EmbeddingCache(
+        model=model,
+        max_memory_entries=settings.embedding_cache_memory_entries,
+        ttl_seconds=settings.embedding_cache_ttl_seconds,
+        max_db_entries=settings.embedding_cache_max_db_entries,
+        prune_interval_seconds=settings.embedding_cache_prune_interval_seconds,
+    )
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import random
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import ColumnElement, delete, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.metrics import EMBEDDING_JOBS, stage
+from src.models import Document, DocumentChunk, EmbeddingJob
+from src.rag.chunking import Chunk, chunk_text
+from src.rag.ingestion import chunk_rows, embed_chunks, split_document
+
+logger = logging.getLogger(__name__)
+
+# Values that make an existing job due again as a fresh job
+_RESET_JOB = {
+    "attempts": 0,
+    "run_after": func.now(),
+    "lease_id": None,
+    "locked_until": None,
+    "last_error": None,
+}
+
+
+async def enqueue_embedding(db: AsyncSession, document_ids: Sequence[UUID]) -> None:
+    """
+    Queue documents for (re-)embedding in the caller's transaction.
+
+    Args:
+        db: Database session (the caller commits)
+        document_ids: Documents to embed
+
+    Note:
+        A document already in the queue is reset to run immediately with a
+        fresh attempt count. Resetting the lease makes a worker that is
+        still processing an older version discard its result.
+    """
+    if not document_ids:
+        return
+
+    stmt = pg_insert(EmbeddingJob).values([{"document_id": document_id} for document_id in document_ids])
+    await db.execute(stmt.on_conflict_do_update(index_elements=[EmbeddingJob.document_id], set_=_RESET_JOB))
+
+
+async def enqueue_matching(db: AsyncSession, conditions: List[ColumnElement[bool]]) -> int:
+    """
+    Queue every document matching the conditions for re-embedding.
+
+    Args:
+        db: Database session (the caller commits)
+        conditions: Filter conditions on documents (empty for the whole corpus)
+
+    Returns:
+        Number of documents queued
+
+    Note:
+        Existing chunks stay searchable until each document's new chunks
+        replace them.
+    """
+    stmt = (
+        pg_insert(EmbeddingJob)
+        .from_select(["document_id"], select(Document.id).where(*conditions))
+        .on_conflict_do_update(index_elements=[EmbeddingJob.document_id], set_=_RESET_JOB)
+    )
+    result = await db.execute(stmt)
+    await db.execute(
+        update(Document)
+        .where(*conditions)
+        .values(embedding_status="pending", embedding_error=None, updated_at=Document.updated_at)
+    )
+    return result.rowcount
+
+
+class EmbeddingQueue:
+    """
+    Pool of background workers that drain the embedding_jobs table.
+
+    Each worker claims up to `batch_size` due jobs with
+    `SELECT ... FOR UPDATE SKIP LOCKED`, so any number of workers across
+    processes can share the queue. A claim sets a lease instead of holding
+    row locks, so no transaction or connection is kept open while the
+    provider is called; a job whose lease expires (e.g. its worker
+    crashed) is claimed again. Failed jobs are retried with exponential
+    backoff and the document is marked "failed" after `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        workers: int,
+        batch_size: int,
+        max_attempts: int,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+        lease_seconds: int,
+        poll_seconds: float,
+    ):
+        self.embeddings = embeddings
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        self._tasks = [asyncio.create_task(self._run(n)) for n in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks; claimed jobs are retried after their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers of this process after jobs were queued."""
+        self._wakeup.set()
+
+    async def _run(self, worker: int) -> None:
+        while True:
+            try:
+                handled = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Embedding worker {worker} failed: {e}")
+                handled = 0
+
+            if not handled:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        """
+        Claim, embed and store one batch of jobs.
+
+        Returns:
+            Number of jobs claimed (0 if the queue had no due jobs)
+        """
+        lease_id = uuid.uuid4()
+        claimed = await self._claim(lease_id)
+        if not claimed:
+            return 0
+
+        document_ids = list(claimed)
+        with stage("chunking", pipeline="ingest"):
+            chunked = await asyncio.to_thread(lambda: [split_document(claimed[i][0]) for i in document_ids])
+
+        # Unchanged chunks keep their stored vectors; only new or edited ones are embedded
+        reusable = await self._reusable_vectors(document_ids)
+        missing = [
+            [chunk for chunk in chunks if chunk.embedding_text not in reusable.get(document_id, {})]
+            for document_id, chunks in zip(document_ids, chunked)
+        ]
+
+        # First attempts share token-budgeted requests. Retries are embedded
+        # one document at a time so a document the provider rejects cannot
+        # keep failing the documents batched with it.
+        first = [n for n, document_id in enumerate(document_ids) if claimed[document_id][1] == 1]
+        embedded: List = [None] * len(document_ids)
+        with stage("embedding", pipeline="ingest"):
+            for n, result in zip(first, await embed_chunks(self.embeddings, [missing[n] for n in first])):
+                embedded[n] = result
+            for n, document_id in enumerate(document_ids):
+                if claimed[document_id][1] > 1:
+                    [embedded[n]] = await embed_chunks(self.embeddings, [missing[n]])
+
+        vectors = [
+            _merge_vectors(chunks, chunks_missing, result, reusable.get(document_id, {}))
+            for document_id, chunks, chunks_missing, result in zip(document_ids, chunked, missing, embedded)
+        ]
+
+        with stage("write", pipeline="ingest"):
+            async with AsyncSessionLocal() as db:
+                # Jobs re-queued or re-claimed since our claim are no longer ours
+                owned = {
+                    row.document_id: row.attempts
+                    for row in await db.execute(
+                        select(EmbeddingJob.document_id, EmbeddingJob.attempts)
+                        .where(EmbeddingJob.lease_id == lease_id)
+                        .with_for_update()
+                    )
+                }
+
+                succeeded = []
+                chunk_values = []
+                for document_id, chunks, document_vectors in zip(document_ids, chunked, vectors):
+                    if document_id not in owned:
+                        continue
+                    if isinstance(document_vectors, Exception):
+                        await self._fail(db, lease_id, document_id, owned[document_id], document_vectors)
+                        continue
+                    succeeded.append(document_id)
+                    chunk_values.extend(chunk_rows(document_id, chunks, document_vectors))
+
+                if succeeded:
+                    await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id.in_(succeeded)))
+                    if chunk_values:
+                        await db.execute(insert(DocumentChunk), chunk_values)
+                    await db.execute(
+                        update(Document)
+                        .where(Document.id.in_(succeeded))
+                        .values(embedding_status="ready", embedding_error=None, updated_at=Document.updated_at)
+                    )
+                    await db.execute(
+                        delete(EmbeddingJob)
+                        .where(EmbeddingJob.lease_id == lease_id)
+                        .where(EmbeddingJob.document_id.in_(succeeded))
+                    )
+                await db.commit()
+        EMBEDDING_JOBS.labels("ready").inc(len(succeeded))
+
+        reused = sum(len(chunks) - len(chunks_missing) for chunks, chunks_missing in zip(chunked, missing))
+        logger.info(
+            f"Embedded {len(succeeded)} of {len(document_ids)} queued documents "
+            f"(reused {reused} unchanged chunk vectors)"
+        )
+        return len(document_ids)
+
+    async def _reusable_vectors(self, document_ids: List[UUID]) -> Dict[UUID, Dict[str, np.ndarray]]:
+        """Map each document's current chunk texts to their vectors, if produced by the current model."""
+        reusable: Dict[UUID, Dict[str, np.ndarray]] = {}
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(
+                    DocumentChunk.document_id,
+                    DocumentChunk.heading,
+                    DocumentChunk.content,
+                    DocumentChunk.embedding,
+                )
+                .where(DocumentChunk.document_id.in_(document_ids))
+                .where(DocumentChunk.embedding_model == settings.embedding_model)
+                .where(DocumentChunk.embedding.is_not(None))
+            )
+            for row in rows:
+                reusable.setdefault(row.document_id, {})[chunk_text(row.heading, row.content)] = row.embedding
+        return reusable
+
+    async def _claim(self, lease_id: UUID) -> Dict[UUID, Tuple[str, int]]:
+        """Lease up to batch_size due jobs and return (content, attempt number) per document."""
+        due = (
+            select(EmbeddingJob.id)
+            .where(EmbeddingJob.run_after <= func.now())
+            .where(or_(EmbeddingJob.locked_until.is_(None), EmbeddingJob.locked_until < func.now()))
+            .order_by(EmbeddingJob.run_after)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            claimed = (
+                await db.execute(
+                    update(EmbeddingJob)
+                    .where(EmbeddingJob.id.in_(due.scalar_subquery()))
+                    .values(
+                        lease_id=lease_id,
+                        locked_until=func.now() + timedelta(seconds=self.lease_seconds),
+                        attempts=EmbeddingJob.attempts + 1,
+                    )
+                    .returning(EmbeddingJob.document_id, EmbeddingJob.attempts)
+                )
+            ).all()
+            contents = {}
+            if claimed:
+                rows = await db.execute(
+                    select(Document.id, Document.content).where(Document.id.in_([row.document_id for row in claimed]))
+                )
+                contents = {row.id: row.content for row in rows}
+            await db.commit()
+        # Documents deleted since they were queued have lost their job too
+        return {
+            document_id: (contents[document_id], attempts)
+            for document_id, attempts in claimed
+            if document_id in contents
+        }
+
+    async def _fail(self, db: AsyncSession, lease_id: UUID, document_id: UUID, attempts: int, error: Exception) -> None:
+        """Schedule a retry with backoff, or mark the document failed after max_attempts."""
+        job = (EmbeddingJob.lease_id == lease_id) & (EmbeddingJob.document_id == document_id)
+        if attempts >= self.max_attempts:
+            logger.warning(f"Embedding document {document_id} failed after {attempts} attempts: {error}")
+            EMBEDDING_JOBS.labels("failed").inc()
+            await db.execute(
+                update(Document)
+                .where(Document.id == document_id)
+                .values(embedding_status="failed", embedding_error=str(error), updated_at=Document.updated_at)
+            )
+            await db.execute(delete(EmbeddingJob).where(job))
+            return
+
+        EMBEDDING_JOBS.labels("retry").inc()
+        delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.backoff_max_seconds)
+        # Jitter spreads out retries of documents that failed together
+        delay *= random.uniform(0.5, 1.0)
+        await db.execute(
+            update(EmbeddingJob)
+            .where(job)
+            .values(
+                run_after=func.now() + timedelta(seconds=delay),
+                lease_id=None,
+                locked_until=None,
+                last_error=str(error),
+            )
+        )
+
+
+def _merge_vectors(
+    chunks: Sequence[Chunk],
+    missing: Sequence[Chunk],
+    embedded: Union[List[List[float]], Exception],
+    reusable: Dict[str, np.ndarray],
+) -> Union[List, Exception]:
+    """Combine freshly embedded and reused vectors in chunk order (or pass an error through)."""
+    if isinstance(embedded, Exception):
+        return embedded
+    fresh = {chunk.embedding_text: vector for chunk, vector in zip(missing, embedded)}
+    return [
+        reusable[chunk.embedding_text] if chunk.embedding_text in reusable else fresh[chunk.embedding_text]
+        for chunk in chunks
+    ]
+
+
+def get_embedding_queue(embeddings: Embeddings) -> Optional[EmbeddingQueue]:
+    """
+    Build the embedding worker pool configured in settings.
+
+    Args:
+        embeddings: Embeddings client used by the workers
+
+    Returns:
+        EmbeddingQueue, or None if settings.embedding_workers is 0 (jobs
+        are then left for workers in other processes)
+    """
+    if settings.embedding_workers <= 0:
+        return None
+
+    return EmbeddingQueue(
+        embeddings=embeddings,
+        workers=settings.embedding_workers,
+        batch_size=settings.embedding_job_batch_size,
+        max_attempts=settings.embedding_job_max_attempts,
+        backoff_seconds=settings.embedding_job_backoff_seconds,
+        backoff_max_seconds=settings.embedding_job_backoff_max_seconds,
+        lease_seconds=settings.embedding_job_lease_seconds,
+        poll_seconds=settings.embedding_worker_poll_seconds,
+    )
@@ -1,20 +1,87 @@
-from langchain_openai import OpenAIEmbeddings
+from typing import Optional, Type, TypeVar
+
+import httpx
+from langchain_core.embeddings import Embeddings
 
 from src.config import settings
+from src.rag.embedding_cache import CachedEmbeddings, get_embedding_cache
+from src.rag.fakes import FakeEmbeddings
+from src.rag.limits import LimitedEmbeddings, get_provider_limiter
+from src.rag.singleflight import CoalescedEmbeddings
+
+E = TypeVar("E", bound=Embeddings)
 
 
-def get_embeddings() -> OpenAIEmbeddings:
+def get_embeddings(
+    http_client: Optional[httpx.Client] = None,
+    http_async_client: Optional[httpx.AsyncClient] = None,
+) -> Embeddings:
     """
     Get OpenAI embeddings instance.
 
+    Args:
+        http_client: Shared sync HTTP connection pool (optional)
+        http_async_client: Shared async HTTP connection pool (optional)
+
+    Returns:
+        Embeddings: Configured embeddings instance (FakeEmbeddings when
+        settings.embedding_provider is "fake"), behind the "embeddings"
+        provider limiter, wrapped in CachedEmbeddings when the embedding
+        cache is enabled (cache hits never wait for the limiter) and in
+        CoalescedEmbeddings when embedding coalescing is enabled
+
+    Note:
+        Uses settings.embedding_model (default text-embedding-3-small), which
+        must produce 1536-dimensional vectors to match the database schema.
+        Fake vectors are cached under their own model name so they never
+        mix with real ones. With provider limits enabled the limiter owns
+        retries, so the OpenAI client's own retries are turned off.
+    """
+    limiter = get_provider_limiter("embeddings")
+    if settings.embedding_provider == "fake":
+        embeddings = FakeEmbeddings(latency_ms=settings.fake_embedding_latency_ms)
+        cache_model = "fake"
+    else:
+        # Imported on first use: the OpenAI SDK is slow to import and unused with fake providers
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(
+            api_key=settings.openai_api_key,
+            model=settings.embedding_model,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0 if limiter is not None else 2,
+        )
+        cache_model = settings.embedding_model
+    if limiter is not None:
+        embeddings = LimitedEmbeddings(embeddings, limiter)
+
+    cache = get_embedding_cache(cache_model)
+    if cache is not None:
+        embeddings = CachedEmbeddings(embeddings, cache)
+
+    if settings.embedding_coalescing_enabled:
+        embeddings = CoalescedEmbeddings(embeddings)
+    return embeddings
+
+
+def find_layer(embeddings: Embeddings, layer: Type[E]) -> Optional[E]:
+    """
+    Find one layer of the wrapper stack built by get_embeddings().
+
+    Args:
+        embeddings: Outermost embeddings (as returned by get_embeddings())
+        layer: Wrapper class to look for, e.g. CachedEmbeddings
+
     Returns:
-        OpenAIEmbeddings: Configured embeddings instance
+        The first wrapper of that class, or None if the stack has none
 
     Note:
-        Uses text-embedding-3-small model which produces 1536-dimensional vectors.
-        This matches the vector dimension defined in the database schema.
+        Every wrapper exposes the embeddings it wraps as `.embeddings`.
     """
-    return OpenAIEmbeddings(
-        api_key=settings.openai_api_key,
-        model="text-embedding-3-small",
-    )
+    current: Optional[Embeddings] = embeddings
+    while current is not None:
+        if isinstance(current, layer):
+            return current
+        current = getattr(current, "embeddings", None)
+    return None
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.rag.tokens import count_tokens
+
+# Latin words, and katakana/kanji runs split into character bigrams
+FEATURE_RE = re.compile(r"[0-9A-Za-z_]+|[\u30a0-\u30ff\u3400-\u4dbf\u4e00-\u9fff]+")
+# Hashed dimensions per feature; more spreads collisions across the vector
+FEATURE_HASHES = 4
+
+
+def _features(text: str) -> List[str]:
+    """Split text into the features hashed by FakeEmbeddings."""
+    features = []
+    for match in FEATURE_RE.findall(text.lower()):
+        if match.isascii():
+            features.append(match)
+        else:
+            features.extend(match[i:i + 2] for i in range(max(len(match) - 1, 1)))
+    return features
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for OpenAIEmbeddings.
+
+    Vectors are unit-normalized feature hashes of the text's words, so the
+    same text always gets the same vector and texts sharing words are
+    close in cosine distance, which keeps retrieval and recall
+    measurements meaningful without calling OpenAI.
+
+    Attributes:
+        dimensions: Vector size (must match the database schema)
+        latency_ms: Simulated round trip per embedding request
+    """
+
+    def __init__(self, dimensions: int = 1536, latency_ms: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        # Empty or symbol-only texts still get a stable, non-zero vector
+        for feature in _features(text) or [text]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4 * FEATURE_HASHES).digest()
+            for i in range(FEATURE_HASHES):
+                value = int.from_bytes(digest[4 * i:4 * i + 4], "little")
+                vector[value % self.dimensions] += 1.0 if value & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for ChatGoogleGenerativeAI.
+
+    The answer is built from the words of the last message, emitted one
+    token at a time after latency_ms, at tokens_per_second, and reports
+    usage_metadata like the real provider (input tokens are counted with
+    the local tokenizer).
+
+    Attributes:
+        latency_ms: Simulated time to first token
+        tokens_per_second: Simulated generation rate (0 = no delay)
+        output_tokens: Number of tokens per answer
+    """
+
+    latency_ms: float = 0.0
+    tokens_per_second: float = 0.0
+    output_tokens: int = 64
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        words = re.findall(r"\S+", messages[-1].text if messages else "") or ["fake"]
+        return [f"{words[i % len(words)]} " for i in range(self.output_tokens)]
+
+    def _usage(self, messages: List[BaseMessage]) -> UsageMetadata:
+        input_tokens = sum(count_tokens([message.text for message in messages]))
+        return UsageMetadata(
+            input_tokens=input_tokens,
+            output_tokens=self.output_tokens,
+            total_tokens=input_tokens + self.output_tokens,
+        )
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency_ms / 1000 + self._token_delay() * max(len(tokens) - 1, 0))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency_ms / 1000 + self._token_delay() * max(len(tokens) - 1, 0))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self._token_delay())
+            chunk = self._chunk(messages, token, last=i == len(tokens) - 1)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self._token_delay())
+            chunk = self._chunk(messages, token, last=i == len(tokens) - 1)
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _chunk(self, messages: List[BaseMessage], token: str, last: bool) -> ChatGenerationChunk:
+        # Usage is reported once, on the final chunk, as the Gemini client does
+        usage = self._usage(messages) if last else None
+        return ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from typing import List, Optional, Sequence, Union
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.models import Document, EmbeddingJob
+from src.rag.chunking import Chunk, split_markdown
+from src.rag.tokens import count_tokens
+from src.schemas import DocumentBatchItemResult, DocumentCreate
+
+logger = logging.getLogger(__name__)
+
+EmbeddingResult = Union[List[float], Exception]
+
+
+def group_by_token_budget(
+    token_counts: Sequence[int],
+    max_tokens: int,
+    max_items: int,
+) -> List[List[int]]:
+    """
+    Split item indices into consecutive groups bounded by tokens and count.
+
+    Args:
+        token_counts: Token count per item
+        max_tokens: Maximum total tokens per group
+        max_items: Maximum number of items per group
+
+    Returns:
+        List of index groups, each to be sent as one embedding request
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for index, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def embed_in_batches(
+    embeddings: Embeddings,
+    texts: Sequence[str],
+) -> List[EmbeddingResult]:
+    """
+    Embed texts with token-budgeted batches and bounded concurrency.
+
+    Args:
+        embeddings: Embeddings client
+        texts: Texts to embed
+
+    Returns:
+        One entry per text: the embedding vector, or the exception that
+        made its batch (or the text itself) fail
+    """
+    results: List[Optional[EmbeddingResult]] = [None] * len(texts)
+    token_counts = await asyncio.to_thread(count_tokens, texts)
+
+    embeddable = []
+    for index, tokens in enumerate(token_counts):
+        if tokens > settings.embedding_max_input_tokens:
+            results[index] = ValueError(
+                f"Content has {tokens} tokens, exceeding the embedding limit "
+                f"of {settings.embedding_max_input_tokens}"
+            )
+        else:
+            embeddable.append(index)
+
+    groups = group_by_token_budget(
+        [token_counts[index] for index in embeddable],
+        max_tokens=settings.embedding_batch_max_tokens,
+        max_items=settings.embedding_batch_max_items,
+    )
+    semaphore = asyncio.Semaphore(settings.embedding_concurrency)
+
+    async def _embed_group(group: List[int]) -> None:
+        indices = [embeddable[i] for i in group]
+        async with semaphore:
+            try:
+                vectors = await embeddings.aembed_documents([texts[i] for i in indices])
+            except Exception as e:
+                logger.warning(f"Embedding batch of {len(indices)} texts failed: {e}")
+                vectors = [e] * len(indices)
+        for index, vector in zip(indices, vectors):
+            results[index] = vector
+
+    await asyncio.gather(*(_embed_group(group) for group in groups))
+    return results
+
+
+def document_hash(content: str) -> str:
+    """
+    Hash document content for change detection.
+
+    Args:
+        content: Markdown content
+
+    Returns:
+        Hex sha256 of the exact content
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def split_document(content: str) -> List[Chunk]:
+    """
+    Split document content into chunks with the configured token window.
+
+    Args:
+        content: Markdown content
+
+    Returns:
+        List of chunks in document order
+    """
+    return split_markdown(content, settings.chunk_max_tokens, settings.chunk_overlap_tokens)
+
+
+def chunk_rows(
+    document_id: uuid.UUID,
+    chunks: Sequence[Chunk],
+    vectors: Sequence[List[float]],
+) -> List[dict]:
+    """
+    Build document_chunks insert parameters.
+
+    Args:
+        document_id: Parent document ID
+        chunks: Chunks of the document
+        vectors: Embedding per chunk (produced by settings.embedding_model)
+
+    Returns:
+        List of column-value mappings for insert(DocumentChunk)
+    """
+    return [
+        {
+            "id": uuid.uuid4(),
+            "document_id": document_id,
+            "chunk_index": chunk.index,
+            "heading": chunk.heading,
+            "content": chunk.content,
+            "token_count": chunk.token_count,
+            "embedding": vector,
+            "embedding_model": settings.embedding_model,
+        }
+        for chunk, vector in zip(chunks, vectors)
+    ]
+
+
+async def embed_chunks(
+    embeddings: Embeddings,
+    chunked: Sequence[Sequence[Chunk]],
+) -> List[Union[List[List[float]], Exception]]:
+    """
+    Embed the chunks of several documents in shared batches.
+
+    Args:
+        embeddings: Embeddings client
+        chunked: Chunks per document
+
+    Returns:
+        Per document: one vector per chunk, or the first error that
+        affected any of its chunks
+    """
+    flat = [chunk.embedding_text for chunks in chunked for chunk in chunks]
+    vectors = await embed_in_batches(embeddings, flat)
+
+    results: List[Union[List[List[float]], Exception]] = []
+    offset = 0
+    for chunks in chunked:
+        document_vectors = vectors[offset:offset + len(chunks)]
+        offset += len(chunks)
+        error = next((v for v in document_vectors if isinstance(v, Exception)), None)
+        results.append(error if error is not None else document_vectors)
+    return results
+
+
+async def ingest_documents(
+    db: AsyncSession,
+    documents: Sequence[DocumentCreate],
+    indices: Optional[Sequence[int]] = None,
+) -> List[DocumentBatchItemResult]:
+    """
+    Insert a batch of documents and queue them for embedding.
+
+    Args:
+        db: Database session
+        documents: Documents to create
+        indices: Index reported for each document (default: position in documents)
+
+    Returns:
+        Per-document result in input order
+
+    Note:
+        Rows are written per settings.ingest_insert_chunk_size documents
+        (one batched INSERT for documents and one for their embedding
+        jobs), each committed on its own so that a failing group does not
+        roll back the others. Chunking and embedding happen later in the
+        embedding workers (see src.rag.embedding_queue).
+    """
+    if indices is None:
+        indices = range(len(documents))
+    rows = [
+        (index, {
+            "id": uuid.uuid4(),
+            "content": document.content,
+            "content_hash": document_hash(document.content),
+            "doc_metadata": document.metadata,
+        })
+        for index, document in zip(indices, documents)
+    ]
+
+    results: List[DocumentBatchItemResult] = []
+    group_size = settings.ingest_insert_chunk_size
+    for start in range(0, len(rows), group_size):
+        group = rows[start:start + group_size]
+        try:
+            await db.execute(insert(Document), [values for _, values in group])
+            await db.execute(insert(EmbeddingJob), [{"document_id": values["id"]} for _, values in group])
+            await db.commit()
+            results.extend(
+                DocumentBatchItemResult(index=index, id=values["id"], status="created")
+                for index, values in group
+            )
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"Inserting {len(group)} documents failed: {e}")
+            results.extend(
+                DocumentBatchItemResult(index=index, status="failed", error=f"Insert failed: {e}")
+                for index, _ in group
+            )
+
+    return results
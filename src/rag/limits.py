@@ -0,0 +1,524 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from src.config import settings
+from src.metrics import PROVIDER_CIRCUIT_OPEN, PROVIDER_CONCURRENCY_LIMIT, PROVIDER_RETRIES, PROVIDER_SHED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Weight of the latest call in the moving average of call latency
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class ProviderOverloaded(Exception):
+    """
+    A provider call was shed instead of being queued or retried further.
+
+    Attributes:
+        provider: Limiter name ("embeddings" or "llm")
+        status_code: HTTP status to answer with: 429 when the provider (or
+            our rate limit) throttles, 503 when it is failing or our queue is full
+        retry_after: Seconds after which a retry is likely to be admitted
+    """
+
+    def __init__(self, provider: str, status_code: int, retry_after: float, reason: str):
+        super().__init__(f"{provider} provider overloaded ({reason}), retry after {retry_after:.0f}s")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Read the HTTP status of a provider SDK or httpx error, if it has one."""
+    for candidate in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "code"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Read a Retry-After header (seconds) from a provider error response."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a provider error is worth retrying.
+
+    Returns:
+        True for 408, 429 and 5xx responses, and for timeouts and
+        connection errors that carry no status
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class TokenBucket:
+    """
+    Requests-per-second limiter.
+
+    Tokens refill continuously at `rate` up to `burst`. A caller that finds
+    the bucket empty reserves the next token and sleeps until it is due,
+    so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    def take(self, cost: float = 1) -> float:
+        """
+        Take `cost` tokens if they are available, without waiting.
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they will be
+            available (nothing is taken); math.inf if `cost` exceeds `burst`
+            and can never be taken
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if cost > self.burst:
+            return math.inf
+        if self._tokens >= cost:
+            self._tokens -= cost
+            return 0.0
+        return (cost - self._tokens) / self.rate
+
+    def wait_time(self) -> float:
+        """Seconds until a token reserved now would be due."""
+        tokens = min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+
+
+class ProviderLimiter:
+    """
+    Admission control for one upstream provider.
+
+    Every call goes through, in order:
+    1. A circuit breaker: after `failure_threshold` consecutive failed calls
+       (5xx, timeouts, connection errors) calls are shed for
+       `reset_seconds`, then a single probe decides whether to close it again
+    2. An optional token bucket (`requests_per_second`)
+    3. An adaptive concurrency limit (AIMD): it grows by one after `limit`
+       successful calls and halves whenever the provider throttles (429)
+       or times out, between `min_concurrency` and `max_concurrency`
+    4. A bounded FIFO wait queue (`max_queue`)
+
+    A call that cannot be started before its deadline, or would wait in a
+    full queue, is shed at once with ProviderOverloaded rather than
+    piling up. Retryable failures are retried up to `max_retries` times
+    with full-jitter exponential backoff (or the provider's Retry-After),
+    as long as the deadline allows; retries go through admission again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        min_concurrency: int,
+        requests_per_second: float,
+        max_queue: int,
+        deadline_seconds: float,
+        max_retries: int,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+        failure_threshold: int,
+        reset_seconds: float,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_queue = max_queue
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second > 0 else None
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latency: Optional[float] = None
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        PROVIDER_CONCURRENCY_LIMIT.labels(name).set(self.limit)
+        PROVIDER_CIRCUIT_OPEN.labels(name).set(0)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """
+        Run one provider call under admission control.
+
+        Args:
+            fn: Starts the call (invoked again for each retry)
+            deadline: time.monotonic() by which the call must have started
+                (default: now + deadline_seconds)
+
+        Returns:
+            The call's result
+
+        Raises:
+            ProviderOverloaded: If the call was shed, or retryable failures
+                persisted until retries or the deadline ran out
+            Exception: Non-retryable provider errors, unchanged
+        """
+        deadline = deadline or time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            await self._admit(deadline)
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                self._release()
+                delay = self._on_failure(e, attempt, deadline)
+            except BaseException:
+                # Cancelled: the call tells nothing about the provider
+                self._release()
+                self._probing = False
+                raise
+            else:
+                self._release()
+                self._on_success(time.monotonic() - started)
+                return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]], deadline: Optional[float] = None) -> AsyncIterator[T]:
+        """
+        Run one streaming provider call under admission control.
+
+        Args:
+            open_stream: Starts the stream (invoked again for each retry)
+            deadline: time.monotonic() by which the call must have started
+                (default: now + deadline_seconds)
+
+        Yields:
+            The stream's items
+
+        Note:
+            The concurrency slot is held until the stream ends. A failure is
+            only retried before the first item; after that it is raised.
+        """
+        deadline = deadline or time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            await self._admit(deadline)
+            started = time.monotonic()
+            started_streaming = False
+            released = False
+            try:
+                async for item in open_stream():
+                    started_streaming = True
+                    yield item
+            except Exception as e:
+                self._release()
+                released = True
+                if started_streaming:
+                    self._record_failure(e)
+                    raise
+                delay = self._on_failure(e, attempt, deadline)
+            else:
+                self._release()
+                released = True
+                self._on_success(time.monotonic() - started)
+                return
+            finally:
+                # The consumer stopped iterating (GeneratorExit) or was cancelled
+                if not released:
+                    self._release()
+                    if started_streaming:
+                        self._on_success(time.monotonic() - started)
+                    else:
+                        self._probing = False
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _shed(self, status_code: int, retry_after: float, reason: str) -> ProviderOverloaded:
+        PROVIDER_SHED.labels(self.name, reason).inc()
+        return ProviderOverloaded(self.name, status_code, max(1.0, retry_after), reason)
+
+    async def _admit(self, deadline: float) -> None:
+        """Pass the circuit breaker, rate limit and concurrency limit, or raise ProviderOverloaded."""
+        now = time.monotonic()
+        if self._open_until > now:
+            raise self._shed(503, self._open_until - now, "circuit_open")
+        if self._open_until:
+            # Half-open: only one probe call may run until it reports back
+            if self._probing:
+                raise self._shed(503, self.reset_seconds, "circuit_open")
+            self._probing = True
+
+        try:
+            await self._acquire(deadline)
+        except BaseException:
+            self._probing = False
+            raise
+
+    async def _acquire(self, deadline: float) -> None:
+        """Wait for a rate limit token and a concurrency slot, shedding if the deadline cannot be met."""
+        if self.bucket is not None:
+            wait = self.bucket.wait_time()
+            if time.monotonic() + wait > deadline:
+                raise self._shed(429, wait, "rate_limited")
+            await asyncio.sleep(self.bucket.reserve())
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed(503, self._expected_wait(), "queue_full")
+        expected = self._expected_wait()
+        if time.monotonic() + expected > deadline:
+            raise self._shed(503, expected, "deadline")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout_at(loop.time() + deadline - time.monotonic()):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up
+                self._release()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(e, TimeoutError):
+                raise self._shed(503, self._expected_wait(), "deadline") from None
+            raise
+
+    def _expected_wait(self) -> float:
+        """Estimate how long a newly queued call would wait for a slot (0 until a call has completed)."""
+        if self._latency is None:
+            return 0.0
+        return self._latency * (len(self._waiters) + 1) / max(int(self.limit), 1)
+
+    def _release(self) -> None:
+        """Free a concurrency slot and hand it to the next waiter."""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters, as far as the current limit allows."""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _set_limit(self, limit: float) -> None:
+        self.limit = min(float(self.max_concurrency), max(float(self.min_concurrency), limit))
+        PROVIDER_CONCURRENCY_LIMIT.labels(self.name).set(int(self.limit))
+
+    def _on_success(self, latency: float) -> None:
+        self._latency = latency if self._latency is None else (
+            LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self._latency
+        )
+        # Additive increase: +1 after a full window of successful calls
+        self._set_limit(self.limit + 1 / self.limit)
+        self._close_circuit()
+        # A raised limit may admit waiters
+        self._wake()
+
+    def _close_circuit(self) -> None:
+        self._failures = 0
+        if self._open_until:
+            logger.info(f"{self.name} provider recovered, closing circuit")
+        self._open_until = 0.0
+        self._probing = False
+        PROVIDER_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def _record_failure(self, error: Exception) -> None:
+        """Adapt the limit and the circuit breaker to a failed call."""
+        status = _status_code(error)
+        if status in (408, 429) or (status is None and is_retryable(error)):
+            # Multiplicative decrease when the provider pushes back or is slow
+            self._set_limit(self.limit / 2)
+        if not is_retryable(error) or status == 429:
+            # The provider answered (e.g. 400, or throttling us): it is up
+            self._close_circuit()
+            return
+
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            logger.warning(f"{self.name} provider failing ({error}), opening circuit for {self.reset_seconds}s")
+            self._open_until = time.monotonic() + self.reset_seconds
+            self._probing = False
+            PROVIDER_CIRCUIT_OPEN.labels(self.name).set(1)
+
+    def _on_failure(self, error: Exception, attempt: int, deadline: float) -> float:
+        """
+        Record a failed call and decide whether to retry it.
+
+        Returns:
+            Seconds to wait before the retry
+
+        Raises:
+            Exception: The error itself if it is not retryable
+            ProviderOverloaded: If retries or the deadline are exhausted
+        """
+        self._record_failure(error)
+        if not is_retryable(error):
+            raise error
+
+        status = _status_code(error)
+        delay = _retry_after(error)
+        if delay is None:
+            # Full jitter keeps retries of calls that failed together apart
+            delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_seconds * 2 ** attempt))
+        if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+            raise self._shed(429 if status == 429 else 503, delay, "retries_exhausted") from error
+
+        PROVIDER_RETRIES.labels(self.name).inc()
+        logger.info(f"Retrying {self.name} call in {delay:.2f}s after: {error}")
+        return delay
+
+
+class LimitedEmbeddings(Embeddings):
+    """
+    Embeddings client whose async calls go through a ProviderLimiter.
+
+    Sync calls are passed through unchanged (the request path is async).
+    """
+
+    def __init__(self, embeddings: Embeddings, limiter: ProviderLimiter):
+        self.embeddings = embeddings
+        self.limiter = limiter
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.limiter.call(lambda: self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.limiter.call(lambda: self.embeddings.aembed_query(text))
+
+
+class LimitedChatModel(BaseChatModel):
+    """
+    Chat model whose async generations and streams go through a ProviderLimiter.
+
+    Attributes:
+        model: Wrapped chat model
+        limiter: Limiter of the model's provider
+    """
+
+    model: BaseChatModel
+    limiter: ProviderLimiter
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self.limiter.call(
+            lambda: self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.limiter.stream(
+            lambda: self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        ):
+            yield chunk
+
+
+# Process-wide limiters, one per provider
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_provider_limiter(name: str) -> Optional[ProviderLimiter]:
+    """
+    Get the process-wide limiter of a provider configured in settings.
+
+    Args:
+        name: "embeddings" or "llm"
+
+    Returns:
+        ProviderLimiter shared by all clients of the provider, or None if
+        provider limits are disabled
+    """
+    if not settings.provider_limits_enabled:
+        return None
+
+    if name not in _limiters:
+        _limiters[name] = ProviderLimiter(
+            name=name,
+            max_concurrency=getattr(settings, f"{name}_max_concurrency"),
+            min_concurrency=settings.provider_min_concurrency,
+            requests_per_second=getattr(settings, f"{name}_requests_per_second"),
+            max_queue=settings.provider_max_queue,
+            deadline_seconds=settings.provider_deadline_seconds,
+            max_retries=settings.provider_max_retries,
+            backoff_seconds=settings.provider_retry_backoff_seconds,
+            backoff_max_seconds=settings.provider_retry_backoff_max_seconds,
+            failure_threshold=settings.provider_circuit_failure_threshold,
+            reset_seconds=settings.provider_circuit_reset_seconds,
+        )
+    return _limiters[name]
@@ -1,21 +1,43 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models import BaseChatModel
 
 from src.config import settings
+from src.rag.fakes import FakeChatModel
+from src.rag.limits import LimitedChatModel, get_provider_limiter
 
 
-def get_llm() -> ChatGoogleGenerativeAI:
+def get_llm() -> BaseChatModel:
     """
     Get Google Gemini LLM instance.
 
     Returns:
-        ChatGoogleGenerativeAI: Configured Gemini 2.5 Pro instance
+        BaseChatModel: Configured Gemini 2.5 Pro instance, or FakeChatModel
+        when settings.llm_provider is "fake", behind the "llm" provider
+        limiter when provider limits are enabled
 
     Note:
         Uses gemini-2.5-pro-preview-03-25 model for high-quality responses.
+        With provider limits enabled the limiter owns retries, so the
+        Gemini client's own retries are turned off.
     """
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro-preview-03-25",
-        google_api_key=settings.google_api_key,
-        temperature=0.1,
-        max_output_tokens=2048,
-    )
+    limiter = get_provider_limiter("llm")
+    if settings.llm_provider == "fake":
+        llm = FakeChatModel(
+            latency_ms=settings.fake_llm_latency_ms,
+            tokens_per_second=settings.fake_llm_tokens_per_second,
+            output_tokens=settings.fake_llm_output_tokens,
+        )
+    else:
+        # Imported on first use: the Gemini SDK is slow to import and unused with fake providers
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-pro-preview-03-25",
+            google_api_key=settings.google_api_key,
+            temperature=0.1,
+            max_output_tokens=2048,
+            max_retries=0 if limiter is not None else 6,
+        )
+
+    if limiter is None:
+        return llm
+    return LimitedChatModel(model=llm, limiter=limiter)
@@ -0,0 +1,635 @@
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+import asyncpg
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.metrics import MEMORY_INDEX_READY, MEMORY_INDEX_REFRESHED, MEMORY_INDEX_ROWS
+from src.models import DOCUMENT_CHANGES_CHANNEL, Document, DocumentChunk
+from src.rag.vector_index import EMBEDDING_DIMENSIONS
+from src.rag.vector_store import RetrievalMode, SearchResult
+from src.schemas import MetadataFilter
+
+logger = logging.getLogger(__name__)
+
+# (updated_at, latest chunk created_at, chunk count): changes whenever a
+# document's metadata is edited or its chunks are replaced
+DocumentVersion = Tuple[datetime, datetime, int]
+
+# Documents loaded per query while building or catching up
+_FETCH_BATCH = 500
+# Query vectors scored per matrix product (bounds the score matrix)
+_QUERY_BATCH = 32
+# Filters whose row masks are kept per state
+_FILTER_MASKS = 64
+# Appended rows (and dead rows) tolerated before compaction
+_COMPACT_MIN_ROWS = 10000
+_COMPACT_RATIO = 0.1
+
+_SNAPSHOT_ROWS = "rows.pkl"
+_SNAPSHOT_LOCK = "lock"
+
+
+@dataclass(frozen=True)
+class _Document:
+    id: UUID
+    metadata: Dict[str, Any]
+    created_at: datetime
+    updated_at: datetime
+    version: DocumentVersion
+
+
+@dataclass
+class _Rows:
+    """Embedded chunks of some documents as loaded from Postgres, grouped by document."""
+
+    documents: List[_Document] = field(default_factory=list)
+    ranges: List[Tuple[int, int]] = field(default_factory=list)
+    chunk_index: List[int] = field(default_factory=list)
+    headings: List[Optional[str]] = field(default_factory=list)
+    contents: List[str] = field(default_factory=list)
+    vectors: List[np.ndarray] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class _State:
+    """
+    Contents of the index. Updates build a new state instead of mutating
+    this one, so searches running in threads never see a partial change.
+
+    Rows of `base` (the memory-mapped snapshot, if any) come first, then
+    rows of `extra` (appended since). Rows of removed or reloaded
+    documents stay in place with alive=False until the next compaction.
+    headings and contents are shared with later states and only appended to.
+    """
+
+    base: np.ndarray
+    extra: np.ndarray
+    alive: np.ndarray
+    row_document: np.ndarray
+    chunk_index: np.ndarray
+    headings: List[Optional[str]]
+    contents: List[str]
+    documents: List[Optional[_Document]]
+    ordinals: Dict[UUID, int]
+    rows: Dict[UUID, np.ndarray]
+    masks: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.alive)
+
+    def vector(self, row: int) -> np.ndarray:
+        return self.base[row] if row < len(self.base) else self.extra[row - len(self.base)]
+
+
+def _empty_vectors() -> np.ndarray:
+    return np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+
+def _make_state(
+    vectors: np.ndarray,
+    row_document: np.ndarray,
+    chunk_index: np.ndarray,
+    headings: List[Optional[str]],
+    contents: List[str],
+    documents: List[_Document],
+) -> _State:
+    """Build a compact state (no dead rows, nothing appended)."""
+    order = np.argsort(row_document, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(row_document[order])) + 1) if len(order) else []
+    return _State(
+        base=vectors,
+        extra=_empty_vectors(),
+        alive=np.ones(len(row_document), dtype=bool),
+        row_document=row_document,
+        chunk_index=chunk_index,
+        headings=headings,
+        contents=contents,
+        documents=list(documents),
+        ordinals={document.id: ordinal for ordinal, document in enumerate(documents)},
+        rows={documents[int(row_document[group[0]])].id: group for group in groups},
+    )
+
+
+def _apply(state: _State, loaded: _Rows, removed: Iterable[UUID]) -> _State:
+    """Return a new state with `removed` and the documents of `loaded` dropped, then `loaded` appended."""
+    alive = state.alive.copy()
+    documents = list(state.documents)
+    ordinals = dict(state.ordinals)
+    rows = dict(state.rows)
+    for document_id in {*removed, *(document.id for document in loaded.documents)}:
+        old_rows = rows.pop(document_id, None)
+        if old_rows is not None:
+            alive[old_rows] = False
+        ordinal = ordinals.pop(document_id, None)
+        if ordinal is not None:
+            documents[ordinal] = None
+
+    start = state.size
+    row_document = np.empty(len(loaded.chunk_index), dtype=np.int64)
+    for document, (first, last) in zip(loaded.documents, loaded.ranges):
+        ordinals[document.id] = len(documents)
+        row_document[first:last] = len(documents)
+        rows[document.id] = np.arange(start + first, start + last)
+        documents.append(document)
+
+    state.headings.extend(loaded.headings)
+    state.contents.extend(loaded.contents)
+    vectors = np.stack(loaded.vectors) if loaded.vectors else _empty_vectors()
+    return _State(
+        base=state.base,
+        extra=np.concatenate([state.extra, vectors]),
+        alive=np.concatenate([alive, np.ones(len(row_document), dtype=bool)]),
+        row_document=np.concatenate([state.row_document, row_document]),
+        chunk_index=np.concatenate([state.chunk_index, np.asarray(loaded.chunk_index, dtype=np.int32)]),
+        headings=state.headings,
+        contents=state.contents,
+        documents=documents,
+        ordinals=ordinals,
+        rows=rows,
+    )
+
+
+def _compacted(state: _State) -> _State:
+    """Copy the live rows into a single in-memory matrix."""
+    keep = np.flatnonzero(state.alive)
+    split = len(state.base)
+    vectors = np.concatenate([state.base[keep[keep < split]], state.extra[keep[keep >= split] - split]])
+    live, row_document = np.unique(state.row_document[keep], return_inverse=True)
+    return _make_state(
+        vectors=vectors,
+        row_document=row_document,
+        chunk_index=state.chunk_index[keep],
+        headings=[state.headings[row] for row in keep],
+        contents=[state.contents[row] for row in keep],
+        documents=[state.documents[ordinal] for ordinal in live],
+    )
+
+
+def _empty_state() -> _State:
+    return _make_state(_empty_vectors(), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), [], [], [])
+
+
+def _needs_compaction(state: _State) -> bool:
+    stale = len(state.extra) + int(state.size - state.alive.sum())
+    return stale > max(_COMPACT_MIN_ROWS, _COMPACT_RATIO * state.size)
+
+
+def _write_snapshot(state: _State, path: str) -> None:
+    """Write a compacted state (see _compacted) to the snapshot directory, replacing the previous snapshot atomically."""
+    os.makedirs(path, exist_ok=True)
+    vectors_file = f"vectors-{uuid.uuid4().hex}.npy"
+    np.save(os.path.join(path, vectors_file), state.base)
+    rows = {
+        "embedding_model": settings.embedding_model,
+        "vectors": vectors_file,
+        "row_document": state.row_document,
+        "chunk_index": state.chunk_index,
+        "headings": state.headings,
+        "contents": state.contents,
+        "documents": state.documents,
+    }
+    temporary = os.path.join(path, f"{_SNAPSHOT_ROWS}.{os.getpid()}")
+    with open(temporary, "wb") as f:
+        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, os.path.join(path, _SNAPSHOT_ROWS))
+
+    # Workers still mapping an older file keep it until they unmap it
+    for name in os.listdir(path):
+        if name.startswith("vectors-") and name != vectors_file:
+            os.unlink(os.path.join(path, name))
+
+
+def _read_snapshot(path: str) -> Optional[_State]:
+    """Load the snapshot with its vectors memory-mapped, or None if missing or for another model."""
+    try:
+        with open(os.path.join(path, _SNAPSHOT_ROWS), "rb") as f:
+            rows = pickle.load(f)
+        if rows["embedding_model"] != settings.embedding_model:
+            return None
+        vectors = np.load(os.path.join(path, rows["vectors"]), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    return _make_state(
+        vectors=vectors,
+        row_document=rows["row_document"],
+        chunk_index=rows["chunk_index"],
+        headings=rows["headings"],
+        contents=rows["contents"],
+        documents=rows["documents"],
+    )
+
+
+def _lock_snapshot(path: str) -> int:
+    """Take the snapshot directory's lock (blocks while another worker holds it)."""
+    os.makedirs(path, exist_ok=True)
+    fd = os.open(os.path.join(path, _SNAPSHOT_LOCK), os.O_CREAT | os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+def _unlock_snapshot(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _jsonb_contains(value: Any, contained: Any) -> bool:
+    """Python equivalent of Postgres `value @> contained` for JSON values."""
+    if isinstance(contained, dict):
+        return isinstance(value, dict) and all(
+            key in value and _jsonb_contains(value[key], item) for key, item in contained.items()
+        )
+    if isinstance(contained, list):
+        return isinstance(value, list) and all(
+            any(_jsonb_contains(element, item) for element in value) for item in contained
+        )
+    if isinstance(value, bool) or isinstance(contained, bool):
+        return value is contained
+    return not isinstance(value, (dict, list)) and value == contained
+
+
+def _aware(moment: datetime) -> datetime:
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def _matches(document: Optional[_Document], metadata_filter: MetadataFilter) -> bool:
+    """Evaluate a metadata filter like filter_conditions() does in SQL."""
+    if document is None:
+        return False
+    contained: Dict[str, Any] = dict(metadata_filter.equals or {})
+    if metadata_filter.tags:
+        contained["tags"] = metadata_filter.tags
+    if contained and not _jsonb_contains(document.metadata, contained):
+        return False
+    if metadata_filter.created_after is not None and document.created_at < _aware(metadata_filter.created_after):
+        return False
+    if metadata_filter.created_before is not None and document.created_at >= _aware(metadata_filter.created_before):
+        return False
+    return True
+
+
+def _mask(state: _State, metadata_filter: Optional[MetadataFilter]) -> np.ndarray:
+    """Rows that are alive and belong to documents matching the filter."""
+    if metadata_filter is None:
+        return state.alive
+    key = metadata_filter.model_dump_json()
+    mask = state.masks.get(key)
+    if mask is None:
+        matches = np.fromiter(
+            (_matches(document, metadata_filter) for document in state.documents),
+            dtype=bool,
+            count=len(state.documents),
+        )
+        mask = state.alive & matches[state.row_document]
+        if len(state.masks) >= _FILTER_MASKS:
+            state.masks.clear()
+        state.masks[key] = mask
+    return mask
+
+
+def _top_k(
+    state: _State,
+    queries: np.ndarray,
+    k: int,
+    metadata_filter: Optional[MetadataFilter],
+) -> List[List[Tuple[int, float]]]:
+    """Exact cosine top k rows per unit-normalized query vector, as (row, similarity)."""
+    mask = _mask(state, metadata_filter)
+    candidates = np.flatnonzero(mask)
+    limit = min(k, len(candidates))
+    if limit == 0:
+        return [[] for _ in queries]
+
+    # Selective filters score only the matching rows instead of the whole matrix
+    selective = len(candidates) * 4 < state.size
+    if selective:
+        split = len(state.base)
+        matrix = np.concatenate([
+            state.base[candidates[candidates < split]],
+            state.extra[candidates[candidates >= split] - split],
+        ])
+
+    results = []
+    for start in range(0, len(queries), _QUERY_BATCH):
+        block = queries[start:start + _QUERY_BATCH]
+        if selective:
+            scores = block @ matrix.T
+        else:
+            scores = np.concatenate([block @ state.base.T, block @ state.extra.T], axis=1)
+            scores[:, ~mask] = -np.inf
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        for query_scores, query_top in zip(scores, top):
+            query_top = query_top[np.argsort(-query_scores[query_top], kind="stable")]
+            rows = candidates[query_top] if selective else query_top
+            results.append([(int(row), float(query_scores[i])) for row, i in zip(rows, query_top)])
+    return results
+
+
+async def _current_versions() -> Dict[UUID, DocumentVersion]:
+    """Version of every document that has embedded chunks."""
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(Document.id, Document.updated_at, func.max(DocumentChunk.created_at), func.count())
+            .join(DocumentChunk, DocumentChunk.document_id == Document.id)
+            .where(DocumentChunk.embedding.is_not(None))
+            .group_by(Document.id)
+        )
+        return {document_id: (updated_at, chunks_at, count) for document_id, updated_at, chunks_at, count in rows}
+
+
+async def _load_documents(document_ids: List[UUID]) -> _Rows:
+    """Load the embedded chunks of some documents, normalizing their vectors."""
+    loaded = _Rows()
+    for start in range(0, len(document_ids), _FETCH_BATCH):
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(
+                    Document.id,
+                    Document.doc_metadata,
+                    Document.created_at,
+                    Document.updated_at,
+                    DocumentChunk.chunk_index,
+                    DocumentChunk.heading,
+                    DocumentChunk.content,
+                    DocumentChunk.embedding,
+                    DocumentChunk.created_at.label("chunk_created_at"),
+                )
+                .join(Document, Document.id == DocumentChunk.document_id)
+                .where(DocumentChunk.document_id.in_(document_ids[start:start + _FETCH_BATCH]))
+                .where(DocumentChunk.embedding.is_not(None))
+                .order_by(DocumentChunk.document_id, DocumentChunk.chunk_index)
+            )
+            grouped: Dict[UUID, List[Any]] = {}
+            for row in rows:
+                grouped.setdefault(row.id, []).append(row)
+
+        for document_id, chunks in grouped.items():
+            first = chunks[0]
+            loaded.documents.append(_Document(
+                id=document_id,
+                metadata=first.doc_metadata or {},
+                created_at=first.created_at,
+                updated_at=first.updated_at,
+                version=(first.updated_at, max(chunk.chunk_created_at for chunk in chunks), len(chunks)),
+            ))
+            offset = len(loaded.chunk_index)
+            loaded.ranges.append((offset, offset + len(chunks)))
+            for chunk in chunks:
+                vector = np.asarray(chunk.embedding, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                loaded.chunk_index.append(chunk.chunk_index)
+                loaded.headings.append(chunk.heading)
+                loaded.contents.append(chunk.content)
+                loaded.vectors.append(vector / norm if norm else vector)
+    return loaded
+
+
+class MemoryVectorIndex:
+    """
+    In-process exact vector index over all embedded chunks.
+
+    Holds every chunk vector (unit-normalized) in a NumPy matrix and
+    answers vector-mode retrieval with a matrix product, so vector search
+    needs no database round-trip and scales with API workers. Hybrid
+    retrieval still goes to Postgres.
+
+    The index follows the database through LISTEN on
+    DOCUMENT_CHANGES_CHANNEL (published by triggers, see src.models):
+    changed documents are reloaded after a short delay that batches
+    bursts. Whenever the listener connects, all document versions are
+    compared with the index to catch up on changes it may have missed;
+    until then, and while disconnected, `serves()` is False and
+    retrieval falls back to Postgres.
+
+    With a snapshot directory, the first worker to start builds the index
+    and saves it; the others (and later restarts) memory-map the saved
+    matrix, so workers on a host share its pages, and only catch up on
+    changes since. Updates are held per worker until enough accumulate to
+    compact, which rewrites the snapshot.
+    """
+
+    def __init__(self, snapshot_path: Optional[str], refresh_delay_seconds: float, keepalive_seconds: float):
+        self.snapshot_path = snapshot_path or None
+        self.refresh_delay_seconds = refresh_delay_seconds
+        self.keepalive_seconds = keepalive_seconds
+
+        self.ready = False
+        self._state: Optional[_State] = None
+        self._pending: Set[UUID] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start loading and following the database on the running event loop."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop following the database."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._set_ready(False)
+
+    def serves(self, mode: Optional[RetrievalMode]) -> bool:
+        """Whether a retrieval in this mode can be answered from memory right now."""
+        return self.ready and (mode or settings.retrieval_mode) == "vector"
+
+    async def search(
+        self,
+        query_vectors: List[List[float]],
+        k: int = 5,
+        metadata_filter: Optional[MetadataFilter] = None,
+        with_embeddings: bool = False,
+    ) -> List[List[SearchResult]]:
+        """
+        Find the k chunks nearest to each query vector.
+
+        Args:
+            query_vectors: Query embeddings
+            k: Number of chunks per query (default: 5)
+            metadata_filter: Only search chunks of matching documents (optional)
+            with_embeddings: Also return each chunk's (unit-normalized) embedding
+
+        Returns:
+            One list of SearchResult per query, by descending cosine similarity
+
+        Note:
+            The search is exact; ef_search does not apply. The matrix
+            product runs in a thread, off the event loop.
+        """
+        state = self._state
+        if state is None:
+            raise RuntimeError("In-process vector index is not loaded")
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        hits = await asyncio.to_thread(_top_k, state, queries, k, metadata_filter)
+        return [[self._result(state, row, score, with_embeddings) for row, score in query_hits] for query_hits in hits]
+
+    @staticmethod
+    def _result(state: _State, row: int, score: float, with_embeddings: bool) -> SearchResult:
+        document = state.documents[state.row_document[row]]
+        return SearchResult(
+            id=document.id,
+            chunk_index=int(state.chunk_index[row]),
+            heading=state.headings[row],
+            content=state.contents[row],
+            metadata=document.metadata,
+            updated_at=document.updated_at,
+            score=score,
+            embedding=np.array(state.vector(row)) if with_embeddings else None,
+        )
+
+    def _set_state(self, state: _State) -> None:
+        self._state = state
+        MEMORY_INDEX_ROWS.set(int(state.alive.sum()))
+
+    def _set_ready(self, ready: bool) -> None:
+        self.ready = ready
+        MEMORY_INDEX_READY.set(1 if ready else 0)
+
+    def _on_change(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            self._pending.add(UUID(payload))
+        except ValueError:
+            return
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"In-process vector index lost sync, falling back to Postgres: {e}")
+            self._set_ready(False)
+            await asyncio.sleep(self.keepalive_seconds)
+
+    async def _follow(self) -> None:
+        """Listen for changes, catch up, then apply changes until the connection fails."""
+        url = make_url(settings.memory_index_database_url or settings.database_url).set(drivername="postgresql")
+        connection = await asyncpg.connect(url.render_as_string(hide_password=False))
+        try:
+            connection.add_termination_listener(lambda _: self._wakeup.set())
+            # Listen first, so that nothing changed during the catch-up is missed
+            await connection.add_listener(DOCUMENT_CHANGES_CHANNEL, self._on_change)
+            if self._state is None:
+                await self._load()
+            else:
+                self._pending.clear()
+                await self._catch_up()
+                await self._maybe_compact()
+            self._set_ready(True)
+            logger.info(f"In-process vector index ready ({int(self._state.alive.sum())} chunks)")
+
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    await connection.execute("SELECT 1")
+                if connection.is_closed():
+                    raise ConnectionError("listener connection closed")
+                if self._pending:
+                    await asyncio.sleep(self.refresh_delay_seconds)
+                self._wakeup.clear()
+                pending, self._pending = self._pending, set()
+                if pending:
+                    await self._refresh(list(pending))
+                    await self._maybe_compact()
+        finally:
+            if not connection.is_closed():
+                await connection.close()
+
+    async def _load(self) -> None:
+        """Load (or build and save) the snapshot, then catch up with the database."""
+        if self.snapshot_path is None:
+            self._set_state(_empty_state())
+            await self._catch_up()
+            await self._maybe_compact()
+            return
+
+        # One worker builds or refreshes the snapshot while the others wait, then map it
+        lock = await asyncio.to_thread(_lock_snapshot, self.snapshot_path)
+        try:
+            state = await asyncio.to_thread(_read_snapshot, self.snapshot_path)
+            self._set_state(state if state is not None else _empty_state())
+            await self._catch_up()
+            if state is None or _needs_compaction(self._state):
+                await self._compact()
+        finally:
+            await asyncio.to_thread(_unlock_snapshot, lock)
+
+    async def _catch_up(self) -> None:
+        """Reload every document whose version differs from the database and drop deleted ones."""
+        versions = await _current_versions()
+        state = self._state
+        removed = [document_id for document_id in state.ordinals if document_id not in versions]
+        stale = [
+            document_id
+            for document_id, version in versions.items()
+            if document_id not in state.ordinals or state.documents[state.ordinals[document_id]].version != version
+        ]
+        if removed or stale:
+            logger.info(f"In-process vector index catching up: {len(stale)} changed, {len(removed)} removed documents")
+            await self._refresh(stale, removed)
+
+    async def _refresh(self, document_ids: List[UUID], removed: Iterable[UUID] = ()) -> None:
+        """Reload documents (those that no longer have embedded chunks are removed)."""
+        loaded = await _load_documents(document_ids)
+        found = {document.id for document in loaded.documents}
+        gone = {*removed, *(document_id for document_id in document_ids if document_id not in found)}
+        self._set_state(await asyncio.to_thread(_apply, self._state, loaded, gone))
+        MEMORY_INDEX_REFRESHED.inc(len(document_ids))
+
+    async def _maybe_compact(self) -> None:
+        if not _needs_compaction(self._state):
+            return
+        if self.snapshot_path is None:
+            await self._compact()
+            return
+        lock = await asyncio.to_thread(_lock_snapshot, self.snapshot_path)
+        try:
+            await self._compact()
+        finally:
+            await asyncio.to_thread(_unlock_snapshot, lock)
+
+    async def _compact(self) -> None:
+        """Drop dead rows and merge appended ones (rewriting and re-mapping the snapshot, if any)."""
+        state = await asyncio.to_thread(_compacted, self._state)
+        if self.snapshot_path is not None:
+            await asyncio.to_thread(_write_snapshot, state, self.snapshot_path)
+            state = await asyncio.to_thread(_read_snapshot, self.snapshot_path)
+        self._set_state(state)
+
+
+def get_memory_index() -> Optional[MemoryVectorIndex]:
+    """
+    Build the in-process vector index configured in settings.
+
+    Returns:
+        MemoryVectorIndex (not yet loaded; call start()), or None if disabled
+    """
+    if not settings.memory_index_enabled:
+        return None
+
+    return MemoryVectorIndex(
+        snapshot_path=settings.memory_index_snapshot_path,
+        refresh_delay_seconds=settings.memory_index_refresh_delay_seconds,
+        keepalive_seconds=settings.memory_index_keepalive_seconds,
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+from fastapi import Request
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+
+from src.config import settings
+from src.rag.answer_cache import AnswerCache, get_answer_cache
+from src.rag.chain import create_rag_chain
+from src.rag.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.rag.embedding_queue import EmbeddingQueue, get_embedding_queue
+from src.rag.embeddings import find_layer, get_embeddings
+from src.rag.llm import get_llm
+from src.rag.memory_index import MemoryVectorIndex, get_memory_index
+from src.rag.rerank import Reranker, get_reranker
+from src.rag.singleflight import SingleFlight
+from src.schemas import QueryResponse
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RAGComponents:
+    """
+    Process-wide RAG clients, built once at startup.
+
+    Attributes:
+        embeddings: Embeddings client shared by ingestion and retrieval
+        llm: Chat model used for answer generation
+        chain: Compiled RAG chain (prompt | llm)
+        answer_cache: Semantic answer cache (None if disabled)
+        embedding_cache: Embedding cache used by `embeddings` (None if disabled)
+        embedding_queue: Background embedding workers (None if disabled)
+        reranker: Reranker applied to the retrieved candidate pool (None if disabled)
+        query_flight: Coalesces identical concurrent questions (None if disabled)
+        memory_index: In-process vector index serving vector retrieval (None if disabled)
+        http_clients: HTTP connection pools owned by this registry
+        ready: True once warm-up has completed
+    """
+
+    embeddings: Embeddings
+    llm: BaseChatModel
+    chain: Runnable
+    answer_cache: Optional[AnswerCache] = None
+    embedding_cache: Optional[EmbeddingCache] = None
+    embedding_queue: Optional[EmbeddingQueue] = None
+    reranker: Optional[Reranker] = None
+    query_flight: Optional[SingleFlight[QueryResponse]] = None
+    memory_index: Optional[MemoryVectorIndex] = None
+    http_clients: List[httpx.Client | httpx.AsyncClient] = field(default_factory=list)
+    ready: bool = False
+
+
+def build_components() -> RAGComponents:
+    """
+    Build the embeddings client, LLM and RAG chain.
+
+    Returns:
+        RAGComponents holding long-lived clients with keep-alive HTTP pools
+
+    Note:
+        No network I/O happens here; connections are opened by warm_up()
+        or by the first request. Embedding workers and the in-process
+        vector index are started separately with embedding_queue.start()
+        and memory_index.start().
+    """
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+    http_client = httpx.Client(limits=limits)
+    http_async_client = httpx.AsyncClient(limits=limits)
+
+    embeddings = get_embeddings(http_client=http_client, http_async_client=http_async_client)
+    llm = get_llm()
+    cached_embeddings = find_layer(embeddings, CachedEmbeddings)
+
+    return RAGComponents(
+        embeddings=embeddings,
+        llm=llm,
+        chain=create_rag_chain(llm),
+        answer_cache=get_answer_cache(),
+        embedding_cache=cached_embeddings.cache if cached_embeddings is not None else None,
+        embedding_queue=get_embedding_queue(embeddings),
+        reranker=get_reranker(),
+        query_flight=SingleFlight("query") if settings.query_coalescing_enabled else None,
+        memory_index=get_memory_index(),
+        http_clients=[http_client, http_async_client],
+    )
+
+
+def import_providers() -> None:
+    """
+    Import the SDKs of the configured providers.
+
+    Note:
+        Provider SDKs are otherwise imported on first use, by
+        build_components() in each worker. A pre-forking server calls this
+        in its master process so that the forked workers share them.
+    """
+    if settings.embedding_provider == "openai":
+        import langchain_openai  # noqa: F401
+    if settings.llm_provider == "google":
+        import langchain_google_genai  # noqa: F401
+    if settings.rerank_mode == "cross_encoder":
+        import sentence_transformers  # noqa: F401
+
+
+async def warm_up(components: RAGComponents) -> None:
+    """
+    Open connections to both providers and load the reranker before reporting ready.
+
+    Args:
+        components: Registry to warm up
+
+    Note:
+        Failures are logged and do not prevent startup; the first real
+        request will simply pay the connection setup instead.
+    """
+    async def _warm(name: str, coro) -> None:
+        try:
+            await asyncio.wait_for(coro, timeout=settings.rag_warmup_timeout)
+            logger.info(f"Warmed up {name} client")
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} client failed: {e}")
+
+    if settings.rag_warmup_enabled:
+        # Below the embedding cache: a cached "warm-up" vector would never open a provider connection
+        cached_embeddings = find_layer(components.embeddings, CachedEmbeddings)
+        provider_embeddings = cached_embeddings.embeddings if cached_embeddings is not None else components.embeddings
+        warmups = [
+            _warm("embeddings", provider_embeddings.aembed_query("warm-up")),
+            # One output token: opens the connection without paying for a full generation
+            _warm("llm", components.llm.ainvoke("ping", generation_config={"max_output_tokens": 1})),
+        ]
+        if components.reranker is not None:
+            warmups.append(_warm("reranker", components.reranker.warm_up()))
+        await asyncio.gather(*warmups)
+
+    components.ready = True
+
+
+async def close_components(components: RAGComponents) -> None:
+    """
+    Stop the embedding workers, the in-process vector index and embedding
+    cache pruning, and close HTTP connection pools owned by the registry.
+
+    Args:
+        components: Registry to close
+    """
+    if components.embedding_queue is not None:
+        await components.embedding_queue.stop()
+    if components.memory_index is not None:
+        await components.memory_index.stop()
+    if components.embedding_cache is not None:
+        await components.embedding_cache.aclose()
+
+    for client in components.http_clients:
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        else:
+            client.close()
+
+
+def get_rag_components(request: Request) -> RAGComponents:
+    """
+    Dependency function that returns the application's RAG registry.
+
+    Usage:
+        @app.post("/query")
+        async def query(rag: RAGComponents = Depends(get_rag_components)):
+            ...
+    """
+    return request.app.state.rag
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import math
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, List, Literal, Optional
+
+import numpy as np
+
+from src.config import settings
+from src.rag.chunking import chunk_text
+from src.rag.vector_store import WORD_RE, SearchResult, lexical_terms
+
+logger = logging.getLogger(__name__)
+
+RerankMode = Literal["none", "lexical", "mmr", "cross_encoder"]
+
+
+class Reranker(ABC):
+    """
+    Reorders a retrieved candidate pool and keeps the best k.
+
+    Attributes:
+        needs_embeddings: Whether candidates must carry their chunk
+            embeddings (fetched with the candidates in the same query)
+    """
+
+    needs_embeddings: bool = False
+
+    @abstractmethod
+    async def rerank(
+        self,
+        question: str,
+        query_vector: List[float],
+        candidates: List[SearchResult],
+        k: int,
+    ) -> List[SearchResult]:
+        """
+        Select the k best candidates.
+
+        Args:
+            question: User's question
+            query_vector: Embedding of the question
+            candidates: Retrieved chunks ordered by descending retrieval score
+            k: Number of chunks to keep
+
+        Returns:
+            Up to k chunks ordered by descending score
+        """
+
+    async def warm_up(self) -> None:
+        """Load models ahead of the first request (no-op by default)."""
+
+
+class LexicalReranker(Reranker):
+    """
+    BM25 over the candidate pool, fused with the retrieval rank.
+
+    Query words are counted as tokens and Japanese terms as substrings
+    (see lexical_terms); document frequencies come from the pool itself.
+    The lexical ranking is fused with the retrieval ranking by reciprocal
+    rank fusion (settings.hybrid_rrf_k); candidates without any query term
+    only get the retrieval part and keep their order among each other.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    async def rerank(
+        self, question: str, query_vector: List[float], candidates: List[SearchResult], k: int
+    ) -> List[SearchResult]:
+        words, cjk_terms = lexical_terms(question)
+        if not (words or cjk_terms) or len(candidates) <= 1:
+            return candidates[:k]
+
+        texts = [chunk_text(doc.heading, doc.content).lower() for doc in candidates]
+        frequencies = []
+        for text in texts:
+            counts = Counter(WORD_RE.findall(text))
+            tf = {term: counts[term] for term in words}
+            tf.update((term, text.count(term.lower())) for term in cjk_terms)
+            frequencies.append(tf)
+
+        lengths = [len(text) for text in texts]
+        average_length = sum(lengths) / len(lengths) or 1.0
+        total = len(candidates)
+        lexical_scores = []
+        for tf, length in zip(frequencies, lengths):
+            score = 0.0
+            for term, count in tf.items():
+                if not count:
+                    continue
+                df = sum(1 for other in frequencies if other[term])
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                score += idf * count * (self.k1 + 1) / (count + self.k1 * (1 - self.b + self.b * length / average_length))
+            lexical_scores.append(score)
+
+        rrf_k = settings.hybrid_rrf_k
+        fused = []
+        for rank, (doc, lexical_score) in enumerate(zip(candidates, lexical_scores), 1):
+            score = 1.0 / (rrf_k + rank)
+            if lexical_score > 0:
+                # Equal BM25 scores share a rank
+                lexical_rank = 1 + sum(1 for other in lexical_scores if other > lexical_score)
+                score += 1.0 / (rrf_k + lexical_rank)
+            fused.append(doc._replace(score=score))
+        return sorted(fused, key=lambda doc: doc.score, reverse=True)[:k]
+
+
+class MMRReranker(Reranker):
+    """
+    Maximal marginal relevance over the candidates' chunk embeddings.
+
+    Greedily picks the candidate maximizing
+    lambda * relevance(c) - (1 - lambda) * max cos(c, selected),
+    where relevance is the retrieval score relative to the best candidate.
+    This drops chunks that repeat what is already selected. Scores are
+    left as retrieved; only the selection changes.
+    """
+
+    needs_embeddings = True
+
+    def __init__(self, lambda_mult: float):
+        self.lambda_mult = lambda_mult
+
+    async def rerank(
+        self, question: str, query_vector: List[float], candidates: List[SearchResult], k: int
+    ) -> List[SearchResult]:
+        if len(candidates) <= k or any(doc.embedding is None for doc in candidates):
+            return candidates[:k]
+
+        matrix = np.stack([np.asarray(doc.embedding, dtype=np.float32) for doc in candidates])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        similarity = matrix @ matrix.T
+        # Retrieval scores (cosine or RRF) scaled so the best candidate is 1,
+        # which keeps hybrid search's lexical evidence in the relevance term
+        scores = np.array([doc.score for doc in candidates], dtype=np.float32)
+        relevance = scores / scores.max() if scores.max() > 0 else scores
+
+        selected = [int(np.argmax(relevance))]
+        # Highest similarity of each candidate to anything selected so far
+        redundancy = similarity[selected[0]].copy()
+        while len(selected) < k:
+            mmr = self.lambda_mult * relevance - (1 - self.lambda_mult) * redundancy
+            mmr[selected] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            np.maximum(redundancy, similarity[best], out=redundancy)
+
+        return sorted((candidates[i] for i in selected), key=lambda doc: doc.score, reverse=True)
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local cross-encoder (sentence-transformers) scoring (question, chunk) pairs on CPU.
+
+    Requires the optional "rerank" dependencies
+    (`uv sync --extra rerank`). The model is loaded on first use or by
+    warm_up(), and scoring runs in a worker thread so the event loop is
+    not blocked.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model: Optional[Any] = None
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> Any:
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(self.model_name, device="cpu")
+
+    async def warm_up(self) -> None:
+        async with self._lock:
+            if self._model is None:
+                self._model = await asyncio.to_thread(self._load)
+                logger.info(f"Loaded cross-encoder {self.model_name}")
+
+    async def rerank(
+        self, question: str, query_vector: List[float], candidates: List[SearchResult], k: int
+    ) -> List[SearchResult]:
+        if not candidates:
+            return []
+        await self.warm_up()
+
+        pairs = [(question, chunk_text(doc.heading, doc.content)) for doc in candidates]
+        scores = await asyncio.to_thread(self._model.predict, pairs)
+        scored = [doc._replace(score=float(score)) for doc, score in zip(candidates, scores)]
+        return sorted(scored, key=lambda doc: doc.score, reverse=True)[:k]
+
+
+def get_reranker() -> Optional[Reranker]:
+    """
+    Build the reranker configured in settings.
+
+    Returns:
+        Reranker, or None if reranking is disabled (rerank_mode "none")
+
+    Raises:
+        ImportError: If rerank_mode is "cross_encoder" and sentence-transformers
+            is not installed
+    """
+    mode = settings.rerank_mode
+    if mode == "lexical":
+        return LexicalReranker()
+    if mode == "mmr":
+        return MMRReranker(settings.rerank_mmr_lambda)
+    if mode == "cross_encoder":
+        # Fail at startup rather than on the first query
+        import sentence_transformers  # noqa: F401
+
+        return CrossEncoderReranker(settings.rerank_cross_encoder_model)
+    return None
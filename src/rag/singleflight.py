@@ -0,0 +1,112 @@
+import asyncio
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from src.metrics import COALESCED_CALLS
+
+T = TypeVar("T")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for coalescing.
+
+    Args:
+        question: User's question
+
+    Returns:
+        NFKC-normalized, case-folded question with whitespace collapsed, so
+        that trivially different spellings of the same question share a key
+    """
+    return " ".join(unicodedata.normalize("NFKC", question).split()).casefold()
+
+
+@dataclass
+class _Call(Generic[T]):
+    task: asyncio.Task
+    waiters: int = field(default=0)
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller of a key starts the computation as a task; callers
+    arriving while it runs await the same task and receive its result or
+    its exception. The key is forgotten as soon as the task finishes, so
+    this never serves stale results (caching is a separate concern).
+
+    A caller that is cancelled (e.g. its client disconnected) stops
+    waiting without affecting the others; the computation itself is
+    cancelled only once every caller has left.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call[T]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn, or join the in-flight run for the same key.
+
+        Args:
+            key: Identity of the computation
+            fn: Starts the computation (only called by the first caller)
+
+        Returns:
+            The shared result; callers must not mutate it
+
+        Raises:
+            Exception: Whatever the shared computation raised
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(task=asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            COALESCED_CALLS.labels(self.name).inc()
+
+        call.waiters += 1
+        try:
+            # shield: one caller's cancellation must not cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting any more; later callers start afresh
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call[T]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class CoalescedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that shares in-flight async calls for identical input.
+
+    aembed_query is keyed on the text; aembed_documents on the whole list of
+    texts. Sync methods are passed through unchanged.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.flight: SingleFlight[List[List[float]]] = SingleFlight("embeddings")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = await self.flight.do(tuple(texts), lambda: self.embeddings.aembed_documents(texts))
+        return list(vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,47 @@
+import logging
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    # cl100k_base is the tokenizer used by text-embedding-3-small
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate a token count without a tokenizer.
+
+    Args:
+        text: Text to estimate
+
+    Returns:
+        UTF-8 byte length / 3, which over-counts English (about 4 bytes per
+        token) and roughly matches Japanese (3 bytes per character)
+    """
+    return (len(text.encode("utf-8")) + 2) // 3
+
+
+def count_tokens(texts: Sequence[str]) -> List[int]:
+    """
+    Count tokens for each text with the embedding model's tokenizer.
+
+    Args:
+        texts: Texts to count
+
+    Returns:
+        Token count per text (estimated if the tokenizer cannot be loaded)
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return [estimate_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
@@ -0,0 +1,172 @@
+"""
+Compact HNSW indexes over document_chunks.embedding.
+
+The table always keeps the full 1536-dimensional vectors. A compact mode
+indexes an expression derived from them instead (pgvector expression
+index), so switching modes never rewrites rows:
+- halfvec: half-precision floats (half the index size)
+- binary: binary quantization, one bit per dimension searched by Hamming
+  distance (1/32 of the index size)
+- dimensions < 1536: Matryoshka truncation to the first N dimensions
+  (text-embedding-3 models are trained so that prefixes stay meaningful),
+  on its own or combined with either mode
+
+Searches in a compact mode take settings.vector_rerank_factor times the
+requested rows from the compact index and re-rank them by exact cosine
+distance on the full vectors.
+
+Migration of an existing database (builds the index without blocking writes):
+    uv run python -m src.rag.vector_index --mode binary --dimensions 1536
+
+Once VECTOR_INDEX_MODE / VECTOR_INDEX_DIMENSIONS select it, --drop-others
+drops the other embedding indexes. DocumentChunk only declares the full
+index while it is the configured one, so `python -m src.migrate` does not
+rebuild a dropped full index.
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+from typing import List, Literal
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import ColumnElement, cast, func, literal_column, text
+
+from src.config import settings
+
+VectorIndexMode = Literal["full", "halfvec", "binary"]
+
+# Dimensions of settings.embedding_model, as stored in document_chunks.embedding
+EMBEDDING_DIMENSIONS = 1536
+# Index over the full vectors, defined on DocumentChunk
+FULL_INDEX_NAME = "document_chunks_embedding_idx"
+
+_OPERATOR_CLASSES = {"full": "vector_cosine_ops", "halfvec": "halfvec_cosine_ops", "binary": "bit_hamming_ops"}
+
+
+@dataclass(frozen=True)
+class VectorIndex:
+    """
+    Representation of chunk embeddings used for the first-pass search.
+
+    Attributes:
+        mode: "full", "halfvec" or "binary"
+        dimensions: Leading dimensions kept (EMBEDDING_DIMENSIONS = no truncation)
+    """
+
+    mode: VectorIndexMode = "full"
+    dimensions: int = EMBEDDING_DIMENSIONS
+
+    def __post_init__(self):
+        if not 1 <= self.dimensions <= EMBEDDING_DIMENSIONS:
+            raise ValueError(f"Vector index dimensions must be between 1 and {EMBEDDING_DIMENSIONS}")
+
+    @property
+    def compact(self) -> bool:
+        """Whether search needs the exact re-rank on full vectors."""
+        return self.mode != "full" or self.dimensions < EMBEDDING_DIMENSIONS
+
+    @property
+    def name(self) -> str:
+        if not self.compact:
+            return FULL_INDEX_NAME
+        return f"document_chunks_embedding_{self.mode}_{self.dimensions}_idx"
+
+    def expression(self, vector: ColumnElement) -> ColumnElement:
+        """
+        Derive the compact representation of a full vector expression.
+
+        Applied to DocumentChunk.embedding this is the indexed expression;
+        applied to the query vector it is what the index is searched with.
+        Dimensions are rendered as literals so that Postgres matches the
+        expression to the index.
+        """
+        if self.dimensions < EMBEDDING_DIMENSIONS:
+            vector = func.subvector(vector, literal_column("1"), literal_column(str(self.dimensions)))
+        if self.mode == "halfvec":
+            return cast(vector, HALFVEC(self.dimensions))
+        if self.mode == "binary":
+            return cast(func.binary_quantize(vector), BIT(self.dimensions))
+        return cast(vector, Vector(self.dimensions))
+
+    def distance(self, embedding: ColumnElement, query: ColumnElement) -> ColumnElement:
+        """First-pass distance between a chunk embedding and a query vector (served by the index)."""
+        if self.mode == "binary":
+            return self.expression(embedding).hamming_distance(self.expression(query))
+        return self.expression(embedding).cosine_distance(self.expression(query))
+
+    def candidates(self, limit: int) -> int:
+        """Number of first-pass rows to re-rank for `limit` results."""
+        return limit * max(settings.vector_rerank_factor, 1)
+
+    def create_sql(self, concurrently: bool = True) -> str:
+        """CREATE INDEX statement for this representation."""
+        if self.dimensions < EMBEDDING_DIMENSIONS:
+            vector = f"subvector(embedding, 1, {self.dimensions})"
+        else:
+            vector = "embedding"
+        if self.mode == "halfvec":
+            indexed = f"({vector})::halfvec({self.dimensions})"
+        elif self.mode == "binary":
+            indexed = f"binary_quantize({vector})::bit({self.dimensions})"
+        else:
+            indexed = f"({vector})::vector({self.dimensions})" if self.compact else "embedding"
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} "
+            f"ON document_chunks USING hnsw (({indexed}) {_OPERATOR_CLASSES[self.mode]})"
+        )
+
+
+def get_vector_index() -> VectorIndex:
+    """Get the vector index configured in settings."""
+    return VectorIndex(mode=settings.vector_index_mode, dimensions=settings.vector_index_dimensions)
+
+
+async def _migrate(index: VectorIndex, drop_others: bool) -> None:
+    from src.database import async_engine
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    async with async_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        print(f"Building {index.name} ...")
+        await conn.execute(text(index.create_sql(concurrently=True)))
+        size = await conn.scalar(text(f"SELECT pg_size_pretty(pg_relation_size('{index.name}'))"))
+        print(f"{index.name}: {size}")
+
+        if drop_others:
+            names: List[str] = list(
+                await conn.scalars(
+                    text(
+                        "SELECT indexname FROM pg_indexes WHERE tablename = 'document_chunks' "
+                        "AND indexname LIKE 'document_chunks_embedding%' AND indexname <> :keep"
+                    ),
+                    {"keep": index.name},
+                )
+            )
+            for name in names:
+                print(f"Dropping {name}")
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.rag.vector_index",
+        description="Build the HNSW index for a vector index mode (set VECTOR_INDEX_MODE / "
+        "VECTOR_INDEX_DIMENSIONS to match once it is built).",
+    )
+    parser.add_argument("--mode", choices=list(_OPERATOR_CLASSES), default=settings.vector_index_mode)
+    parser.add_argument("--dimensions", type=int, default=settings.vector_index_dimensions)
+    parser.add_argument("--drop-others", action="store_true", help="Drop the other embedding indexes afterwards")
+    args = parser.parse_args()
+    index = VectorIndex(mode=args.mode, dimensions=args.dimensions)
+    if args.drop_others and index != get_vector_index():
+        # The migration would rebuild the configured index, blocking writes
+        parser.error(
+            f"--drop-others requires VECTOR_INDEX_MODE={index.mode} and "
+            f"VECTOR_INDEX_DIMENSIONS={index.dimensions} to be configured first"
+        )
+    asyncio.run(_migrate(index, args.drop_others))
+
+
+if __name__ == "__main__":
+    main()
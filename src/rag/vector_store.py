@@ -1,75 +1,584 @@
-from typing import List, Tuple
+import hashlib
+import re
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, NamedTuple, Optional, Sequence, Tuple
 from uuid import UUID
 
-from langchain_core.documents import Document as LangChainDocument
-from langchain_postgres import PGVector
-from sqlalchemy.orm import Session
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import ColumnElement, Select, case, cast, column, func, literal, or_, select, text, true
+from sqlalchemy.dialects.postgresql import REGCONFIG, array
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.config import settings
-from src.models import Document
-from src.rag.embeddings import get_embeddings
+from src.models import Document, DocumentChunk
+from src.rag.vector_index import get_vector_index
+from src.schemas import MetadataFilter
 
+if TYPE_CHECKING:
+    from src.rag.memory_index import MemoryVectorIndex
 
-def get_vector_store() -> PGVector:
+RetrievalMode = Literal["vector", "hybrid"]
+
+# Must match the text search configuration of document_chunks.content_tsv
+TS_CONFIG = "english"
+WORD_RE = re.compile(r"[0-9A-Za-z_]+")
+# Katakana and kanji runs; hiragana (mostly particles and inflections) is skipped.
+# Runs shorter than 3 characters cannot use the trigram index.
+CJK_RE = re.compile(r"[\u30a0-\u30ff\u31f0-\u31ff\uff66-\uff9f]{3,}|[\u3400-\u4dbf\u4e00-\u9fff]{3,}")
+
+# Whether the installed pgvector supports hnsw.iterative_scan (0.8.0+), detected once
+_iterative_scan_supported: Optional[bool] = None
+
+
+class SearchResult(NamedTuple):
+    """
+    A single chunk returned by vector search.
+
+    Attributes:
+        id: Parent document UUID
+        chunk_index: Position of the chunk within the document
+        heading: Heading trail of the chunk's section
+        content: Chunk content
+        metadata: Parent document metadata
+        updated_at: Parent document last update (identifies its version)
+        score: Cosine similarity (1 - cosine distance), the reciprocal
+            rank fusion score for hybrid search, or the reranker's score
+        embedding: Chunk embedding (only when requested with with_embeddings)
+    """
+
+    id: UUID
+    chunk_index: int
+    heading: Optional[str]
+    content: str
+    metadata: Dict[str, Any]
+    updated_at: datetime
+    score: float
+    embedding: Optional[np.ndarray] = None
+
+    @property
+    def content_hash(self) -> str:
+        """Hex sha256 of the chunk's heading and content (changes when the chunk text is replaced)."""
+        return hashlib.sha256(f"{self.heading or ''}\0{self.content}".encode("utf-8")).hexdigest()
+
+
+def filter_conditions(metadata_filter: Optional[MetadataFilter]) -> List[ColumnElement[bool]]:
+    """
+    Translate a metadata filter into WHERE conditions on documents.
+
+    Args:
+        metadata_filter: Filter to apply (optional)
+
+    Returns:
+        List of conditions (empty if no filter)
+
+    Note:
+        Tags and key equality are combined into a single `metadata @> :doc`
+        containment test, which is served by documents_metadata_idx (GIN).
+        Date bounds use documents_created_at_idx.
+    """
+    if metadata_filter is None:
+        return []
+
+    conditions: List[ColumnElement[bool]] = []
+    contained: Dict[str, Any] = dict(metadata_filter.equals or {})
+    if metadata_filter.tags:
+        contained["tags"] = metadata_filter.tags
+    if contained:
+        conditions.append(Document.doc_metadata.contains(contained))
+    if metadata_filter.created_after is not None:
+        conditions.append(Document.created_at >= metadata_filter.created_after)
+    if metadata_filter.created_before is not None:
+        conditions.append(Document.created_at < metadata_filter.created_before)
+    return conditions
+
+
+def _nearest_chunks(
+    query: ColumnElement,
+    limit: int,
+    conditions: List[ColumnElement[bool]],
+    columns: Sequence[ColumnElement],
+) -> Select:
     """
-    Get PGVector store instance.
+    Build a query for the chunks nearest to a query vector.
+
+    Args:
+        query: Query vector expression (a literal, or a column for batched searches)
+        limit: Number of chunks to return
+        conditions: Filter conditions on Document
+        columns: Columns to select (labelled; "distance" is added)
 
     Returns:
-        PGVector: Configured vector store for similarity search
+        Select of columns plus the exact cosine "distance", ordered by it
+
+    Note:
+        With a compact vector index (see src.rag.vector_index) the index
+        serves a first pass of limit * settings.vector_rerank_factor rows
+        over the compact representation, which are then re-ranked by
+        exact distance on the full vectors.
     """
-    embeddings = get_embeddings()
+    index = get_vector_index()
+    stmt = (
+        select(*columns)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(DocumentChunk.embedding.is_not(None), *conditions)
+    )
+    if not index.compact:
+        distance = DocumentChunk.embedding.cosine_distance(query)
+        return stmt.add_columns(distance.label("distance")).order_by(distance).limit(limit)
 
-    return PGVector(
-        embeddings=embeddings,
-        collection_name="documents",
-        connection=settings.database_url,
-        use_jsonb=True,
+    first_pass = (
+        stmt.add_columns(DocumentChunk.embedding.label("full_embedding"))
+        .order_by(index.distance(DocumentChunk.embedding, query))
+        .limit(index.candidates(limit))
+        .lateral("first_pass")
     )
+    distance = first_pass.c.full_embedding.cosine_distance(query)
+    return (
+        select(*(c for c in first_pass.c if c.key != "full_embedding"), distance.label("distance"))
+        .order_by(distance)
+        .limit(limit)
+    )
+
+
+async def search_by_vector(
+    db: AsyncSession,
+    query_vector: List[float],
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    with_embeddings: bool = False,
+) -> List[SearchResult]:
+    """
+    Run a cosine-distance top-k search against document chunks.
+
+    Args:
+        db: Database session
+        query_vector: Embedding of the query
+        k: Number of chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for this query
+            (default: settings.hnsw_ef_search)
+        metadata_filter: Only search chunks of matching documents (optional)
+        with_embeddings: Also return each chunk's embedding (default: False)
 
+    Returns:
+        List of SearchResult ordered by descending similarity
 
-def add_document_to_vector_store(
-    db: Session,
-    document: Document,
-) -> None:
+    Note:
+        The ORDER BY on `embedding <=> :q` is served by the
+        document_chunks_embedding_idx HNSW index. ef_search is applied with
+        set_config(..., is_local => true) so it only affects the current
+        transaction and never leaks to other users of the pooled connection.
+        Filters are part of the same statement; with pgvector 0.8+ an
+        iterative index scan keeps fetching candidates until k filtered
+        rows are found (see _configure_hnsw).
     """
-    Add a document to the vector store.
+    conditions = filter_conditions(metadata_filter)
+    await _configure_hnsw(db, ef_search, _index_rows(k), filtered=bool(conditions))
+
+    query = cast(literal(query_vector, Vector(len(query_vector))), Vector(len(query_vector)))
+    stmt = _nearest_chunks(query, k, conditions, _result_columns(with_embeddings))
+
+    results = [
+        SearchResult(
+            id=row.document_id,
+            chunk_index=row.chunk_index,
+            heading=row.heading,
+            content=row.content,
+            metadata=row.doc_metadata or {},
+            updated_at=row.updated_at,
+            score=1.0 - float(row.distance),
+            embedding=row.embedding if with_embeddings else None,
+        )
+        for row in await db.execute(stmt)
+    ]
+    # relaxed_order iterative scans may return rows slightly out of order
+    return sorted(results, key=lambda result: result.score, reverse=True)
+
+
+async def search_by_vectors(
+    db: AsyncSession,
+    query_vectors: List[List[float]],
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    with_embeddings: bool = False,
+) -> List[List[SearchResult]]:
+    """
+    Run search_by_vector for many query vectors in one statement.
 
     Args:
         db: Database session
-        document: Document model instance with content to embed
+        query_vectors: Embeddings of the queries
+        k: Number of chunks to retrieve per query (default: 5)
+        ef_search: HNSW candidate list size (default: settings.hnsw_ef_search)
+        metadata_filter: Only search chunks of matching documents (optional)
+        with_embeddings: Also return each chunk's embedding (default: False)
+
+    Returns:
+        One list of SearchResult per query vector, in input order, each
+        ordered by descending similarity
 
     Note:
-        This function generates embeddings for the document content
-        and stores them in the vector store for similarity search.
+        The query vectors are unnested WITH ORDINALITY and each one drives
+        a LATERAL top-k subquery, which is served by the HNSW index like a
+        single search. All queries share one round trip and one
+        transaction's HNSW settings.
     """
-    embeddings = get_embeddings()
+    if not query_vectors:
+        return []
 
-    # Generate embedding for the document content
-    embedding_vector = embeddings.embed_query(document.content)
+    conditions = filter_conditions(metadata_filter)
+    await _configure_hnsw(db, ef_search, _index_rows(k), filtered=bool(conditions))
 
-    # Update the document with the embedding
-    document.embedding = embedding_vector
-    db.commit()
+    queries = (
+        func.unnest(array([cast(literal(vector, Vector(len(vector))), Vector(len(vector))) for vector in query_vectors]))
+        .table_valued(column("embedding", Vector()), with_ordinality="ord")
+        .render_derived()
+    )
+    hits = _nearest_chunks(queries.c.embedding, k, conditions, _result_columns(with_embeddings)).lateral("hits")
+    stmt = select(queries.c.ord, *hits.c).select_from(queries).join(hits, true())
+
+    results: List[List[SearchResult]] = [[] for _ in query_vectors]
+    for row in await db.execute(stmt):
+        results[row.ord - 1].append(
+            SearchResult(
+                id=row.document_id,
+                chunk_index=row.chunk_index,
+                heading=row.heading,
+                content=row.content,
+                metadata=row.doc_metadata or {},
+                updated_at=row.updated_at,
+                score=1.0 - float(row.distance),
+                embedding=row.embedding if with_embeddings else None,
+            )
+        )
+    return [sorted(docs, key=lambda result: result.score, reverse=True) for docs in results]
+
+
+def lexical_terms(question: str) -> Tuple[List[str], List[str]]:
+    """
+    Extract the terms used for lexical matching from a question.
 
+    Args:
+        question: User's question
 
-def search_similar_documents(
+    Returns:
+        (words, cjk_terms): alphanumeric words for full-text search, and
+        katakana/kanji runs for substring search (the full-text parser
+        does not segment Japanese)
+    """
+    words = list(dict.fromkeys(word.lower() for word in WORD_RE.findall(question)))
+    cjk_terms = list(dict.fromkeys(CJK_RE.findall(question)))
+    return words, cjk_terms
+
+
+async def search_hybrid(
+    db: AsyncSession,
+    query_vector: List[float],
+    question: str,
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    with_embeddings: bool = False,
+) -> List[SearchResult]:
+    """
+    Run full-text and vector search and fuse them with reciprocal rank fusion.
+
+    Args:
+        db: Database session
+        query_vector: Embedding of the query
+        question: Query text for lexical matching
+        k: Number of chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for this query
+            (default: settings.hnsw_ef_search)
+        metadata_filter: Only search chunks of matching documents (optional)
+        with_embeddings: Also return each chunk's embedding (default: False)
+
+    Returns:
+        List of SearchResult ordered by descending RRF score
+
+    Note:
+        Both candidate lists (settings.hybrid_candidates each) are ranked
+        and fused in a single statement, so hybrid search costs one round
+        trip like vector search. A chunk scores
+        sum(1 / (settings.hybrid_rrf_k + rank)) over the lists it appears in.
+        Words match content_tsv (GIN index, any word suffices) and
+        Japanese terms match content via ILIKE (pg_trgm GIN index).
+        Falls back to vector search when the question has no usable terms.
+    """
+    words, cjk_terms = lexical_terms(question)
+    if not words and not cjk_terms:
+        return await search_by_vector(
+            db,
+            query_vector,
+            k=k,
+            ef_search=ef_search,
+            metadata_filter=metadata_filter,
+            with_embeddings=with_embeddings,
+        )
+
+    conditions = filter_conditions(metadata_filter)
+    candidates = max(settings.hybrid_candidates, k)
+    await _configure_hnsw(db, ef_search, _index_rows(candidates), filtered=bool(conditions))
+
+    query = cast(literal(query_vector, Vector(len(query_vector))), Vector(len(query_vector)))
+    vector_hits = _nearest_chunks(query, candidates, conditions, [DocumentChunk.id]).subquery()
+    vector_ranked = select(
+        vector_hits.c.id,
+        func.row_number().over(order_by=vector_hits.c.distance).label("rank"),
+    ).cte("vector_ranked")
+
+    tsquery = func.to_tsquery(
+        cast(literal(TS_CONFIG), REGCONFIG),
+        " | ".join("'" + word + "'" for word in words),
+    )
+    patterns = ["%" + term + "%" for term in cjk_terms]
+    matches = [DocumentChunk.content.ilike(pattern) for pattern in patterns]
+    # Each matched Japanese term counts like a strong full-text hit
+    lexical_score = sum((case((match, 1.0), else_=0.0) for match in matches), literal(0.0))
+    if words:
+        matches.append(DocumentChunk.content_tsv.bool_op("@@")(tsquery))
+        lexical_score = lexical_score + func.ts_rank_cd(DocumentChunk.content_tsv, tsquery)
+    lexical_hits = (
+        select(DocumentChunk.id, lexical_score.label("score"))
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(or_(*matches), *conditions)
+        .order_by(lexical_score.desc())
+        .limit(candidates)
+        .subquery()
+    )
+    lexical_ranked = select(
+        lexical_hits.c.id,
+        func.row_number().over(order_by=lexical_hits.c.score.desc()).label("rank"),
+    ).cte("lexical_ranked")
+
+    rrf_k = settings.hybrid_rrf_k
+    fused = (
+        select(
+            func.coalesce(vector_ranked.c.id, lexical_ranked.c.id).label("id"),
+            (
+                func.coalesce(1.0 / (rrf_k + vector_ranked.c.rank), 0.0)
+                + func.coalesce(1.0 / (rrf_k + lexical_ranked.c.rank), 0.0)
+            ).label("score"),
+        )
+        .select_from(vector_ranked.join(lexical_ranked, vector_ranked.c.id == lexical_ranked.c.id, full=True))
+        .cte("fused")
+    )
+    stmt = (
+        select(
+            DocumentChunk.document_id,
+            DocumentChunk.chunk_index,
+            DocumentChunk.heading,
+            DocumentChunk.content,
+            Document.doc_metadata,
+            Document.updated_at,
+            fused.c.score,
+            *([DocumentChunk.embedding] if with_embeddings else []),
+        )
+        .join(DocumentChunk, DocumentChunk.id == fused.c.id)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .order_by(fused.c.score.desc())
+        .limit(k)
+    )
+
+    return [
+        SearchResult(
+            id=row.document_id,
+            chunk_index=row.chunk_index,
+            heading=row.heading,
+            content=row.content,
+            metadata=row.doc_metadata or {},
+            updated_at=row.updated_at,
+            score=float(row.score),
+            embedding=row.embedding if with_embeddings else None,
+        )
+        for row in await db.execute(stmt)
+    ]
+
+
+async def retrieve(
+    db: AsyncSession,
+    query_vector: List[float],
+    question: str,
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    mode: Optional[RetrievalMode] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    with_embeddings: bool = False,
+    memory_index: Optional["MemoryVectorIndex"] = None,
+) -> List[SearchResult]:
+    """
+    Retrieve chunks with the requested retrieval mode.
+
+    Args:
+        db: Database session
+        query_vector: Embedding of the query
+        question: Query text (used by hybrid mode)
+        k: Number of chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for this query (optional)
+        mode: "vector" or "hybrid" (default: settings.retrieval_mode)
+        metadata_filter: Only search chunks of matching documents (optional)
+        with_embeddings: Also return each chunk's embedding (default: False)
+        memory_index: In-process index that answers vector mode when in
+            sync, without using db (optional)
+
+    Returns:
+        List of SearchResult ordered by descending score
+    """
+    if memory_index is not None and memory_index.serves(mode):
+        [results] = await memory_index.search(
+            [query_vector], k=k, metadata_filter=metadata_filter, with_embeddings=with_embeddings
+        )
+        return results
+    if (mode or settings.retrieval_mode) == "hybrid":
+        return await search_hybrid(
+            db,
+            query_vector,
+            question,
+            k=k,
+            ef_search=ef_search,
+            metadata_filter=metadata_filter,
+            with_embeddings=with_embeddings,
+        )
+    return await search_by_vector(
+        db, query_vector, k=k, ef_search=ef_search, metadata_filter=metadata_filter, with_embeddings=with_embeddings
+    )
+
+
+async def retrieve_many(
+    db: AsyncSession,
+    query_vectors: List[List[float]],
+    questions: List[str],
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    mode: Optional[RetrievalMode] = None,
+    metadata_filter: Optional[MetadataFilter] = None,
+    with_embeddings: bool = False,
+    memory_index: Optional["MemoryVectorIndex"] = None,
+) -> List[List[SearchResult]]:
+    """
+    Retrieve chunks for many questions with the same retrieval options.
+
+    Args:
+        db: Database session
+        query_vectors: Embeddings of the questions
+        questions: Question texts (used by hybrid mode)
+        k: Number of chunks to retrieve per question (default: 5)
+        ef_search: HNSW candidate list size (optional)
+        mode: "vector" or "hybrid" (default: settings.retrieval_mode)
+        metadata_filter: Only search chunks of matching documents (optional)
+        with_embeddings: Also return each chunk's embedding (default: False)
+        memory_index: In-process index that answers vector mode when in
+            sync, without using db (optional)
+
+    Returns:
+        One list of SearchResult per question, in input order
+
+    Note:
+        Vector mode runs a single statement (search_by_vectors). Hybrid
+        mode runs one fused statement per question on the same connection,
+        since each question has its own lexical terms.
+    """
+    if memory_index is not None and memory_index.serves(mode):
+        return await memory_index.search(
+            query_vectors, k=k, metadata_filter=metadata_filter, with_embeddings=with_embeddings
+        )
+    if (mode or settings.retrieval_mode) == "hybrid":
+        return [
+            await search_hybrid(
+                db,
+                query_vector,
+                question,
+                k=k,
+                ef_search=ef_search,
+                metadata_filter=metadata_filter,
+                with_embeddings=with_embeddings,
+            )
+            for query_vector, question in zip(query_vectors, questions)
+        ]
+    return await search_by_vectors(
+        db, query_vectors, k=k, ef_search=ef_search, metadata_filter=metadata_filter, with_embeddings=with_embeddings
+    )
+
+
+def _result_columns(with_embeddings: bool) -> List[ColumnElement]:
+    """Columns selected for SearchResult rows."""
+    return [
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_index,
+        DocumentChunk.heading,
+        DocumentChunk.content,
+        Document.doc_metadata,
+        Document.updated_at,
+        *([DocumentChunk.embedding] if with_embeddings else []),
+    ]
+
+
+def _index_rows(limit: int) -> int:
+    """Rows the HNSW scan must produce for `limit` results (the first pass of a compact index)."""
+    index = get_vector_index()
+    return index.candidates(limit) if index.compact else limit
+
+
+async def _supports_iterative_scan(db: AsyncSession) -> bool:
+    """Check once per process whether pgvector supports iterative index scans (0.8.0+)."""
+    global _iterative_scan_supported
+    if _iterative_scan_supported is None:
+        version = await db.scalar(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))
+        parts = tuple(int(part) for part in re.findall(r"\d+", version or "")[:2])
+        _iterative_scan_supported = parts >= (0, 8)
+    return _iterative_scan_supported
+
+
+async def _configure_hnsw(db: AsyncSession, ef_search: Optional[int], limit: int, filtered: bool) -> None:
+    """
+    Set HNSW search parameters for the current transaction.
+
+    Args:
+        db: Database session
+        ef_search: Requested candidate list size (default: settings.hnsw_ef_search)
+        limit: Number of rows the query needs; ef_search is raised to at least this
+        filtered: Whether the query has filter conditions
+
+    Note:
+        A plain HNSW scan stops after ef_search candidates, so a selective
+        filter can leave fewer than `limit` rows. For filtered queries on
+        pgvector 0.8+ hnsw.iterative_scan (settings.hnsw_iterative_scan)
+        makes the scan continue, up to settings.hnsw_max_scan_tuples.
+    """
+    # HNSW can never return more rows than ef_search candidates
+    ef_search = max(ef_search or settings.hnsw_ef_search, limit)
+    configs = [func.set_config("hnsw.ef_search", str(ef_search), True)]
+
+    if filtered and settings.hnsw_iterative_scan != "off" and await _supports_iterative_scan(db):
+        configs.append(func.set_config("hnsw.iterative_scan", settings.hnsw_iterative_scan, True))
+        configs.append(func.set_config("hnsw.max_scan_tuples", str(settings.hnsw_max_scan_tuples), True))
+
+    await db.execute(select(*configs))
+
+
+async def search_similar_documents(
+    db: AsyncSession,
+    embeddings: Embeddings,
     query: str,
     k: int = 5,
-) -> List[Tuple[LangChainDocument, float]]:
+    ef_search: Optional[int] = None,
+) -> List[SearchResult]:
     """
-    Search for similar documents using vector similarity.
+    Search for similar document chunks using vector similarity.
 
     Args:
+        db: Database session
+        embeddings: Embeddings client
         query: Search query text
-        k: Number of similar documents to retrieve (default: 5)
+        k: Number of similar chunks to retrieve (default: 5)
+        ef_search: HNSW candidate list size for this query (optional)
 
     Returns:
-        List of tuples containing (Document, similarity_score)
-        Documents are LangChain Document objects with page_content and metadata
+        List of SearchResult ordered by descending similarity
     """
-    vector_store = get_vector_store()
-
-    # Search for similar documents with scores
-    results = vector_store.similarity_search_with_score(query, k=k)
+    query_vector = await embeddings.aembed_query(query)
 
-    return results
+    return await search_by_vector(db, query_vector, k=k, ef_search=ef_search)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
 from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict, Field
@@ -13,6 +13,36 @@ class DocumentCreate(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Optional metadata (title, tags, etc.)")
 
 
+class DocumentUpdate(BaseModel):
+    """Schema for partially updating a document (omitted fields are left unchanged)."""
+
+    content: Optional[str] = Field(default=None, description="New markdown content")
+    metadata: Optional[Dict[str, Any]] = Field(default=None, description="New metadata (replaces the existing metadata)")
+
+
+class DocumentBatchCreate(BaseModel):
+    """Schema for creating many documents in one request."""
+
+    documents: List[DocumentCreate] = Field(..., min_length=1, max_length=1000, description="Documents to create")
+
+
+class DocumentBatchItemResult(BaseModel):
+    """Schema for the outcome of one document in a batch."""
+
+    index: int = Field(..., description="Position of the document in the request (line number for NDJSON)")
+    id: Optional[UUID] = Field(default=None, description="ID of the created document")
+    status: Literal["created", "failed"]
+    error: Optional[str] = Field(default=None, description="Failure reason")
+
+
+class DocumentBatchResponse(BaseModel):
+    """Schema for batch document creation response."""
+
+    succeeded: int = Field(..., description="Number of documents created")
+    failed: int = Field(..., description="Number of documents that failed")
+    results: List[DocumentBatchItemResult] = Field(..., description="Per-document results in request order")
+
+
 class DocumentResponse(BaseModel):
     """Schema for document response."""
 
@@ -20,39 +50,152 @@ class DocumentResponse(BaseModel):
 
     id: UUID
     content: str
-    metadata: Dict[str, Any] = Field(alias="doc_metadata")
+    metadata: Dict[str, Any] = Field(validation_alias="doc_metadata")
+    embedding_status: Literal["pending", "ready", "failed"] = Field(
+        ...,
+        description="pending until the document's chunks are embedded and searchable",
+    )
     created_at: datetime
     updated_at: datetime
 
 
+class DocumentListItem(BaseModel):
+    """Schema for a document in a list response (fields not requested via `fields` are omitted)."""
+
+    id: UUID
+    content: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    embedding_status: Optional[Literal["pending", "ready", "failed"]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 class DocumentListResponse(BaseModel):
     """Schema for paginated document list response."""
 
-    total: int = Field(..., description="Total number of documents")
-    documents: List[DocumentResponse] = Field(..., description="List of documents")
+    total: Optional[int] = Field(..., description="Number of matching documents (null if count=none)")
+    total_estimated: bool = Field(..., description="True if total is an estimate or a cached count")
+    next_cursor: Optional[str] = Field(..., description="Cursor for the next page (null on the last page)")
+    documents: List[DocumentListItem] = Field(..., description="List of documents, newest first")
+
+
+class EmbeddingStatusResponse(BaseModel):
+    """Schema for the embedding status of a document."""
+
+    document_id: UUID
+    status: Literal["pending", "processing", "ready", "failed"] = Field(
+        ...,
+        description="processing while a worker holds the job",
+    )
+    attempts: int = Field(..., description="Attempts made for the queued job")
+    next_attempt_at: Optional[datetime] = Field(default=None, description="Earliest next attempt of a queued job")
+    error: Optional[str] = Field(default=None, description="Last embedding error")
+    chunks: int = Field(..., description="Number of embedded chunks currently searchable")
+
+
+class ReEmbedResponse(BaseModel):
+    """Schema for re-embedding request response."""
+
+    queued: int = Field(..., description="Number of documents queued for re-embedding")
+
+
+# Filter Schemas
+class MetadataFilter(BaseModel):
+    """Schema for restricting documents by metadata and creation date."""
+
+    tags: Optional[List[str]] = Field(default=None, description="Documents must have all of these tags")
+    equals: Optional[Dict[str, Union[str, int, float, bool]]] = Field(
+        default=None,
+        description="Metadata keys that must have exactly these values",
+    )
+    created_after: Optional[datetime] = Field(default=None, description="Inclusive lower bound on created_at")
+    created_before: Optional[datetime] = Field(default=None, description="Exclusive upper bound on created_at")
 
 
 # Query Schemas
-class QueryRequest(BaseModel):
+class QueryOptions(BaseModel):
+    """Retrieval options shared by single and batch queries."""
+
+    ef_search: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="HNSW candidate list size (higher = better recall, slower search)",
+    )
+    retrieval_mode: Optional[Literal["vector", "hybrid"]] = Field(
+        default=None,
+        description="vector: similarity search only; hybrid: full-text + vector fused with RRF "
+        "(default: server setting)",
+    )
+    filter: Optional[MetadataFilter] = Field(
+        default=None,
+        description="Only retrieve chunks of documents matching this filter",
+    )
+
+
+class QueryRequest(QueryOptions):
     """Schema for RAG query request."""
 
     question: str = Field(..., description="User's question", min_length=1)
 
 
+class BatchQueryRequest(QueryOptions):
+    """Schema for answering many questions in one request (options apply to all of them)."""
+
+    questions: List[Annotated[str, Field(min_length=1)]] = Field(
+        ...,
+        min_length=1,
+        max_length=1000,
+        description="Questions to answer",
+    )
+    concurrency: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=64,
+        description="Maximum concurrent LLM generations (default: server setting)",
+    )
+
+
 class SourceDocument(BaseModel):
     """Schema for source document in query response."""
 
     id: UUID
+    chunk_index: Optional[int] = Field(default=None, description="Position of the matched chunk within the document")
     content: str = Field(..., description="Relevant content snippet")
-    score: float = Field(..., description="Similarity score")
+    score: float = Field(..., description="Similarity score (RRF score in hybrid mode, reranker score when reranked)")
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
 
+class TokenUsage(BaseModel):
+    """Schema for LLM token usage."""
+
+    input_tokens: Optional[int] = Field(None, description="Prompt tokens")
+    output_tokens: Optional[int] = Field(None, description="Generated tokens")
+    total_tokens: Optional[int] = Field(None, description="Prompt plus generated tokens")
+
+
 class QueryResponse(BaseModel):
     """Schema for RAG query response."""
 
     answer: str = Field(..., description="Generated answer")
-    sources: List[SourceDocument] = Field(default_factory=list, description="Source documents used")
+    sources: List[SourceDocument] = Field(default_factory=list, description="Source passages sent to the LLM")
+    context_tokens: int = Field(default=0, description="Tokens of context sent to the LLM")
+    usage: Optional[TokenUsage] = Field(None, description="LLM token usage (if reported by the provider)")
+    timings: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Milliseconds per pipeline stage (embedding_ms, retrieval_ms, rerank_ms, context_ms, "
+        "generation_ms) and total_ms",
+    )
+    cached: bool = Field(default=False, description="True if served from the semantic answer cache")
+
+
+class BatchQueryItemResult(BaseModel):
+    """Schema for the outcome of one question in a batch (one NDJSON line)."""
+
+    index: int = Field(..., description="Position of the question in the request")
+    status: Literal["answered", "failed"]
+    response: Optional[QueryResponse] = Field(default=None, description="Answer, if the question was answered")
+    error: Optional[str] = Field(default=None, description="Failure reason")
 
 
 # Health Check Schema
@@ -63,6 +206,24 @@ class HealthResponse(BaseModel):
     database: str = Field(..., description="Database connection status")
 
 
+class EmbeddingCacheStatsResponse(BaseModel):
+    """Schema for embedding cache statistics."""
+
+    memory_hits: int = Field(..., description="Lookups served by the in-process LRU tier")
+    db_hits: int = Field(..., description="Lookups served by the Postgres tier")
+    misses: int = Field(..., description="Lookups that required an embedding API call")
+    memory_entries: int = Field(..., description="Entries currently held in the in-process tier")
+
+
+class EmbeddingQueueStatsResponse(BaseModel):
+    """Schema for embedding queue statistics."""
+
+    queued: int = Field(..., description="Jobs waiting to be claimed")
+    processing: int = Field(..., description="Jobs currently leased by a worker")
+    retrying: int = Field(..., description="Queued jobs that have failed at least once")
+    failed_documents: int = Field(..., description="Documents whose embedding failed permanently")
+
+
 # Error Schema
 class ErrorResponse(BaseModel):
     """Schema for error response."""
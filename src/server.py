@@ -0,0 +1,147 @@
+"""
+Production server.
+
+Usage:
+    uv run python -m src.server
+
+Runs settings.app_workers worker processes on app_host:app_port. With the
+"server" extra installed (uv sync --extra server), gunicorn imports the
+app and the configured provider SDKs once in the master process and
+forks the workers from it (preload), so workers start without
+re-importing and share the imported modules' memory pages. Without it,
+uvicorn's process manager starts workers that each import the app.
+
+On SIGTERM, workers stop accepting connections and in-flight requests
+get up to settings.app_graceful_shutdown_seconds to finish before the
+lifespan shutdown closes the pools.
+
+With several workers and metrics enabled, prometheus_client runs in
+multiprocess mode (see prepare_metrics), so /metrics reports the whole
+server whichever worker answers the scrape.
+"""
+import argparse
+import atexit
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Same as src.metrics.MULTIPROC_DIR_ENV; src.metrics must not be imported before it is set
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def prepare_metrics() -> None:
+    """
+    Make worker processes share their metrics through files.
+
+    Sets PROMETHEUS_MULTIPROC_DIR (to settings.metrics_multiproc_dir, or a
+    temporary directory removed on exit) and empties it, so samples of a
+    previous run are not merged into this one. prometheus_client reads the
+    variable when it is first imported, so this must run before the app
+    (or src.database) is imported; workers inherit it.
+    """
+    if not settings.metrics_enabled or settings.app_workers <= 1:
+        return
+
+    path = os.environ.get(MULTIPROC_DIR_ENV) or settings.metrics_multiproc_dir
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(".db"):
+                os.unlink(os.path.join(path, name))
+    else:
+        path = tempfile.mkdtemp(prefix="rag-metrics-")
+        atexit.register(shutil.rmtree, path, ignore_errors=True)
+    os.environ[MULTIPROC_DIR_ENV] = path
+
+
+def child_exit(server, worker) -> None:
+    """gunicorn hook: drop the live gauges of a worker that exited (including crashes)."""
+    from src.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+def gunicorn_options() -> Dict[str, Any]:
+    """gunicorn settings derived from settings."""
+    return {
+        "bind": f"{settings.app_host}:{settings.app_port}",
+        "workers": settings.app_workers,
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "preload_app": True,
+        "graceful_timeout": settings.app_graceful_shutdown_seconds,
+        "loglevel": settings.log_level.lower(),
+        "child_exit": child_exit,
+    }
+
+
+def run_gunicorn() -> None:
+    """Serve with gunicorn and preloaded uvicorn workers."""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in gunicorn_options().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # With preload_app this runs once, in the master process
+            from src.main import app
+            from src.rag.registry import import_providers
+
+            import_providers()
+            return app
+
+    Server().run()
+
+
+def run_uvicorn() -> None:
+    """Serve with uvicorn's own worker processes (each imports the app)."""
+    import uvicorn
+
+    uvicorn.run(
+        "src.main:app",
+        host=settings.app_host,
+        port=settings.app_port,
+        workers=settings.app_workers,
+        timeout_graceful_shutdown=int(settings.app_graceful_shutdown_seconds),
+        log_level=settings.log_level.lower(),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.server", description="Run the production server.")
+    parser.add_argument(
+        "--server",
+        choices=["auto", "gunicorn", "uvicorn"],
+        default="auto",
+        help="Process manager (auto: gunicorn if installed, else uvicorn)",
+    )
+    args = parser.parse_args()
+
+    server = args.server
+    if server == "auto":
+        server = "gunicorn" if importlib.util.find_spec("gunicorn") is not None else "uvicorn"
+
+    prepare_metrics()
+    from src.database import MAX_OVERFLOW, POOL_SIZE
+
+    logging.basicConfig(level=getattr(logging, settings.log_level.upper()))
+    logger.info(
+        f"Starting {settings.app_workers} {server} workers, each with up to "
+        f"{POOL_SIZE} + {MAX_OVERFLOW} database connections"
+    )
+    if server == "gunicorn":
+        run_gunicorn()
+    else:
+        run_uvicorn()
+
+
+if __name__ == "__main__":
+    main()
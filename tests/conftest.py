@@ -0,0 +1,5 @@
+import os
+
+# src.config requires the provider API keys; the unit tests never call the providers
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from src.rag.answer_cache import AnswerCache, source_scope
+from src.rag.vector_store import SearchResult
+from src.schemas import QueryResponse
+
+DOCUMENT_ID = uuid.uuid4()
+UPDATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+VECTOR = [1.0, 0.0, 0.0]
+
+
+def chunk(content: str, chunk_index: int = 0, updated_at: datetime = UPDATED_AT) -> SearchResult:
+    return SearchResult(
+        id=DOCUMENT_ID,
+        chunk_index=chunk_index,
+        heading="Setup",
+        content=content,
+        metadata={},
+        updated_at=updated_at,
+        score=0.9,
+    )
+
+
+@pytest.fixture
+def cache() -> AnswerCache:
+    return AnswerCache(max_entries=10, ttl_seconds=60, threshold=0.95)
+
+
+def store(cache: AnswerCache, docs, answer: str = "answer") -> None:
+    cache.store(VECTOR, docs, QueryResponse(answer=answer, sources=[]))
+
+
+def test_scope_is_order_independent():
+    first, second = chunk("a", 0), chunk("b", 1)
+    assert source_scope([first, second]) == source_scope([second, first])
+
+
+def test_scope_changes_with_chunk_text():
+    assert source_scope([chunk("old text")]) != source_scope([chunk("new text")])
+
+
+def test_scope_changes_with_heading():
+    assert source_scope([chunk("text")]) != source_scope([chunk("text")._replace(heading="Other")])
+
+
+def test_hit_on_same_chunks(cache):
+    store(cache, [chunk("text")])
+    cached = cache.lookup(VECTOR, [chunk("text")])
+    assert cached is not None and cached.cached and cached.answer == "answer"
+
+
+def test_replaced_chunks_miss_under_same_updated_at(cache):
+    # Answered from the previous chunks while the document was being re-embedded;
+    # the worker then replaces the chunks without touching updated_at
+    store(cache, [chunk("old text")])
+    assert cache.lookup(VECTOR, [chunk("new text")]) is None
+
+
+def test_dissimilar_question_misses(cache):
+    store(cache, [chunk("text")])
+    assert cache.lookup([0.0, 1.0, 0.0], [chunk("text")]) is None
+
+
+def test_invalidate_documents(cache):
+    store(cache, [chunk("text")])
+    cache.invalidate_documents([DOCUMENT_ID])
+    assert cache.lookup(VECTOR, [chunk("text")]) is None
@@ -0,0 +1,206 @@
+import asyncio
+import math
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+
+from src import auth
+from src.auth import (
+    AnyAuthBackend,
+    ApiKeyBackend,
+    BasicAuthBackend,
+    Credentials,
+    Principal,
+    QueryQuota,
+    hash_api_key,
+    rejection,
+)
+from src.rag.limits import TokenBucket
+
+KEY = "rag_test-key"
+PRINCIPAL = Principal(name="client", key_id=uuid.uuid4(), queries_per_minute=60)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    return clock
+
+
+def api_key_backend(monkeypatch, keys, ttl=60.0, negative_ttl=5.0, max_entries=100):
+    """ApiKeyBackend whose database lookups are served from `keys` (key hash -> Principal) and counted."""
+    backend = ApiKeyBackend(ttl_seconds=ttl, negative_ttl_seconds=negative_ttl, max_entries=max_entries)
+    lookups = []
+
+    async def load(key_hash):
+        lookups.append(key_hash)
+        await asyncio.sleep(0)
+        return keys.get(key_hash)
+
+    monkeypatch.setattr(backend, "_load", load)
+    return backend, lookups
+
+
+def bearer(key: str) -> Credentials:
+    return Credentials(basic=None, api_key=key)
+
+
+def basic(username: str, password: str) -> Credentials:
+    return Credentials(basic=HTTPBasicCredentials(username=username, password=password), api_key=None)
+
+
+def test_token_bucket_take():
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 1
+    assert bucket.take(3) == math.inf
+
+
+def test_quota_admits_burst_then_rejects_with_retry_after():
+    quota = QueryQuota(processes=1)
+    for _ in range(60):
+        quota.check(PRINCIPAL)
+    with pytest.raises(HTTPException) as info:
+        quota.check(PRINCIPAL)
+    assert info.value.status_code == 429
+    assert int(info.value.headers["Retry-After"]) >= 1
+
+
+def test_quota_rejects_batch_larger_than_burst_without_retry_after():
+    quota = QueryQuota(processes=1)
+    with pytest.raises(HTTPException) as info:
+        quota.check(PRINCIPAL, cost=1000)
+    assert info.value.status_code == 429
+    assert "at most 60" in info.value.detail
+    assert not info.value.headers
+    # The rejected batch took nothing
+    quota.check(PRINCIPAL, cost=60)
+
+
+def test_quota_charges_batches_their_full_cost():
+    quota = QueryQuota(processes=1)
+    quota.check(PRINCIPAL, cost=40)
+    with pytest.raises(HTTPException) as info:
+        quota.check(PRINCIPAL, cost=40)
+    assert "Retry-After" in info.value.headers
+
+
+def test_quota_is_split_across_processes():
+    quota = QueryQuota(processes=4)
+    quota.check(PRINCIPAL, cost=15)
+    with pytest.raises(HTTPException):
+        quota.check(PRINCIPAL)
+
+
+def test_quota_ignores_unlimited_principals():
+    quota = QueryQuota(processes=1)
+    for principal in (Principal(name="admin"), Principal(name="client", key_id=uuid.uuid4())):
+        for _ in range(1000):
+            quota.check(principal)
+
+
+def test_quota_follows_a_changed_limit():
+    quota = QueryQuota(processes=1)
+    quota.check(PRINCIPAL, cost=60)
+    raised = Principal(name=PRINCIPAL.name, key_id=PRINCIPAL.key_id, queries_per_minute=120)
+    quota.check(raised, cost=120)
+
+
+def test_basic_backend():
+    backend = BasicAuthBackend("admin", "secret")
+    assert asyncio.run(backend.authenticate(basic("admin", "secret"))) == Principal(name="admin")
+    assert asyncio.run(backend.authenticate(basic("admin", "wrong"))) is None
+    assert asyncio.run(backend.authenticate(bearer(KEY))) is None
+
+
+def test_api_key_is_cached_until_ttl(monkeypatch, clock):
+    backend, lookups = api_key_backend(monkeypatch, {hash_api_key(KEY): PRINCIPAL}, ttl=60)
+
+    async def scenario():
+        assert await backend.authenticate(bearer(KEY)) == PRINCIPAL
+        clock.now += 59
+        assert await backend.authenticate(bearer(KEY)) == PRINCIPAL
+        assert len(lookups) == 1
+        clock.now += 2
+        assert await backend.authenticate(bearer(KEY)) == PRINCIPAL
+        assert len(lookups) == 2
+
+    asyncio.run(scenario())
+
+
+def test_unknown_key_is_cached_for_the_negative_ttl(monkeypatch, clock):
+    keys = {}
+    backend, lookups = api_key_backend(monkeypatch, keys, negative_ttl=5)
+
+    async def scenario():
+        assert await backend.authenticate(bearer(KEY)) is None
+        # A key created in the meantime is picked up after the negative TTL
+        keys[hash_api_key(KEY)] = PRINCIPAL
+        clock.now += 4
+        assert await backend.authenticate(bearer(KEY)) is None
+        clock.now += 2
+        assert await backend.authenticate(bearer(KEY)) == PRINCIPAL
+        assert len(lookups) == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_lookup(monkeypatch, clock):
+    backend, lookups = api_key_backend(monkeypatch, {hash_api_key(KEY): PRINCIPAL})
+
+    async def scenario():
+        results = await asyncio.gather(*(backend.authenticate(bearer(KEY)) for _ in range(10)))
+        assert results == [PRINCIPAL] * 10
+        assert len(lookups) == 1
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_keys_are_evicted(monkeypatch, clock):
+    keys = {hash_api_key(f"key-{i}"): Principal(name=str(i), key_id=uuid.uuid4()) for i in range(3)}
+    backend, lookups = api_key_backend(monkeypatch, keys, max_entries=2)
+
+    async def scenario():
+        for i in (0, 1, 0, 2):
+            await backend.authenticate(bearer(f"key-{i}"))
+        assert len(lookups) == 3
+        # key-1 was the least recently used
+        await backend.authenticate(bearer("key-0"))
+        assert len(lookups) == 3
+        await backend.authenticate(bearer("key-1"))
+        assert len(lookups) == 4
+
+    asyncio.run(scenario())
+
+
+def test_api_key_backend_ignores_basic_credentials(monkeypatch):
+    backend, lookups = api_key_backend(monkeypatch, {})
+    assert asyncio.run(backend.authenticate(basic("admin", "secret"))) is None
+    assert lookups == []
+
+
+def test_any_backend_and_rejection(monkeypatch):
+    api_keys, _ = api_key_backend(monkeypatch, {hash_api_key(KEY): PRINCIPAL})
+    backend = AnyAuthBackend([BasicAuthBackend("admin", "secret"), api_keys])
+    assert backend.challenges == ("Basic", "Bearer")
+
+    assert asyncio.run(backend.authenticate(basic("admin", "secret"))) == Principal(name="admin")
+    assert asyncio.run(backend.authenticate(bearer(KEY))) == PRINCIPAL
+
+    assert rejection(backend, bearer("rag_wrong")) == ("Bearer", "Invalid API key")
+    assert rejection(backend, basic("admin", "wrong")) == ("Basic", "Incorrect username or password")
+    assert rejection(backend, Credentials(basic=None, api_key=None)) == ("Basic, Bearer", "Not authenticated")
+    # A scheme the backend does not accept is answered with the ones it does
+    assert rejection(BasicAuthBackend("admin", "secret"), bearer(KEY)) == ("Basic", "Not authenticated")
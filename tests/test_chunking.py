@@ -0,0 +1,168 @@
+from typing import List, Sequence
+
+import pytest
+
+from src.rag import chunking
+from src.rag.chunking import Chunk, chunk_text, split_markdown
+
+
+def count_words(texts: Sequence[str]) -> List[int]:
+    return [len(text.split()) for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word keeps chunk boundaries independent of the tokenizer
+    monkeypatch.setattr(chunking, "count_tokens", count_words)
+
+
+def paragraph(name: str, words: int) -> str:
+    return " ".join(f"{name}{n}" for n in range(words))
+
+
+def contents(chunks: List[Chunk]) -> List[str]:
+    return [chunk.content for chunk in chunks]
+
+
+def test_empty_document():
+    assert split_markdown("", max_tokens=10, overlap_tokens=0) == []
+
+
+def test_heading_trails():
+    text = "\n".join([
+        "# Setup", "", "intro", "",
+        "## Docker", "", "compose up", "",
+        "### Volumes", "", "mount data", "",
+        "## Local", "", "uv sync", "",
+        "# Usage", "", "run it",
+    ])
+    chunks = split_markdown(text, max_tokens=100, overlap_tokens=0)
+
+    assert [chunk.heading for chunk in chunks] == [
+        "Setup", "Setup > Docker", "Setup > Docker > Volumes", "Setup > Local", "Usage",
+    ]
+    assert contents(chunks) == [
+        "# Setup\n\nintro",
+        "## Docker\n\ncompose up",
+        "### Volumes\n\nmount data",
+        "## Local\n\nuv sync",
+        "# Usage\n\nrun it",
+    ]
+    assert [chunk.index for chunk in chunks] == list(range(5))
+
+
+def test_text_before_first_heading():
+    chunks = split_markdown("preamble\n\n# Title\n\nbody", max_tokens=100, overlap_tokens=0)
+    assert [(chunk.heading, chunk.content) for chunk in chunks] == [(None, "preamble"), ("Title", "# Title\n\nbody")]
+
+
+def test_bare_heading_leads_next_section():
+    # A heading directly followed by a subheading is not a chunk of its own
+    chunks = split_markdown("# Guide\n## Install\n\nsteps here", max_tokens=100, overlap_tokens=0)
+    assert [(chunk.heading, chunk.content) for chunk in chunks] == [
+        ("Guide > Install", "# Guide\n\n## Install\n\nsteps here"),
+    ]
+
+
+def test_closing_hashes_are_not_part_of_the_heading():
+    [chunk] = split_markdown("## Setup ##\n\nbody", max_tokens=100, overlap_tokens=0)
+    assert chunk.heading == "Setup"
+
+
+def test_code_fence_is_one_block():
+    text = "\n".join([
+        "# Script", "", "before", "",
+        "```bash", "# not a heading", "", "echo done", "```", "",
+        "after",
+    ])
+    chunks = split_markdown(text, max_tokens=8, overlap_tokens=0)
+
+    assert {chunk.heading for chunk in chunks} == {"Script"}
+    fences = [chunk.content for chunk in chunks if "```bash" in chunk.content]
+    assert fences == ["```bash\n# not a heading\n\necho done\n```"]
+    assert contents(chunks)[-1] == "after"
+
+
+def test_code_fence_closes_only_on_same_marker():
+    text = "~~~\n```\n# inside\n~~~\n\n# Outside\n\nbody"
+    chunks = split_markdown(text, max_tokens=100, overlap_tokens=0)
+    assert [(chunk.heading, chunk.content) for chunk in chunks] == [
+        (None, "~~~\n```\n# inside\n~~~"),
+        ("Outside", "# Outside\n\nbody"),
+    ]
+
+
+def test_chunks_respect_max_tokens():
+    text = "\n\n".join(paragraph(f"p{n}x", 4) for n in range(10))
+    chunks = split_markdown(text, max_tokens=10, overlap_tokens=0)
+
+    assert [chunk.token_count for chunk in chunks] == [8, 8, 8, 8, 8]
+    assert "\n\n".join(contents(chunks)) == text
+
+
+def test_oversized_paragraph_is_split_by_lines():
+    lines = [paragraph(f"l{n}x", 4) for n in range(5)]
+    text = "# Big\n\n" + "\n".join(lines)
+    chunks = split_markdown(text, max_tokens=9, overlap_tokens=0)
+
+    # Lines are kept whole, two per chunk; the bare heading leads the first one on top
+    assert contents(chunks) == [
+        "# Big\n\n" + "\n".join(lines[0:2]),
+        "\n".join(lines[2:4]),
+        lines[4],
+    ]
+    assert [chunk.token_count for chunk in chunks] == [2 + 8, 8, 4]
+    assert all(chunk.heading == "Big" for chunk in chunks)
+
+
+def test_oversized_line_is_split_by_characters():
+    # Short words first: windows sized from the average density hold too many of them
+    line = paragraph("w", 30)
+    chunks = split_markdown(line, max_tokens=8, overlap_tokens=0)
+
+    assert len(chunks) > 1
+    assert "".join(contents(chunks)) == line
+    assert all(chunk.token_count <= 8 for chunk in chunks)
+
+
+def test_overlap_repeats_trailing_blocks():
+    blocks = [paragraph(f"b{n}x", 3) for n in range(6)]
+    chunks = split_markdown("\n\n".join(blocks), max_tokens=9, overlap_tokens=4)
+
+    # Each chunk after the first starts with the previous chunk's last block (3 <= 4 tokens)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.content.startswith(previous.content.split("\n\n")[-1])
+    assert contents(chunks) == [
+        "\n\n".join(blocks[0:3]),
+        "\n\n".join(blocks[2:5]),
+        "\n\n".join(blocks[4:6]),
+    ]
+    assert all(chunk.token_count <= 9 for chunk in chunks)
+
+
+def test_overlap_is_bounded_by_overlap_tokens():
+    blocks = [paragraph(f"b{n}x", 3) for n in range(6)]
+    chunks = split_markdown("\n\n".join(blocks), max_tokens=9, overlap_tokens=6)
+
+    # Two trailing blocks (6 tokens) fit the overlap, three would not
+    assert contents(chunks)[1] == "\n\n".join(blocks[1:4])
+
+
+def test_overlap_leaves_room_for_the_next_block():
+    blocks = [paragraph("a", 3), paragraph("b", 3), paragraph("c", 8)]
+    chunks = split_markdown("\n\n".join(blocks), max_tokens=10, overlap_tokens=6)
+
+    # Only 2 tokens of room remain next to the 8-token block, so nothing is repeated
+    assert contents(chunks) == ["\n\n".join(blocks[:2]), blocks[2]]
+
+
+def test_no_overlap_across_sections():
+    text = f"# One\n\n{paragraph('a', 3)}\n\n# Two\n\n{paragraph('b', 3)}"
+    chunks = split_markdown(text, max_tokens=100, overlap_tokens=50)
+    assert contents(chunks) == [f"# One\n\n{paragraph('a', 3)}", f"# Two\n\n{paragraph('b', 3)}"]
+
+
+def test_embedding_text_prefixes_heading_trail():
+    [chunk] = split_markdown("# A\n## B\n\nbody", max_tokens=100, overlap_tokens=0)
+    assert chunk.embedding_text == "A > B\n\n# A\n\n## B\n\nbody"
+    assert chunk_text(None, "body") == "body"
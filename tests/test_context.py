@@ -0,0 +1,186 @@
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+import pytest
+
+from src.config import settings
+from src.rag import context
+from src.rag.context import ELLIPSIS, build_context, format_docs
+from src.rag.tokens import estimate_tokens
+from src.rag.vector_store import SearchResult
+
+UPDATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def count_words(texts: Sequence[str]) -> List[int]:
+    return [len(text.split()) for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word keeps budgets independent of the tokenizer
+    monkeypatch.setattr(context, "count_tokens", count_words)
+    monkeypatch.setattr(settings, "context_min_passage_tokens", 4)
+
+
+def passage(content: str, score: float, heading: Optional[str] = None) -> SearchResult:
+    return SearchResult(
+        id=uuid.uuid4(),
+        chunk_index=0,
+        heading=heading,
+        content=content,
+        metadata={},
+        updated_at=UPDATED_AT,
+        score=score,
+    )
+
+
+def words(name: str, count: int) -> str:
+    return " ".join(f"{name}{n}" for n in range(count))
+
+
+def test_passages_in_score_order():
+    low, high, middle = passage(words("a", 5), 0.1), passage(words("b", 5), 0.9), passage(words("c", 5), 0.5)
+    built = build_context([low, high, middle], "question", max_tokens=100, dedup_threshold=0.85)
+
+    assert built.passages == [high, middle, low]
+    assert built.dropped == 0
+    assert built.tokens == len(format_docs(built.passages).split()) == 15
+
+
+def test_empty_context():
+    built = build_context([], "question", max_tokens=100, dedup_threshold=0.85)
+    assert built.passages == [] and built.tokens == 0 and built.dropped == 0
+
+
+def test_stays_within_budget():
+    docs = [passage(words(f"p{n}x", 10), 1.0 - n / 10) for n in range(8)]
+    built = build_context(docs, "question", max_tokens=35, dedup_threshold=0.85)
+
+    assert built.tokens <= 35
+    assert built.passages == docs[:3]
+    assert built.dropped == 5
+
+
+def test_smaller_passage_after_one_that_does_not_fit():
+    large = passage(words("large", 30), 0.8)
+    small = passage(words("small", 5), 0.5)
+    first = passage(words("first", 10), 0.9)
+    built = build_context([first, large, small], "unrelated", max_tokens=18, dedup_threshold=0.85)
+
+    # large cannot be trimmed into the remaining 8 tokens (one line of 30), small still fits
+    assert built.passages == [first, small]
+    assert built.tokens <= 18
+
+
+def test_near_duplicates_are_dropped():
+    text = words("alpha", 40)
+    best = passage(text, 0.9)
+    copy = passage(text.replace("alpha17", "alpha17x"), 0.8)
+    other = passage(words("beta", 40), 0.7)
+    built = build_context([copy, other, best], "question", max_tokens=1000, dedup_threshold=0.85)
+
+    # The better-scored copy is kept, whatever the retrieval order
+    assert built.passages == [best, other]
+    assert built.dropped == 1
+
+
+def test_near_duplicates_without_word_boundaries():
+    text = (
+        "設定ファイルの場所は環境変数で変更できます。既定ではホームディレクトリの下に作成されます。"
+        "ファイルが存在しない場合は初回起動時に既定値で作成され、以降の起動ではその内容が読み込まれます。"
+    )
+    best = passage(text, 0.9)
+    copy = passage(text.replace("既定では", "既定では、"), 0.8)
+    built = build_context([best, copy], "設定", max_tokens=1000, dedup_threshold=0.85)
+    assert built.passages == [best]
+
+
+def test_dedup_threshold():
+    first = passage(words("alpha", 10) + " " + words("beta", 10), 0.9)
+    second = passage(words("alpha", 10) + " " + words("gamma", 10), 0.8)
+    # About half of the 5-grams are shared
+    assert len(build_context([first, second], "q", max_tokens=1000, dedup_threshold=0.85).passages) == 2
+    assert len(build_context([first, second], "q", max_tokens=1000, dedup_threshold=0.3).passages) == 1
+
+
+def numbered_lines(count: int, hit: int, term: str = "docker") -> List[str]:
+    return [f"line{n} {term} here" if n == hit else f"line{n} filler text" for n in range(count)]
+
+
+def test_trim_keeps_whole_lines_around_the_hit():
+    lines = numbered_lines(20, hit=10)
+    first = passage(words("first", 10), 0.9)
+    long = passage("\n".join(lines), 0.8, heading="Setup")
+    built = build_context([first, long], "How do I run docker?", max_tokens=30, dedup_threshold=0.85)
+
+    assert built.tokens <= 30
+    trimmed = built.passages[1]
+    assert trimmed.heading == "Setup"
+    body = trimmed.content.split("\n")
+    # Cut on line boundaries, marked at both ends, around the matching line
+    assert body[0] == ELLIPSIS and body[-1] == ELLIPSIS
+    kept = body[1:-1]
+    start = lines.index(kept[0])
+    assert kept == lines[start:start + len(kept)]
+    assert "line10 docker here" in kept
+    assert 0 < start and start + len(kept) < len(lines)
+
+
+def test_trim_at_the_start_has_no_leading_ellipsis():
+    lines = numbered_lines(20, hit=0)
+    first = passage(words("first", 10), 0.9)
+    built = build_context(
+        [first, passage("\n".join(lines), 0.8)], "docker", max_tokens=25, dedup_threshold=0.85
+    )
+
+    body = built.passages[1].content.split("\n")
+    assert body[0] == lines[0]
+    assert body[-1] == ELLIPSIS
+    assert built.tokens <= 25
+
+
+def test_trim_prefers_lines_with_more_hits():
+    lines = [
+        "intro filler",
+        "docker compose",
+        "docker compose volumes",
+        "unrelated words",
+        "docker",
+        "end",
+    ]
+    first = passage(words("first", 10), 0.9)
+    built = build_context(
+        [first, passage("\n".join(lines), 0.8)], "docker compose volumes", max_tokens=20, dedup_threshold=0.85
+    )
+    body = built.passages[1].content.split("\n")
+    assert "docker compose volumes" in body and "docker compose" in body
+
+
+def test_no_trim_below_min_passage_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "context_min_passage_tokens", 10)
+    first = passage(words("first", 10), 0.9)
+    long = passage("\n".join(numbered_lines(20, hit=3)), 0.8)
+    built = build_context([first, long], "docker", max_tokens=18, dedup_threshold=0.85)
+    assert built.passages == [first]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_budget_with_estimated_tokens(monkeypatch, seed):
+    # Byte-length estimates are not additive; the formatted context must still fit
+    monkeypatch.setattr(context, "count_tokens", lambda texts: [estimate_tokens(text) for text in texts])
+    rng = random.Random(seed)
+    vocabulary = ["docker", "compose", "volume", "設定", "環境変数", "x", "configuration", "の"]
+    docs = [
+        passage(
+            "\n".join(" ".join(rng.choices(vocabulary, k=rng.randint(1, 12))) for _ in range(rng.randint(1, 15))),
+            rng.random(),
+            heading=rng.choice([None, "Setup", "Setup > Docker"]),
+        )
+        for _ in range(10)
+    ]
+    max_tokens = rng.randint(20, 200)
+    built = build_context(docs, "docker 設定", max_tokens=max_tokens, dedup_threshold=0.85)
+    assert built.tokens <= max_tokens
@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+from src.rag import embedding_cache
+from src.rag.embedding_cache import EmbeddingCache
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        return None
+
+    async def commit(self):
+        return None
+
+
+def make_cache(monkeypatch, prune_interval_seconds: int = 0) -> EmbeddingCache:
+    monkeypatch.setattr(embedding_cache, "AsyncSessionLocal", FakeSession)
+    return EmbeddingCache(
+        model="test-model",
+        max_memory_entries=10,
+        ttl_seconds=60,
+        max_db_entries=100,
+        prune_interval_seconds=prune_interval_seconds,
+    )
+
+
+def test_aput_does_not_wait_for_prune(monkeypatch):
+    cache = make_cache(monkeypatch)
+    release = asyncio.Event()
+    prunes = []
+
+    async def aprune():
+        prunes.append(1)
+        await release.wait()
+
+    monkeypatch.setattr(cache, "aprune", aprune)
+
+    async def main():
+        await asyncio.wait_for(cache.aput({"a": np.zeros(3, dtype=np.float32)}), timeout=1)
+        await asyncio.sleep(0)
+        # Another write while the prune runs does not start a second one
+        await asyncio.wait_for(cache.aput({"b": np.zeros(3, dtype=np.float32)}), timeout=1)
+        await asyncio.sleep(0)
+        assert prunes == [1]
+        release.set()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cache._prune_task is None
+
+
+def test_no_prune_within_interval(monkeypatch):
+    cache = make_cache(monkeypatch, prune_interval_seconds=3600)
+
+    async def aprune():
+        raise AssertionError("pruned within the interval")
+
+    monkeypatch.setattr(cache, "aprune", aprune)
+    asyncio.run(cache.aput({"a": np.zeros(3, dtype=np.float32)}))
+    assert cache._prune_task is None
+
+
+def test_aclose_cancels_prune(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def aprune():
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(cache, "aprune", aprune)
+
+    async def main():
+        await cache.aput({"a": np.zeros(3, dtype=np.float32)})
+        await asyncio.sleep(0)
+        await asyncio.wait_for(cache.aclose(), timeout=1)
+
+    asyncio.run(main())
+    assert cache._prune_task is None
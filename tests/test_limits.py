@@ -0,0 +1,244 @@
+import asyncio
+
+import pytest
+
+from src.rag.limits import ProviderLimiter, ProviderOverloaded, is_retryable
+
+
+class ProviderError(Exception):
+    """Provider SDK error carrying an HTTP status and optional response headers."""
+
+    def __init__(self, status_code: int, retry_after: float | None = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = type("Response", (), {"headers": headers})()
+
+
+def make_limiter(**overrides) -> ProviderLimiter:
+    options = dict(
+        name="test",
+        max_concurrency=4,
+        min_concurrency=1,
+        requests_per_second=0,
+        max_queue=10,
+        deadline_seconds=5.0,
+        max_retries=0,
+        backoff_seconds=0.0,
+        backoff_max_seconds=0.0,
+        failure_threshold=2,
+        reset_seconds=60.0,
+    )
+    options.update(overrides)
+    return ProviderLimiter(**options)
+
+
+def succeed(value="ok"):
+    async def fn():
+        return value
+    return fn
+
+
+def fail(error: Exception):
+    async def fn():
+        raise error
+    return fn
+
+
+async def shed(limiter: ProviderLimiter, fn) -> ProviderOverloaded:
+    with pytest.raises(ProviderOverloaded) as info:
+        await limiter.call(fn)
+    return info.value
+
+
+def test_is_retryable():
+    assert is_retryable(ProviderError(429))
+    assert is_retryable(ProviderError(503))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ValueError("bad input"))
+
+
+def test_circuit_opens_after_consecutive_failures():
+    async def scenario():
+        limiter = make_limiter(failure_threshold=2)
+        assert (await shed(limiter, fail(ProviderError(503)))).reason == "retries_exhausted"
+        assert (await shed(limiter, fail(ProviderError(503)))).reason == "retries_exhausted"
+
+        calls = []
+
+        async def fn():
+            calls.append(1)
+
+        error = await shed(limiter, fn)
+        assert error.reason == "circuit_open"
+        assert error.status_code == 503
+        assert 59 <= error.retry_after <= 60
+        assert calls == []
+
+    asyncio.run(scenario())
+
+
+def test_half_open_circuit_admits_one_probe_and_closes_on_success():
+    async def scenario():
+        limiter = make_limiter(failure_threshold=1, reset_seconds=0.05)
+        await shed(limiter, fail(ProviderError(503)))
+        await asyncio.sleep(0.06)
+
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return "probe"
+
+        probe_task = asyncio.create_task(limiter.call(probe))
+        await asyncio.sleep(0)
+        assert (await shed(limiter, succeed())).reason == "circuit_open"
+
+        release.set()
+        assert await probe_task == "probe"
+        assert await limiter.call(succeed()) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_circuit():
+    async def scenario():
+        limiter = make_limiter(failure_threshold=3, reset_seconds=0.05)
+        for _ in range(3):
+            await shed(limiter, fail(ProviderError(503)))
+        await asyncio.sleep(0.06)
+
+        # One failed probe is enough, even below the failure threshold
+        assert (await shed(limiter, fail(ProviderError(503)))).reason == "retries_exhausted"
+        assert (await shed(limiter, succeed())).reason == "circuit_open"
+
+    asyncio.run(scenario())
+
+
+def test_non_retryable_error_is_raised_unchanged_and_keeps_circuit_closed():
+    async def scenario():
+        limiter = make_limiter(failure_threshold=1)
+        error = ProviderError(400)
+        with pytest.raises(ProviderError) as info:
+            await limiter.call(fail(error))
+        assert info.value is error
+        assert await limiter.call(succeed()) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_throttling_halves_the_limit_and_success_grows_it():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=8, min_concurrency=1)
+        assert limiter.limit == 8
+
+        error = await shed(limiter, fail(ProviderError(429)))
+        assert error.status_code == 429
+        assert limiter.limit == 4
+        await shed(limiter, fail(ProviderError(429)))
+        assert limiter.limit == 2
+
+        # Additive increase: +1 after a window of `limit` successful calls
+        for _ in range(2):
+            await limiter.call(succeed())
+        assert 2.9 <= limiter.limit <= 3.0
+
+    asyncio.run(scenario())
+
+
+def test_limit_never_drops_below_min_concurrency():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=4, min_concurrency=2)
+        for _ in range(5):
+            await shed(limiter, fail(ProviderError(429)))
+        assert limiter.limit == 2
+
+    asyncio.run(scenario())
+
+
+def test_retry_honours_retry_after_and_then_succeeds():
+    async def scenario():
+        limiter = make_limiter(max_retries=2)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ProviderError(503, retry_after=0)
+            return "recovered"
+
+        assert await limiter.call(flaky) == "recovered"
+        assert len(attempts) == 2
+
+    asyncio.run(scenario())
+
+
+def test_retries_give_up_when_retry_after_passes_the_deadline():
+    async def scenario():
+        limiter = make_limiter(max_retries=5, deadline_seconds=0.5)
+        error = await shed(limiter, fail(ProviderError(429, retry_after=30)))
+        assert error.reason == "retries_exhausted"
+        assert error.status_code == 429
+        assert error.retry_after == 30
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_sheds_with_retry_after():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=1, max_queue=0)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        holder = asyncio.create_task(limiter.call(slow))
+        await asyncio.sleep(0)
+        error = await shed(limiter, succeed())
+        assert error.reason == "queue_full"
+        assert error.status_code == 503
+        assert error.retry_after >= 1
+
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+
+
+def test_queued_call_is_shed_at_its_deadline_and_frees_its_place():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=1, deadline_seconds=0.05)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        holder = asyncio.create_task(limiter.call(slow))
+        await asyncio.sleep(0)
+        assert (await shed(limiter, succeed())).reason == "deadline"
+        assert not limiter._waiters
+
+        release.set()
+        await holder
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_queued_calls_run_in_order_as_slots_free_up():
+    async def scenario():
+        limiter = make_limiter(max_concurrency=1)
+        order = []
+
+        def record(i):
+            async def fn():
+                order.append(i)
+                await asyncio.sleep(0)
+            return fn
+
+        await asyncio.gather(*(limiter.call(record(i)) for i in range(5)))
+        assert order == [0, 1, 2, 3, 4]
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
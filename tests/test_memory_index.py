@@ -0,0 +1,415 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pytest
+
+from src.rag.memory_index import (
+    MemoryVectorIndex,
+    _apply,
+    _compacted,
+    _Document,
+    _empty_state,
+    _jsonb_contains,
+    _matches,
+    _read_snapshot,
+    _Rows,
+    _State,
+    _top_k,
+    _write_snapshot,
+)
+from src.rag.vector_index import EMBEDDING_DIMENSIONS
+from src.rag.vector_store import filter_conditions
+from src.schemas import MetadataFilter
+
+CREATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# (document metadata, contained value, result of Postgres `metadata @> contained`)
+JSONB_CONTAINS_CASES = [
+    ({"a": 1}, {}, True),
+    ({"tags": ["x", "y", "z"]}, {"tags": ["y", "x"]}, True),
+    ({"tags": ["x"]}, {"tags": ["x", "x"]}, True),
+    ({"tags": ["x"]}, {"tags": ["x", "y"]}, False),
+    ({"tags": ["x", "y"]}, {"tags": []}, True),
+    # Only a top-level array may contain a bare scalar
+    ({"tags": ["x", "y"]}, {"tags": "x"}, False),
+    ({"tags": "x"}, {"tags": ["x"]}, False),
+    # Booleans are not numbers
+    ({"n": 1}, {"n": True}, False),
+    ({"n": True}, {"n": 1}, False),
+    ({"n": 0}, {"n": False}, False),
+    ({"n": [1, 2]}, {"n": [True]}, False),
+    # Numbers compare by value, strings do not match numbers
+    ({"n": 1}, {"n": 1.0}, True),
+    ({"n": 1.5}, {"n": 1.5}, True),
+    ({"s": "1"}, {"s": 1}, False),
+    # Nested objects and arrays are contained recursively
+    ({"a": {"b": 1, "c": 2}}, {"a": {"b": 1}}, True),
+    ({"a": {"b": 1}}, {"a": {"b": 1, "c": 2}}, False),
+    ({"a": [{"b": 1, "c": 2}, 3]}, {"a": [{"b": 1}]}, True),
+    ({"a": [[1, 2], 3]}, {"a": [[2]]}, True),
+    ({"a": [[1, 2], 3]}, {"a": [2]}, False),
+    ({"a": {}}, {"a": []}, False),
+    ({"a": None}, {"a": None}, True),
+    ({"a": False}, {"a": None}, False),
+    ({}, {"a": None}, False),
+]
+
+FILTERS = [
+    MetadataFilter(),
+    MetadataFilter(tags=["guide"]),
+    MetadataFilter(tags=["guide", "setup"]),
+    MetadataFilter(equals={"lang": "ja"}),
+    MetadataFilter(equals={"draft": True}),
+    MetadataFilter(equals={"version": 2}),
+    MetadataFilter(equals={"version": 2.0}),
+    MetadataFilter(tags=["guide"], equals={"lang": "en"}),
+    MetadataFilter(created_after=CREATED_AT + timedelta(days=1)),
+    MetadataFilter(created_before=CREATED_AT + timedelta(days=1)),
+    MetadataFilter(created_after=CREATED_AT, created_before=CREATED_AT + timedelta(days=2)),
+    # Naive bounds are taken as UTC
+    MetadataFilter(created_before=datetime(2026, 1, 2)),
+]
+
+DOCUMENT_METADATA = [
+    {"tags": ["guide", "setup"], "lang": "ja", "version": 2},
+    {"tags": ["guide"], "lang": "en", "draft": True},
+    {"tags": "guide", "lang": "ja", "draft": 1},
+    {"tags": ["faq"], "version": 2.0},
+    {"lang": "en", "version": "2"},
+    {},
+]
+
+
+def make_document(metadata=None, days: int = 0) -> _Document:
+    created_at = CREATED_AT + timedelta(days=days)
+    return _Document(
+        id=uuid.uuid4(),
+        metadata=metadata or {},
+        created_at=created_at,
+        updated_at=created_at,
+        version=(created_at, created_at, 0),
+    )
+
+
+def unit(*components: Tuple[int, float]) -> np.ndarray:
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for dimension, value in components:
+        vector[dimension] = value
+    return vector / np.linalg.norm(vector)
+
+
+def rows(*documents: Tuple[_Document, Sequence[np.ndarray]]) -> _Rows:
+    loaded = _Rows()
+    for document, vectors in documents:
+        offset = len(loaded.chunk_index)
+        loaded.documents.append(document)
+        loaded.ranges.append((offset, offset + len(vectors)))
+        for index, vector in enumerate(vectors):
+            loaded.chunk_index.append(index)
+            loaded.headings.append(f"{document.id} heading")
+            loaded.contents.append(f"{document.id} chunk {index}")
+            loaded.vectors.append(vector)
+    return loaded
+
+
+def search(
+    state: _State, query: np.ndarray, k: int, metadata_filter: Optional[MetadataFilter] = None
+) -> List[Tuple[uuid.UUID, int, str, float]]:
+    """Top k as (document id, chunk index, content, score), independent of row positions."""
+    [hits] = _top_k(state, query[np.newaxis, :], k, metadata_filter)
+    return [
+        (
+            state.documents[state.row_document[row]].id,
+            int(state.chunk_index[row]),
+            state.contents[row],
+            round(score, 5),
+        )
+        for row, score in hits
+    ]
+
+
+def assert_consistent(state: _State) -> None:
+    """Every live row belongs to a live document whose rows and ordinal point back at it."""
+    assert len(state.base) + len(state.extra) == state.size == len(state.row_document) == len(state.chunk_index)
+    assert len(state.headings) >= state.size and len(state.contents) >= state.size
+    live_rows = set()
+    for document_id, document_rows in state.rows.items():
+        ordinal = state.ordinals[document_id]
+        assert state.documents[ordinal].id == document_id
+        assert state.alive[document_rows].all()
+        assert (state.row_document[document_rows] == ordinal).all()
+        live_rows.update(int(row) for row in document_rows)
+    assert live_rows == set(np.flatnonzero(state.alive).tolist())
+    assert set(state.ordinals) == {document.id for document in state.documents if document is not None}
+
+
+# Filter parity with the SQL of filter_conditions
+
+
+@pytest.mark.parametrize("metadata, contained, expected", JSONB_CONTAINS_CASES)
+def test_jsonb_contains(metadata, contained, expected):
+    assert _jsonb_contains(metadata, contained) is expected
+
+
+@pytest.mark.parametrize("metadata_filter", FILTERS)
+@pytest.mark.parametrize("metadata", DOCUMENT_METADATA)
+def test_matches_evaluates_filter_conditions(metadata, metadata_filter):
+    # _matches must apply the same containment value and date bounds as the SQL
+    contained = {}
+    after = before = None
+    for condition in filter_conditions(metadata_filter):
+        sql = str(condition)
+        if sql.startswith("documents.metadata @>"):
+            contained = condition.right.value
+        elif sql.startswith("documents.created_at >="):
+            after = condition.right.value
+        elif sql.startswith("documents.created_at <"):
+            before = condition.right.value
+        else:
+            pytest.fail(f"Unexpected filter condition {sql}")
+
+    for days in (0, 1, 2):
+        document = make_document(metadata, days)
+        expected = (
+            _jsonb_contains(metadata, contained)
+            and (after is None or document.created_at >= after.replace(tzinfo=after.tzinfo or timezone.utc))
+            and (before is None or document.created_at < before.replace(tzinfo=before.tzinfo or timezone.utc))
+        )
+        assert _matches(document, metadata_filter) is expected
+
+
+def test_matches_date_bounds():
+    document = make_document(days=1)
+    assert _matches(document, MetadataFilter(created_after=document.created_at))
+    assert not _matches(document, MetadataFilter(created_before=document.created_at))
+    assert _matches(document, MetadataFilter(created_before=document.created_at + timedelta(microseconds=1)))
+
+
+def test_matches_removed_document():
+    assert not _matches(None, MetadataFilter())
+
+
+@pytest.mark.skipif("TEST_DATABASE_URL" not in os.environ, reason="needs TEST_DATABASE_URL (a Postgres database)")
+def test_matches_agrees_with_postgres():
+    from sqlalchemy import select, text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from src.models import Document
+
+    documents = [make_document(metadata, days) for metadata in DOCUMENT_METADATA for days in (0, 1, 2)]
+
+    async def main():
+        engine = create_async_engine(os.environ["TEST_DATABASE_URL"])
+        try:
+            async with engine.connect() as conn:
+                async with conn.begin() as transaction:
+                    # Shadows documents for this transaction (pg_temp comes first in the search path)
+                    await conn.execute(
+                        text("CREATE TEMP TABLE documents (id uuid, metadata jsonb, created_at timestamptz)")
+                    )
+                    for document in documents:
+                        await conn.execute(
+                            text("INSERT INTO documents VALUES (:id, CAST(:metadata AS jsonb), :created_at)"),
+                            {
+                                "id": document.id,
+                                "metadata": json.dumps(document.metadata),
+                                "created_at": document.created_at,
+                            },
+                        )
+                    for metadata, contained, expected in JSONB_CONTAINS_CASES:
+                        result = await conn.scalar(
+                            text("SELECT CAST(:metadata AS jsonb) @> CAST(:contained AS jsonb)"),
+                            {"metadata": json.dumps(metadata), "contained": json.dumps(contained)},
+                        )
+                        assert result is expected, (metadata, contained)
+                    for metadata_filter in FILTERS:
+                        found = set(
+                            await conn.scalars(select(Document.id).where(*filter_conditions(metadata_filter)))
+                        )
+                        assert found == {
+                            document.id for document in documents if _matches(document, metadata_filter)
+                        }, metadata_filter
+                    await transaction.rollback()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+# Row and ordinal bookkeeping
+
+
+def test_apply_appends_documents():
+    first, second = make_document(), make_document()
+    state = _apply(_empty_state(), rows((first, [unit((0, 1)), unit((1, 1))]), (second, [unit((2, 1))])), [])
+
+    assert_consistent(state)
+    assert state.size == 3
+    assert state.ordinals == {first.id: 0, second.id: 1}
+    assert state.rows[first.id].tolist() == [0, 1]
+    assert state.rows[second.id].tolist() == [2]
+    assert state.chunk_index.tolist() == [0, 1, 0]
+    assert search(state, unit((1, 1)), 1) == [(first.id, 1, f"{first.id} chunk 1", 1.0)]
+    assert search(state, unit((2, 1)), 1) == [(second.id, 0, f"{second.id} chunk 0", 1.0)]
+
+
+def test_apply_reloads_and_removes_documents():
+    first, second, third = make_document(), make_document(), make_document()
+    state = _apply(
+        _empty_state(),
+        rows((first, [unit((0, 1)), unit((1, 1))]), (second, [unit((2, 1))]), (third, [unit((3, 1))])),
+        [],
+    )
+    reloaded = _Document(first.id, {"edited": True}, first.created_at, first.updated_at, first.version)
+    state = _apply(state, rows((reloaded, [unit((4, 1))])), [second.id])
+
+    assert_consistent(state)
+    assert state.size == 5
+    assert state.alive.tolist() == [False, False, False, True, True]
+    assert state.documents[0] is None and state.documents[1] is None
+    assert state.ordinals == {third.id: 2, first.id: 3}
+    assert state.rows[first.id].tolist() == [4]
+    # The old rows of the reloaded document and the removed document are never returned
+    hits = search(state, unit((0, 1)), 5)
+    assert sorted(hit[0] for hit in hits) == sorted([first.id, third.id])
+    assert search(state, unit((4, 1)), 1) == [(first.id, 0, f"{first.id} chunk 0", 1.0)]
+    assert state.documents[state.ordinals[first.id]].metadata == {"edited": True}
+
+
+def test_apply_removing_unknown_document_is_a_no_op():
+    document = make_document()
+    state = _apply(_empty_state(), rows((document, [unit((0, 1))])), [])
+    state = _apply(state, _Rows(), [uuid.uuid4()])
+    assert_consistent(state)
+    assert state.alive.tolist() == [True]
+
+
+def test_document_without_chunks_is_dropped():
+    document = make_document()
+    state = _apply(_empty_state(), rows((document, [unit((0, 1))])), [])
+    state = _apply(state, _Rows(), [document.id])
+    assert_consistent(state)
+    assert state.ordinals == {} and state.rows == {}
+    assert search(state, unit((0, 1)), 3) == []
+
+
+def test_apply_does_not_change_previous_state():
+    first, second = make_document(), make_document()
+    before = _apply(_empty_state(), rows((first, [unit((0, 1))])), [])
+    _apply(before, rows((second, [unit((1, 1))])), [first.id])
+    assert before.alive.tolist() == [True]
+    assert before.ordinals == {first.id: 0}
+    assert search(before, unit((0, 1)), 1)[0][0] == first.id
+
+
+def random_state(seed: int = 0, documents: int = 12, chunks: int = 3):
+    rng = np.random.default_rng(seed)
+    made = []
+    for n in range(documents):
+        metadata = {"tags": ["even"] if n % 2 == 0 else ["odd"], "n": n}
+        matrix = rng.standard_normal((chunks, EMBEDDING_DIMENSIONS)).astype(np.float32)
+        vectors = list(matrix / np.linalg.norm(matrix, axis=1, keepdims=True))
+        made.append((make_document(metadata, days=n % 3), vectors))
+    return rng, made
+
+
+def test_compaction_keeps_search_results():
+    rng, made = random_state()
+    state = _apply(_empty_state(), rows(*made[:8]), [])
+    # Reload some documents, remove others, append new ones
+    state = _apply(state, rows(*made[8:], made[1], made[2]), [made[3][0].id, made[4][0].id])
+    assert_consistent(state)
+    compacted = _compacted(state)
+    assert_consistent(compacted)
+
+    assert compacted.size == int(state.alive.sum()) == 10 * 3
+    assert compacted.alive.all() and len(compacted.extra) == 0
+    assert None not in compacted.documents
+    assert sorted(compacted.ordinals.values()) == list(range(len(compacted.documents)))
+    assert set(compacted.ordinals) == set(state.ordinals)
+    for document_id, document_rows in compacted.rows.items():
+        assert compacted.chunk_index[document_rows].tolist() == [0, 1, 2]
+
+    queries = rng.standard_normal((5, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    for query in queries / np.linalg.norm(queries, axis=1, keepdims=True):
+        for metadata_filter in (None, MetadataFilter(tags=["even"]), MetadataFilter(equals={"n": 9})):
+            assert search(compacted, query, 7, metadata_filter) == search(state, query, 7, metadata_filter)
+
+
+def brute_force(state: _State, query: np.ndarray, k: int, metadata_filter: Optional[MetadataFilter]):
+    expected = []
+    for row in range(state.size):
+        document = state.documents[state.row_document[row]]
+        if state.alive[row] and (metadata_filter is None or _matches(document, metadata_filter)):
+            expected.append((float(state.vector(row) @ query), document.id, int(state.chunk_index[row])))
+    expected.sort(key=lambda hit: -hit[0])
+    return [(document_id, chunk_index) for _, document_id, chunk_index in expected[:k]]
+
+
+@pytest.mark.parametrize(
+    "metadata_filter",
+    [
+        None,
+        MetadataFilter(tags=["even"]),  # scores the whole matrix and masks it
+        MetadataFilter(equals={"n": 5}),  # selective: scores only the matching rows
+        MetadataFilter(equals={"n": 11}),  # selective, rows appended after compaction
+        MetadataFilter(tags=["odd"], created_after=CREATED_AT + timedelta(days=2)),
+        MetadataFilter(equals={"n": 99}),  # no matching rows
+    ],
+)
+def test_top_k_matches_brute_force(metadata_filter):
+    rng, made = random_state(seed=1)
+    # Base (compacted) rows plus rows appended since, some of which replace base rows
+    state = _compacted(_apply(_empty_state(), rows(*made[:10]), []))
+    state = _apply(state, rows(*made[10:], made[5]), [made[2][0].id])
+    assert len(state.base) and len(state.extra)
+
+    queries = rng.standard_normal((3, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    hits = _top_k(state, queries, 4, metadata_filter)
+    for query, query_hits in zip(queries, hits):
+        scores = [score for _, score in query_hits]
+        assert scores == sorted(scores, reverse=True)
+        found = [(state.documents[state.row_document[row]].id, int(state.chunk_index[row])) for row, _ in query_hits]
+        assert found == brute_force(state, query, 4, metadata_filter)
+
+
+def test_selective_filter_returns_fewer_than_k():
+    _, made = random_state(seed=2)
+    state = _apply(_empty_state(), rows(*made), [])
+    query = made[7][1][0]
+    hits = search(state, query, 10, MetadataFilter(equals={"n": 7}))
+    assert [(document_id, chunk_index) for document_id, chunk_index, _, _ in hits][0] == (made[7][0].id, 0)
+    assert {hit[0] for hit in hits} == {made[7][0].id} and len(hits) == 3
+
+
+def test_snapshot_round_trip(tmp_path):
+    rng, made = random_state(seed=3)
+    state = _compacted(_apply(_apply(_empty_state(), rows(*made), []), rows(made[0]), [made[1][0].id]))
+    _write_snapshot(state, str(tmp_path))
+    loaded = _read_snapshot(str(tmp_path))
+    assert_consistent(loaded)
+    query = made[0][1][2]
+    assert search(loaded, query, 5) == search(state, query, 5)
+    odd = MetadataFilter(tags=["odd"])
+    assert search(loaded, query, 5, odd) == search(state, query, 5, odd)
+
+
+def test_search_returns_search_results():
+    document = make_document({"tags": ["guide"]})
+    index = MemoryVectorIndex(snapshot_path=None, refresh_delay_seconds=0, keepalive_seconds=1)
+    index._set_state(_apply(_empty_state(), rows((document, [unit((0, 1)), unit((0, 1), (1, 1))])), []))
+
+    [results] = asyncio.run(index.search([unit((0, 2)).tolist()], k=2, with_embeddings=True))
+    assert [(result.id, result.chunk_index) for result in results] == [(document.id, 0), (document.id, 1)]
+    assert results[0].heading == f"{document.id} heading"
+    assert results[0].content == f"{document.id} chunk 0"
+    assert results[0].metadata == {"tags": ["guide"]}
+    assert results[0].score == pytest.approx(1.0)
+    assert results[1].score == pytest.approx(2 ** -0.5)
+    assert np.allclose(results[0].embedding, unit((0, 1)))
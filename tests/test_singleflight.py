@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from src.rag.singleflight import SingleFlight, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  What   is RAG？ ") == normalize_question("what is rag?")
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight: SingleFlight[int] = SingleFlight("test")
+        started = []
+
+        async def compute():
+            started.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+        assert results == [42] * 5
+        assert len(started) == 1
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight: SingleFlight[str] = SingleFlight("test")
+
+        def compute(value):
+            async def fn():
+                await asyncio.sleep(0)
+                return value
+            return fn
+
+        assert await asyncio.gather(flight.do("a", compute("a")), flight.do("b", compute("b"))) == ["a", "b"]
+
+    asyncio.run(scenario())
+
+
+def test_key_is_forgotten_once_finished():
+    async def scenario():
+        flight: SingleFlight[int] = SingleFlight("test")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return len(calls)
+
+        assert await flight.do("key", compute) == 1
+        assert await flight.do("key", compute) == 2
+
+    asyncio.run(scenario())
+
+
+def test_error_propagates_to_every_waiter():
+    async def scenario():
+        flight: SingleFlight[int] = SingleFlight("test")
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flight.do("key", compute) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        # A failure is not remembered either
+        with pytest.raises(ValueError):
+            await flight.do("key", compute)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight: SingleFlight[str] = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "done"
+
+        leaver = asyncio.create_task(flight.do("key", compute))
+        stayer = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        await asyncio.sleep(0)
+
+        release.set()
+        assert await stayer == "done"
+        assert leaver.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_computation_is_cancelled_when_every_caller_leaves():
+    async def scenario():
+        flight: SingleFlight[str] = SingleFlight("test")
+        cancelled = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "never"
+
+        caller = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+        # A later caller starts afresh instead of joining the cancelled run
+        async def fresh():
+            calls.append(1)
+            return "fresh"
+
+        assert await flight.do("key", fresh) == "fresh"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())